@@ -1,3 +1,30 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
-# Create your tests here.
+from clinic_backend.testing import QueryBudgetTestMixin, auth, make_kinesiologist, make_patient
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class LoginQueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    def setUp(self):
+        self.size = 0
+
+    def grow(self, size):
+        for n in range(self.size, size):
+            make_kinesiologist(f"k{n}")
+            make_patient(f"p{n}")
+        self.size = max(self.size, size)
+
+    def login(self, user):
+        user.set_password("clave-segura-123")
+        user.save()
+        auth(user)  # el primer login además crea el token
+        self.assertQueryBudget(
+            "POST", "/api/login", self.grow,
+            data={"email": user.email, "password": "clave-segura-123"}, content_type="application/json",
+        )
+
+    def test_login_kinesiologist(self):
+        self.login(make_kinesiologist("kine").user)
+
+    def test_login_patient(self):
+        self.login(make_patient("patient").user)
@@ -6,8 +6,11 @@ from rest_framework.authtoken.models import Token
 from django.contrib.auth.models import User
 from rest_framework.permissions import AllowAny
 
+from clinic_backend.query_budget import query_budget
+
 # Create your views here.
 
+@query_budget(POST=8)
 class LoginView(APIView):
     authentication_classes = []
     permission_classes = [AllowAny] 
@@ -67,7 +70,7 @@ class LoginView(APIView):
                                 "specialty": profile.specialty,
                                 "email": user.email,
                                 "phone_number": profile.phone_number,
-                                "box": profile.box,
+                                "box": profile.box_id,
                                 "image_url": profile.image_url
                             }
                         })
@@ -0,0 +1,70 @@
+"""
+Métricas de consultas SQL por alias de base de datos.
+
+Cada conexión recibe un execute_wrapper que acumula consultas y tiempo por
+alias (alias_query_metrics) y alimenta los contadores abiertos con
+count_request_queries(), que se pueden anidar (una vista puede medirse dentro
+de la medición de toda la petición).
+"""
+import contextvars
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+_active_counters = contextvars.ContextVar("active_query_counters", default=())
+
+_metrics_lock = threading.Lock()
+_alias_metrics = defaultdict(lambda: {"queries": 0, "time": 0.0})
+
+
+class _QueryMetricsWrapper:
+    def __init__(self, alias):
+        self.alias = alias
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            with _metrics_lock:
+                metrics = _alias_metrics[self.alias]
+                metrics["queries"] += 1
+                metrics["time"] += elapsed
+            for counts in _active_counters.get():
+                counts[self.alias] += 1
+
+
+def alias_query_metrics():
+    """Copia de los contadores acumulados: {alias: {"queries": n, "time": s}}."""
+    with _metrics_lock:
+        return {alias: dict(values) for alias, values in _alias_metrics.items()}
+
+
+@contextmanager
+def count_request_queries():
+    """Cuenta las consultas por alias ejecutadas dentro del bloque."""
+    counts = Counter()
+    token = _active_counters.set(_active_counters.get() + (counts,))
+    try:
+        yield counts
+    finally:
+        _active_counters.reset(token)
+
+
+def _install_metrics_wrapper(sender, connection, **kwargs):
+    if not any(isinstance(w, _QueryMetricsWrapper) for w in connection.execute_wrappers):
+        # Al fondo de la lista: connection.execute_wrapper() saca el último.
+        connection.execute_wrappers.insert(0, _QueryMetricsWrapper(connection.alias))
+
+
+connection_created.connect(_install_metrics_wrapper)
+
+# Conexiones abiertas antes de importar este módulo (p. ej. chequeos de manage.py).
+for _conn in connections.all(initialized_only=True):
+    if _conn.connection is not None:
+        _install_metrics_wrapper(sender=type(_conn), connection=_conn)
@@ -0,0 +1,148 @@
+"""
+Router primario/réplicas con lecturas "read-your-writes".
+
+Las escrituras van siempre a "default". Las lecturas van a uno de los alias de
+settings.DATABASE_REPLICAS, salvo que la petición actual esté fijada al
+primario (ReadReplicaMiddleware): peticiones de escritura y clientes que
+escribieron hace menos de REPLICA_PIN_SECONDS.
+
+Para probar localmente con dos archivos SQLite, un hook copia el primario
+sobre las réplicas después de cada escritura confirmada (DATABASE_REPLICA_SYNC).
+Las métricas de consultas por alias están en clinic_backend/db_metrics.py.
+"""
+import contextvars
+import hashlib
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.backends.signals import connection_created
+
+PRIMARY = "default"
+PIN_CACHE_PREFIX = "db-pin:"
+
+_use_primary = contextvars.ContextVar("use_primary", default=False)
+
+
+def replica_aliases():
+    return [alias for alias in getattr(settings, "DATABASE_REPLICAS", []) if alias in settings.DATABASES]
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = replica_aliases()
+        if not replicas or _use_primary.get():
+            return PRIMARY
+
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        if getattr(settings, "DATABASE_REPLICA_SYNC", False):
+            _sync_if_dirty()
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {PRIMARY, *replica_aliases()}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in replica_aliases():
+            return False
+        return None
+
+
+@contextmanager
+def use_primary(enabled=True):
+    """Fija las lecturas del contexto actual al primario."""
+    token = _use_primary.set(enabled)
+    try:
+        yield
+    finally:
+        _use_primary.reset(token)
+
+
+def _pin_key(request):
+    auth = request.META.get("HTTP_AUTHORIZATION")
+    if auth:
+        return PIN_CACHE_PREFIX + hashlib.sha1(auth.encode()).hexdigest()
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return f"{PIN_CACHE_PREFIX}user:{user.pk}"
+    return None
+
+
+def pin_to_primary(request):
+    key = _pin_key(request)
+    if key:
+        cache.set(key, True, getattr(settings, "REPLICA_PIN_SECONDS", 5))
+
+
+def is_pinned(request):
+    key = _pin_key(request)
+    return bool(key and cache.get(key))
+
+
+# --- Hook de sincronización SQLite (pruebas locales) ------------------------
+
+READ_ONLY_PREFIXES = ("SELECT", "PRAGMA", "SAVEPOINT", "RELEASE", "ROLLBACK", "BEGIN")
+
+
+def sync_sqlite_replicas(source=PRIMARY):
+    """Copia la base SQLite primaria sobre cada réplica con la API backup de sqlite3."""
+    src = connections[source]
+    src.ensure_connection()
+    for alias in replica_aliases():
+        dst = connections[alias]
+        if dst.settings_dict["NAME"] == src.settings_dict["NAME"]:
+            continue
+        dst.ensure_connection()
+        src.connection.backup(dst.connection)
+
+
+_replica_dirty = threading.Event()
+
+
+class _ReplicaSyncWrapper:
+    """
+    Marca las réplicas como desactualizadas cuando se confirma una escritura.
+    La copia se hace antes de la siguiente lectura enrutada a una réplica: copiar
+    aquí mismo bloquearía, porque el cursor de la escritura sigue abierto.
+    """
+
+    def __call__(self, execute, sql, params, many, context):
+        result = execute(sql, params, many, context)
+        if not sql.lstrip().upper().startswith(READ_ONLY_PREFIXES):
+            transaction.on_commit(_replica_dirty.set, using=PRIMARY)
+        return result
+
+
+def _sync_if_dirty():
+    if _replica_dirty.is_set():
+        _replica_dirty.clear()
+        sync_sqlite_replicas()
+
+
+def _install_sync_wrapper(sender, connection, **kwargs):
+    if (
+        connection.alias == PRIMARY
+        and getattr(settings, "DATABASE_REPLICA_SYNC", False)
+        and not any(isinstance(w, _ReplicaSyncWrapper) for w in connection.execute_wrappers)
+    ):
+        # Al fondo de la lista: connection.execute_wrapper() saca el último.
+        connection.execute_wrappers.insert(0, _ReplicaSyncWrapper())
+
+
+connection_created.connect(_install_sync_wrapper)
+
+# Conexiones abiertas antes de importar este módulo (p. ej. chequeos de manage.py).
+for _conn in connections.all(initialized_only=True):
+    if _conn.connection is not None:
+        _install_sync_wrapper(sender=type(_conn), connection=_conn)
@@ -0,0 +1,124 @@
+"""
+Header Idempotency-Key para POST/PATCH que los clientes reintentan.
+
+    @idempotent("POST")
+    class AppointmentCreateView(APIView): ...
+
+La primera petición con una clave reserva la clave en cache (cache.add), se
+ejecuta y guarda su respuesta por IDEMPOTENCY_TTL. Los reintentos con la misma
+clave devuelven esa respuesta (header Idempotent-Replayed: true) sin volver a
+ejecutar la vista: ni validación, ni escrituras, ni correos. Un duplicado que
+llega mientras la primera sigue en curso espera hasta IDEMPOTENCY_WAIT_SECONDS
+a que termine. La clave es por usuario, método y ruta; reutilizarla con otro
+cuerpo responde 422.
+
+Las respuestas 5xx y las excepciones liberan la clave para poder reintentar.
+Con varios procesos, CACHES debe ser un cache compartido.
+"""
+import functools
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+POLL_SECONDS = 0.05
+
+IN_FLIGHT = "in_flight"
+DONE = "done"
+
+
+def _cache_key(request, key):
+    user_id = getattr(request.user, "pk", None) or "anon"
+    raw = f"{user_id}:{request.method}:{request.path}:{key}"
+    return "idem:" + hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def _replay(record):
+    response = Response(record["data"], status=record["status"])
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def _conflict(message, code):
+    return Response({"status": False, "message": message}, status=code)
+
+
+def _wait_for(cache_key):
+    """Espera a que la petición en curso termine; devuelve su registro o None si liberó la clave."""
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        record = cache.get(cache_key)
+        if record is None or record["state"] == DONE:
+            return record
+        time.sleep(POLL_SECONDS)
+    return cache.get(cache_key)
+
+
+def _run(handler, view, request, args, kwargs):
+    key = request.headers.get(HEADER)
+    if not key:
+        return handler(view, request, *args, **kwargs)
+    if len(key) > MAX_KEY_LENGTH:
+        return _conflict(f"{HEADER} no puede superar {MAX_KEY_LENGTH} caracteres.", status.HTTP_400_BAD_REQUEST)
+
+    cache_key = _cache_key(request, key)
+    fingerprint = _fingerprint(request)
+    while not cache.add(cache_key, {"state": IN_FLIGHT, "fingerprint": fingerprint}, settings.IDEMPOTENCY_LOCK_SECONDS):
+        record = cache.get(cache_key)
+        if record is not None and record["fingerprint"] != fingerprint:
+            return _conflict(
+                f"La {HEADER} ya se usó con otra petición.", status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+        if record is not None and record["state"] == IN_FLIGHT:
+            record = _wait_for(cache_key)
+            if record is not None and record["state"] == IN_FLIGHT:
+                return _conflict(
+                    "Hay una petición en curso con la misma clave. Intenta más tarde.", status.HTTP_409_CONFLICT
+                )
+        if record is not None:
+            return _replay(record)
+        # La primera petición falló y liberó la clave: se vuelve a intentar reservar.
+
+    try:
+        response = handler(view, request, *args, **kwargs)
+    except Exception:
+        cache.delete(cache_key)
+        raise
+
+    if response.status_code >= 500 or not hasattr(response, "data"):
+        cache.delete(cache_key)
+    else:
+        cache.set(
+            cache_key,
+            {"state": DONE, "fingerprint": fingerprint, "status": response.status_code, "data": response.data},
+            settings.IDEMPOTENCY_TTL,
+        )
+    return response
+
+
+def idempotent(*methods):
+    """Aplica Idempotency-Key a los métodos indicados de una APIView."""
+
+    def decorator(view_class):
+        for method in methods:
+            handler = getattr(view_class, method.lower())
+
+            @functools.wraps(handler)
+            def wrapper(self, request, *args, _handler=handler, **kwargs):
+                return _run(_handler, self, request, args, kwargs)
+
+            setattr(view_class, method.lower(), wrapper)
+        return view_class
+
+    return decorator
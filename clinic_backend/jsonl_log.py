@@ -0,0 +1,44 @@
+"""Archivos JSON lines que rotan por tamaño (log de consultas lentas, trazas)."""
+import json
+import logging
+import os
+import threading
+from logging.handlers import RotatingFileHandler
+
+from django.conf import settings
+
+
+class JSONLinesLog:
+    """
+    Escribe un registro JSON por línea en la ruta de settings.<path_setting>.
+    La ruta se vuelve a leer en cada escritura (override_settings en tests);
+    sin ruta configurada no se escribe nada.
+    """
+
+    def __init__(self, name, path_setting, max_bytes=10 * 1024 * 1024, backups=5):
+        self.logger = logging.getLogger(name)
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self.path_setting = path_setting
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._handler = None
+        self._lock = threading.Lock()
+
+    def write(self, *records):
+        path = getattr(settings, self.path_setting, None)
+        if not path:
+            return
+        path = os.path.abspath(path)
+        with self._lock:
+            if self._handler is None or self._handler.baseFilename != path:
+                if self._handler is not None:
+                    self.logger.removeHandler(self._handler)
+                    self._handler.close()
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                self._handler = RotatingFileHandler(
+                    path, maxBytes=self.max_bytes, backupCount=self.backups, encoding="utf-8"
+                )
+                self.logger.addHandler(self._handler)
+            for record in records:
+                self.logger.info(json.dumps(record, ensure_ascii=False, default=str))
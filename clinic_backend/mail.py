@@ -0,0 +1,39 @@
+"""
+Backend de correo instrumentado.
+
+EMAIL_BACKEND apunta a InstrumentedEmailBackend, que delega el envío real en
+EMAIL_DELIVERY_BACKEND (SMTP por defecto) y registra latencia y fallas de cada
+send_mail() en clinic_backend.metrics (y un span "send_mail" si hay traza).
+"""
+import time
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+
+from . import metrics, tracing
+
+
+class InstrumentedEmailBackend(BaseEmailBackend):
+    def __init__(self, fail_silently=False, **kwargs):
+        super().__init__(fail_silently=fail_silently)
+        self.backend = get_connection(settings.EMAIL_DELIVERY_BACKEND, fail_silently=fail_silently, **kwargs)
+        self.backend_name = settings.EMAIL_DELIVERY_BACKEND.rsplit(".", 2)[-2]
+
+    def open(self):
+        return self.backend.open()
+
+    def close(self):
+        return self.backend.close()
+
+    def send_messages(self, email_messages):
+        email_messages = list(email_messages)
+        started = time.perf_counter()
+        try:
+            with tracing.span("send_mail", **{"mail.backend": self.backend_name, "mail.messages": len(email_messages)}):
+                sent = self.backend.send_messages(email_messages) or 0
+        except Exception:
+            metrics.observe_mail(self.backend_name, time.perf_counter() - started, 0, len(email_messages))
+            raise
+        metrics.observe_mail(self.backend_name, time.perf_counter() - started, sent, len(email_messages) - sent)
+        return sent
@@ -0,0 +1,230 @@
+"""
+Métricas de la API en formato de texto de Prometheus (GET /api/metrics).
+
+Se registran:
+  - latencia por vista (histograma) y peticiones por vista/método/status,
+  - tiempo de base de datos y consultas por petición (de DBTimeMiddleware),
+  - latencia y fallas de envío de correo (clinic_backend.mail),
+  - aciertos y fallas de cache (InstrumentedLocMemCache).
+
+Con varios workers (gunicorn, uwsgi) cada proceso acumula en memoria y vuelca
+sus valores a METRICS_MULTIPROCESS_DIR/<pid>-<inicio>.json como mucho una vez
+cada METRICS_FLUSH_SECONDS; el endpoint suma los archivos de todos los
+procesos. El directorio debe vaciarse al desplegar. Sin
+METRICS_MULTIPROCESS_DIR solo se exponen los valores del proceso que responde.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+UNRESOLVED_VIEW = "<sin vista>"
+
+
+class Metric:
+    def __init__(self, name, help_text, kind, labelnames, buckets=None):
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) if buckets else None
+
+
+METRICS = {
+    metric.name: metric
+    for metric in [
+        Metric("clinic_http_requests_total", "Peticiones HTTP por vista, método y status.",
+               "counter", ["view", "method", "status"]),
+        Metric("clinic_http_request_duration_seconds", "Latencia de las peticiones HTTP por vista.",
+               "histogram", ["view", "method"], LATENCY_BUCKETS),
+        Metric("clinic_db_time_seconds", "Tiempo de base de datos por petición.",
+               "histogram", ["view"], LATENCY_BUCKETS),
+        Metric("clinic_db_queries", "Consultas SQL por petición.",
+               "histogram", ["view"], QUERY_BUCKETS),
+        Metric("clinic_mail_send_duration_seconds", "Latencia de envío de correos.",
+               "histogram", ["backend"], LATENCY_BUCKETS),
+        Metric("clinic_mail_messages_total", "Correos enviados por resultado (sent, failed).",
+               "counter", ["backend", "result"]),
+        Metric("clinic_cache_requests_total", "Lecturas de cache por resultado (hit, miss).",
+               "counter", ["cache", "result"]),
+    ]
+}
+
+
+class Registry:
+    """Valores de un proceso: {(métrica, etiquetas): valor o [buckets..., suma, cuenta]}."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+        self._last_flush = 0.0
+        self._file = None
+
+    def inc(self, name, labels, amount=1):
+        key = (name, tuple(labels))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        self._maybe_flush()
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name].buckets
+        key = (name, tuple(labels))
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+        self._maybe_flush()
+
+    def snapshot(self):
+        with self._lock:
+            return [
+                [name, list(labels), list(value) if isinstance(value, list) else value]
+                for (name, labels), value in self._values.items()
+            ]
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    # --- Agregación multiproceso ------------------------------------------
+
+    def _maybe_flush(self):
+        if multiprocess_dir() and time.monotonic() - self._last_flush >= getattr(settings, "METRICS_FLUSH_SECONDS", 1):
+            self.flush()
+
+    def flush(self):
+        directory = multiprocess_dir()
+        if not directory:
+            return
+        self._last_flush = time.monotonic()
+        if self._file is None or self._file.parent != directory:
+            directory.mkdir(parents=True, exist_ok=True)
+            self._file = directory / f"{os.getpid()}-{int(time.time() * 1000)}.json"
+        tmp = self._file.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.snapshot()))
+        os.replace(tmp, self._file)
+
+
+def multiprocess_dir():
+    directory = getattr(settings, "METRICS_MULTIPROCESS_DIR", None)
+    return Path(directory) if directory else None
+
+
+registry = Registry()
+atexit.register(registry.flush)
+
+
+def collect():
+    """Valores agregados de todos los procesos (o solo de este)."""
+    directory = multiprocess_dir()
+    if not directory:
+        return registry.snapshot()
+
+    registry.flush()
+    merged = {}
+    for path in directory.glob("*.json"):
+        try:
+            entries = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        for name, labels, value in entries:
+            key = (name, tuple(labels))
+            if key not in merged:
+                merged[key] = value
+            elif isinstance(value, list):
+                merged[key] = [a + b for a, b in zip(merged[key], value)]
+            else:
+                merged[key] += value
+    return [[name, list(labels), value] for (name, labels), value in merged.items()]
+
+
+# --- Registro desde middleware y hooks ---------------------------------------
+
+def observe_request(view, method, status_code, seconds, db_seconds=None, db_queries=None):
+    view = view or UNRESOLVED_VIEW
+    registry.inc("clinic_http_requests_total", (view, method, str(status_code)))
+    registry.observe("clinic_http_request_duration_seconds", (view, method), seconds)
+    if db_queries is not None:
+        registry.observe("clinic_db_time_seconds", (view,), db_seconds)
+        registry.observe("clinic_db_queries", (view,), db_queries)
+
+
+def observe_mail(backend, seconds, sent, failed):
+    registry.observe("clinic_mail_send_duration_seconds", (backend,), seconds)
+    if sent:
+        registry.inc("clinic_mail_messages_total", (backend, "sent"), sent)
+    if failed:
+        registry.inc("clinic_mail_messages_total", (backend, "failed"), failed)
+
+
+def observe_cache(cache_name, hit):
+    registry.inc("clinic_cache_requests_total", (cache_name, "hit" if hit else "miss"))
+
+
+# --- Exposición ----------------------------------------------------------------
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if isinstance(value, float) and value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus():
+    by_metric = {}
+    for name, labels, value in collect():
+        if name in METRICS:
+            by_metric.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for name, metric in METRICS.items():
+        lines.append(f"# HELP {name} {metric.help}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        for labels, value in sorted(by_metric.get(name, []), key=lambda item: item[0]):
+            if metric.kind == "counter":
+                lines.append(f"{name}{_labels(metric.labelnames, labels)} {_number(value)}")
+                continue
+            # observe() ya guarda los buckets acumulados; +Inf es la cuenta total.
+            for bound, count in zip(metric.buckets + (float("inf"),), value[:-2] + [value[-1]]):
+                lines.append(f"{name}_bucket{_labels(metric.labelnames, labels, [('le', _number(bound))])} {count}")
+            lines.append(f"{name}_sum{_labels(metric.labelnames, labels)} {_number(value[-2])}")
+            lines.append(f"{name}_count{_labels(metric.labelnames, labels)} {value[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+class InstrumentedLocMemCache(LocMemCache):
+    """LocMemCache que cuenta aciertos y fallas (get_many() también pasa por get())."""
+
+    _missing = object()
+
+    def __init__(self, name, params):
+        super().__init__(name, params)
+        self.metrics_name = params.get("OPTIONS", {}).get("METRICS_NAME", name or "default")
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, self._missing, version)
+        observe_cache(self.metrics_name, value is not self._missing)
+        return default if value is self._missing else value
@@ -0,0 +1,251 @@
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import JsonResponse
+from rest_framework import exceptions, status
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.permissions import SAFE_METHODS
+
+from .db_metrics import count_request_queries
+from . import metrics
+from .db_router import is_pinned, pin_to_primary, replica_aliases, use_primary
+from .profiling import profile_request, read_token
+from .query_budget import QueryBudgetExceeded, budget_for, count_queries, view_name
+from .slow_queries import DBTimeBudgetExceeded, begin_request, end_request
+from .tracing import end_trace, start_trace
+
+budget_logger = logging.getLogger("clinic_backend.query_budget")
+
+
+class MetricsMiddleware:
+    """
+    Registra latencia, status, tiempo de base de datos y consultas de cada
+    petición por vista (ver clinic_backend/metrics.py). Va antes que el resto
+    de los middlewares propios para medir la petición completa.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request._metrics_view = None
+        started = time.perf_counter()
+        response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        db_time = getattr(request, "_db_time", None)
+        metrics.observe_request(
+            request._metrics_view,
+            request.method,
+            response.status_code,
+            elapsed,
+            db_seconds=db_time.seconds if db_time else None,
+            db_queries=db_time.queries if db_time else None,
+        )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics_view = view_name(view_func)
+        return None
+
+
+class TracingMiddleware:
+    """
+    Abre el span raíz de cada petición (ver clinic_backend/tracing.py) y
+    responde el id de la traza en X-Trace-Id. Sin TRACING_ENABLED no se instala.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, "TRACING_ENABLED", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        root, token = start_trace(
+            f"{request.method} {request.path}",
+            request.META.get("HTTP_TRACEPARENT"),
+            **{"http.method": request.method, "http.target": request.get_full_path()},
+        )
+        if root is None:
+            return self.get_response(request)
+
+        request._trace_root = root
+        try:
+            response = self.get_response(request)
+            root.set(**{"http.status_code": response.status_code})
+        except Exception as exc:
+            root.error = f"{type(exc).__name__}: {exc}"
+            raise
+        finally:
+            end_trace(root, token)
+
+        response["X-Trace-Id"] = root.trace_id
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        root = getattr(request, "_trace_root", None)
+        if root is not None:
+            name = view_name(view_func)
+            root.name = f"{request.method} {name}"
+            root.set(view=name)
+        return None
+
+
+class ReadReplicaMiddleware:
+    """
+    Decide si las lecturas de la petición van a las réplicas o al primario.
+    Las escrituras exitosas fijan al cliente al primario por REPLICA_PIN_SECONDS,
+    así una cita recién reservada siempre aparece en su siguiente lectura.
+    Agrega el header X-DB-Queries con las consultas por alias.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        write = request.method not in SAFE_METHODS
+        primary = write or (bool(replica_aliases()) and is_pinned(request))
+
+        with use_primary(primary), count_request_queries() as counts:
+            response = self.get_response(request)
+
+        if write and replica_aliases() and response.status_code < 400:
+            pin_to_primary(request)
+
+        if counts:
+            response["X-DB-Queries"] = ", ".join(
+                f"{alias}={n}" for alias, n in sorted(counts.items())
+            )
+        return response
+
+
+class QueryBudgetMiddleware:
+    """
+    Registra un warning cuando una petición supera el query_budget de su vista.
+    Con QUERY_BUDGET_STRICT además levanta QueryBudgetExceeded.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request._query_budget = None
+        with count_queries() as counter:
+            response = self.get_response(request)
+
+        if request._query_budget is not None:
+            name, budget = request._query_budget
+            total = counter.total
+            if total > budget:
+                budget_logger.warning(
+                    "Presupuesto de consultas excedido: %s %s (%s) usó %d consultas, presupuesto %d",
+                    request.method, request.path, name, total, budget,
+                )
+                if settings.QUERY_BUDGET_STRICT:
+                    raise QueryBudgetExceeded(name, request.method, budget, total)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        budget = budget_for(view_func, request.method)
+        if budget is not None:
+            request._query_budget = (view_name(view_func), budget)
+        return None
+
+
+class DBTimeMiddleware:
+    """
+    Mide el tiempo de base de datos de la petición (header X-DB-Time) para el
+    log de consultas lentas y corta la petición con 503 si supera
+    DB_TIME_BUDGET_MS (ver clinic_backend/slow_queries.py).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state, token = begin_request(request)
+        request._db_time = state
+        try:
+            response = self.get_response(request)
+        finally:
+            end_request(token)
+
+        response["X-DB-Time"] = f"{state.ms:.1f}ms"
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._db_time.view = view_name(view_func)
+        return None
+
+    def process_exception(self, request, exception):
+        if not isinstance(exception, DBTimeBudgetExceeded):
+            return None
+        return JsonResponse(
+            {
+                "status": False,
+                "message": (
+                    "La petición superó el tiempo máximo de base de datos "
+                    f"({exception.budget_ms} ms). Intente nuevamente o acote la consulta."
+                ),
+            },
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+
+
+class ProfilingMiddleware:
+    """
+    Perfila con cProfile las peticiones marcadas (header X-Profile firmado o
+    ?profile= de un usuario staff) y 1 de cada PROFILING_SAMPLE_RATE. Ver
+    clinic_backend/profiling.py. Sin PROFILING_ENABLED no se instala.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, "PROFILING_ENABLED", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, "PROFILING_SAMPLE_RATE", 0)
+
+    def __call__(self, request):
+        trigger, mode = self._trigger(request)
+        if trigger is None:
+            return self.get_response(request)
+
+        response, profile_id = profile_request(self.get_response, request, trigger, memory=mode == "memory")
+        if profile_id and trigger != "sample":
+            response["X-Profile-Id"] = profile_id
+        return response
+
+    def _trigger(self, request):
+        header = request.META.get("HTTP_X_PROFILE")
+        if header:
+            mode = read_token(header)
+            if mode:
+                return "header", mode
+
+        flag = request.GET.get("profile")
+        if flag and self._is_staff(request):
+            return "staff", "memory" if flag == "memory" else "cpu"
+
+        if self.sample_rate and random.randrange(self.sample_rate) == 0:
+            return "sample", "cpu"
+        return None, None
+
+    def _is_staff(self, request):
+        user = getattr(request, "user", None)
+        if user is not None and user.is_authenticated:
+            return user.is_staff
+
+        # Las vistas usan TokenAuthentication: el usuario aún no está resuelto aquí.
+        parts = request.META.get("HTTP_AUTHORIZATION", "").split()
+        if len(parts) != 2 or parts[0] != "Token":
+            return False
+        try:
+            user, token = TokenAuthentication().authenticate_credentials(parts[1])
+        except exceptions.AuthenticationFailed:
+            return False
+        # TracedTokenAuthentication lo reutiliza: la vista no vuelve a consultar el token.
+        request._authenticated_token = (parts[1], (user, token))
+        return user.is_staff
@@ -0,0 +1,144 @@
+"""
+Perfilado bajo demanda de peticiones individuales.
+
+Con PROFILING_ENABLED, ProfilingMiddleware ejecuta bajo cProfile (y, en modo
+"memory", con tracemalloc) las peticiones que traen:
+
+  - el header X-Profile con un token firmado (manage.py request_profiles token),
+  - ?profile=1 o ?profile=memory de un usuario staff,
+  - o que caen en el muestreo de 1 cada PROFILING_SAMPLE_RATE.
+
+Cada perfil queda en PROFILING_DIR como <id>.prof (formato pstats) más <id>.json
+con los datos de la petición. Se perfila una petición a la vez: el resto sigue
+sin perfilar. Sin PROFILING_ENABLED el middleware no se instala.
+"""
+import cProfile
+import json
+import threading
+import time
+import tracemalloc
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+SIGNING_SALT = "clinic_backend.profiling"
+MODES = ("cpu", "memory")
+MEMORY_TOP_LINES = 15
+
+_lock = threading.Lock()
+
+
+def make_token(mode="cpu"):
+    """Valor para el header X-Profile; vence después de PROFILING_TOKEN_MAX_AGE."""
+    return signing.TimestampSigner(salt=SIGNING_SALT).sign(mode)
+
+
+def read_token(value):
+    """Modo ("cpu" o "memory") de un token válido, o None."""
+    try:
+        mode = signing.TimestampSigner(salt=SIGNING_SALT).unsign(
+            value, max_age=getattr(settings, "PROFILING_TOKEN_MAX_AGE", 3600)
+        )
+    except signing.BadSignature:
+        return None
+    return mode if mode in MODES else None
+
+
+def profile_dir():
+    return Path(settings.PROFILING_DIR)
+
+
+def profile_request(get_response, request, trigger, memory=False):
+    """
+    Ejecuta la petición bajo cProfile y guarda el perfil. Devuelve
+    (response, id del perfil); el id es None si otro perfil estaba en curso.
+    """
+    if not _lock.acquire(blocking=False):
+        return get_response(request), None
+
+    try:
+        traced_before = tracemalloc.is_tracing()
+        if memory and not traced_before:
+            tracemalloc.start()
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            response = get_response(request)
+        finally:
+            profiler.disable()
+            duration = time.perf_counter() - started
+            snapshot = peak = None
+            if memory:
+                snapshot = tracemalloc.take_snapshot()
+                peak = tracemalloc.get_traced_memory()[1]
+                if not traced_before:
+                    tracemalloc.stop()
+    finally:
+        _lock.release()
+
+    meta = {
+        "method": request.method,
+        "path": request.get_full_path(),
+        "status": response.status_code,
+        "duration_ms": round(duration * 1000, 2),
+        "trigger": trigger,
+    }
+    if snapshot is not None:
+        meta["memory"] = {"peak_kb": round(peak / 1024, 1), "top": _memory_top(snapshot)}
+    return response, save_profile(profiler, meta)
+
+
+def _memory_top(snapshot):
+    stats = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ]).statistics("lineno")
+    return [
+        {
+            "where": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+            "size_kb": round(stat.size / 1024, 1),
+            "count": stat.count,
+        }
+        for stat in stats[:MEMORY_TOP_LINES]
+    ]
+
+
+def save_profile(profiler, meta):
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    created = timezone.now()
+    profile_id = f"{created:%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}"
+
+    profiler.dump_stats(directory / f"{profile_id}.prof")
+    meta = {"id": profile_id, "created": created.isoformat(), **meta}
+    (directory / f"{profile_id}.json").write_text(json.dumps(meta, ensure_ascii=False, indent=2))
+    _prune(directory)
+    return profile_id
+
+
+def _prune(directory):
+    """Conserva solo los PROFILING_MAX_FILES perfiles más recientes."""
+    keep = getattr(settings, "PROFILING_MAX_FILES", 200)
+    for meta_file in sorted(directory.glob("*.json"), reverse=True)[keep:]:
+        meta_file.unlink(missing_ok=True)
+        meta_file.with_suffix(".prof").unlink(missing_ok=True)
+
+
+def list_profiles():
+    """Metadatos de los perfiles guardados, del más reciente al más antiguo."""
+    directory = profile_dir()
+    if not directory.exists():
+        return []
+    return [json.loads(path.read_text()) for path in sorted(directory.glob("*.json"), reverse=True)]
+
+
+def load_profile(profile_id):
+    """(metadatos, ruta del .prof) de un perfil, o None si no existe."""
+    meta_file = profile_dir() / f"{profile_id}.json"
+    if not meta_file.exists():
+        return None
+    return json.loads(meta_file.read_text()), meta_file.with_suffix(".prof")
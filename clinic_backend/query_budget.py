@@ -0,0 +1,88 @@
+"""
+Presupuestos de consultas SQL por vista.
+
+    @query_budget(4)                  # cualquier método
+    @query_budget(GET=4, POST=9)      # por método
+
+El decorador se aplica sobre la clase APIView o sobre la función ya decorada
+con @api_view. QueryBudgetMiddleware cuenta las consultas de la petición con
+count_queries() y registra en el log las que se pasan de presupuesto (con
+QUERY_BUDGET_STRICT además las corta con QueryBudgetExceeded, como hace la
+suite de tests). Los tests de cada app verifican además que el número de
+consultas no crezca con el volumen de datos (ver clinic_backend/testing.py).
+"""
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+
+QUERY_BUDGETS = {}
+
+ANY_METHOD = "*"
+
+
+class QueryBudgetExceeded(Exception):
+    def __init__(self, view, method, budget, used):
+        self.view = view
+        self.method = method
+        self.budget = budget
+        self.used = used
+        super().__init__(
+            f"Presupuesto de consultas excedido: {method} {view} usó {used} consultas, presupuesto {budget}"
+        )
+
+
+def query_budget(default=None, **methods):
+    budgets = {method.upper(): limit for method, limit in methods.items()}
+    if default is not None:
+        budgets[ANY_METHOD] = default
+
+    def decorator(view):
+        # @api_view devuelve una función con la clase generada en .cls
+        target = getattr(view, "cls", view)
+        target.query_budget = budgets
+        QUERY_BUDGETS[f"{target.__module__}.{target.__name__}"] = budgets
+        return view
+
+    return decorator
+
+
+def view_budgets(view_func):
+    """Presupuestos declarados para el callback resuelto de una URL."""
+    for candidate in (getattr(view_func, "cls", None), getattr(view_func, "view_class", None), view_func):
+        budgets = getattr(candidate, "query_budget", None)
+        if budgets is not None:
+            return budgets
+    return None
+
+
+def budget_for(view_func, method):
+    budgets = view_budgets(view_func)
+    if budgets is None:
+        return None
+    return budgets.get(method.upper(), budgets.get(ANY_METHOD))
+
+
+def view_name(view_func):
+    target = getattr(view_func, "cls", None) or getattr(view_func, "view_class", None) or view_func
+    return f"{target.__module__}.{target.__name__}"
+
+
+class QueryCounter:
+    """Consultas ejecutadas dentro de count_queries(), sobre todos los alias."""
+
+    def __init__(self):
+        self.total = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.total += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def count_queries():
+    """Cuenta con connection.execute_wrapper() las consultas del bloque en todos los alias."""
+    counter = QueryCounter()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(counter))
+        yield counter
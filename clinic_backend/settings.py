@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 
+import os
 from pathlib import Path
 from datetime import timedelta
 
@@ -49,6 +50,11 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'clinic_backend.middleware.MetricsMiddleware',
+    'clinic_backend.middleware.TracingMiddleware',
+    'clinic_backend.middleware.ReadReplicaMiddleware',
+    'clinic_backend.middleware.QueryBudgetMiddleware',
+    'clinic_backend.middleware.DBTimeMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware', 
     'django.middleware.common.CommonMiddleware',
@@ -56,11 +62,12 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'clinic_backend.middleware.ProfilingMiddleware',
 ]
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework.authentication.TokenAuthentication",
+        "clinic_backend.tracing.TracedTokenAuthentication",
     ],
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
@@ -98,6 +105,113 @@ DATABASES = {
     }
 }
 
+# Réplicas de solo lectura (ver clinic_backend/db_router.py). Con DB_READ_REPLICA=1
+# se usa un segundo archivo SQLite que se copia desde el primario después de
+# cada escritura confirmada.
+DATABASE_REPLICAS = []
+DATABASE_REPLICA_SYNC = False
+
+if os.environ.get('DB_READ_REPLICA'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db_replica.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS = ['replica']
+    DATABASE_REPLICA_SYNC = True
+
+DATABASE_ROUTERS = ['clinic_backend.db_router.PrimaryReplicaRouter']
+
+# Segundos que un cliente lee del primario después de escribir. Con varios
+# procesos, CACHES debe apuntar a un cache compartido.
+REPLICA_PIN_SECONDS = 5
+
+# Consultas más lentas que SLOW_QUERY_THRESHOLD_MS se escriben en SLOW_QUERY_LOG
+# (JSON lines, rota por tamaño). DB_TIME_BUDGET_MS corta con 503 las peticiones
+# que acumulan más tiempo de base de datos; None lo desactiva.
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 200))
+SLOW_QUERY_LOG = os.environ.get('SLOW_QUERY_LOG', BASE_DIR / 'logs' / 'slow_queries.jsonl')
+SLOW_QUERY_LOG_MAX_BYTES = 10 * 1024 * 1024
+SLOW_QUERY_LOG_BACKUPS = 5
+DB_TIME_BUDGET_MS = float(os.environ['DB_TIME_BUDGET_MS']) if os.environ.get('DB_TIME_BUDGET_MS') else None
+
+# Con QUERY_BUDGET_STRICT una petición que supera el @query_budget de su vista
+# falla con QueryBudgetExceeded en vez de sólo registrarse en el log. La suite
+# de tests lo activa siempre (ver clinic_backend/testing.py).
+QUERY_BUDGET_STRICT = bool(os.environ.get('QUERY_BUDGET_STRICT'))
+
+TEST_RUNNER = 'clinic_backend.testing.ClinicTestRunner'
+
+# Perfilado bajo demanda (ver clinic_backend/profiling.py). Desactivado, el
+# middleware ni siquiera se instala. PROFILING_SAMPLE_RATE=N perfila 1 de cada
+# N peticiones; 0 desactiva el muestreo.
+PROFILING_ENABLED = bool(os.environ.get('PROFILING_ENABLED'))
+PROFILING_SAMPLE_RATE = int(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+PROFILING_DIR = os.environ.get('PROFILING_DIR', BASE_DIR / 'profiles')
+PROFILING_MAX_FILES = 200
+PROFILING_TOKEN_MAX_AGE = 3600
+
+# Métricas Prometheus en /api/metrics (ver clinic_backend/metrics.py): acceso
+# con usuario staff o "Authorization: Bearer <METRICS_TOKEN>". Con varios
+# workers, METRICS_MULTIPROCESS_DIR debe ser un directorio compartido.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+METRICS_MULTIPROCESS_DIR = os.environ.get('METRICS_MULTIPROCESS_DIR')
+METRICS_FLUSH_SECONDS = 1
+
+# Trazas por petición en JSON lines (ver clinic_backend/tracing.py).
+TRACING_ENABLED = bool(os.environ.get('TRACING_ENABLED'))
+TRACING_SAMPLE_RATE = float(os.environ.get('TRACING_SAMPLE_RATE', 1.0))
+TRACING_LOG = os.environ.get('TRACING_LOG', BASE_DIR / 'logs' / 'traces.jsonl')
+
+# Días después de los cuales archive_appointments mueve las citas realizadas
+# o canceladas a ArchivedAppointment.
+APPOINTMENT_ARCHIVE_AFTER_DAYS = 365
+
+# close_stale_appointments: estado final de las citas pasadas que siguen
+# abiertas (origen -> destino) tras STALE_APPOINTMENT_GRACE_DAYS días. Cada
+# ejecución deja sus totales en STALE_APPOINTMENTS_LOG.
+STALE_APPOINTMENT_TARGETS = {
+    'confirmed': 'completed',
+    'pending': 'no_show',
+}
+STALE_APPOINTMENT_GRACE_DAYS = int(os.environ.get('STALE_APPOINTMENT_GRACE_DAYS', 1))
+STALE_APPOINTMENTS_LOG = os.environ.get('STALE_APPOINTMENTS_LOG', BASE_DIR / 'logs' / 'stale_appointments.jsonl')
+
+# Recordatorios por correo antes de cada cita (nivel -> anticipación). Los
+# envía `manage.py send_reminders` en lotes de REMINDER_BATCH_SIZE.
+REMINDER_TIERS = {
+    '24h': timedelta(hours=24),
+    '2h': timedelta(hours=2),
+}
+REMINDER_BATCH_SIZE = 100
+
+# Segundos que un paciente retiene un horario mientras completa la reserva
+# (ver scheduling/holds.py).
+SLOT_HOLD_SECONDS = 5 * 60
+
+# Retención que recibe el paciente en lista de espera cuando se libera una
+# hora: más larga, porque se entera por correo.
+WAITLIST_HOLD_SECONDS = int(os.environ.get("WAITLIST_HOLD_SECONDS", 2 * 60 * 60))
+
+# Idempotency-Key (clinic_backend/idempotency.py): cuánto se guarda la
+# respuesta, cuánto dura la reserva de una petición en curso y cuánto espera
+# un duplicado a que esa petición termine.
+IDEMPOTENCY_TTL = 24 * 60 * 60
+IDEMPOTENCY_LOCK_SECONDS = 30
+IDEMPOTENCY_WAIT_SECONDS = 10
+
+# Feeds iCalendar (/api/calendar/<secret>.ics): ventana de días hacia atrás y
+# hacia adelante, y cuánto se guarda en cache cada versión generada.
+ICAL_PAST_DAYS = int(os.environ.get('ICAL_PAST_DAYS', 30))
+ICAL_FUTURE_DAYS = int(os.environ.get('ICAL_FUTURE_DAYS', 180))
+ICAL_CACHE_SECONDS = 24 * 60 * 60
+
+CACHES = {
+    'default': {
+        'BACKEND': 'clinic_backend.metrics.InstrumentedLocMemCache',
+    }
+}
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
 }
@@ -145,9 +259,13 @@ from corsheaders.defaults import default_headers
 
 CORS_ALLOW_HEADERS = list(default_headers) + [
     "ngrok-skip-browser-warning",
+    "idempotency-key",
 ]
 
-EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
+# Para benchmarks/cargas locales: DJANGO_EMAIL_BACKEND=django.core.mail.backends.locmem.EmailBackend
+# InstrumentedEmailBackend mide cada envío y delega en EMAIL_DELIVERY_BACKEND.
+EMAIL_BACKEND = "clinic_backend.mail.InstrumentedEmailBackend"
+EMAIL_DELIVERY_BACKEND = os.environ.get("DJANGO_EMAIL_BACKEND", "django.core.mail.backends.smtp.EmailBackend")
 EMAIL_HOST = "smtp.gmail.com"
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
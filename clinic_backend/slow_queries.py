@@ -0,0 +1,155 @@
+"""
+Log de consultas lentas y presupuesto de tiempo de base de datos por petición.
+
+Cada conexión recibe un execute_wrapper que mide la consulta. Las que superan
+SLOW_QUERY_THRESHOLD_MS se escriben como una línea JSON (fingerprint del SQL,
+duración, vista, extracto del stack) en SLOW_QUERY_LOG, que rota por tamaño.
+
+DBTimeMiddleware abre la medición de cada petición: agrega el header X-DB-Time
+y, si DB_TIME_BUDGET_MS está definido, una vez agotado el presupuesto la
+siguiente consulta lanza DBTimeBudgetExceeded y la petición termina con 503.
+"""
+import contextvars
+import hashlib
+import os
+import re
+import time
+import traceback
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils import timezone
+
+from .jsonl_log import JSONLinesLog
+
+_request_db = contextvars.ContextVar("request_db_time", default=None)
+
+STACK_FRAMES = 6
+MAX_SQL_LENGTH = 2000
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_LIST_RE = re.compile(r"\((?:\s*\?\s*,)+\s*\?\s*\)")
+_SPACE_RE = re.compile(r"\s+")
+
+# Middleware y execute_wrappers: aparecen en todos los stacks y no aportan.
+_IGNORED_FRAMES = {
+    os.path.join("clinic_backend", name)
+    for name in ("middleware.py", "slow_queries.py", "db_metrics.py", "db_router.py")
+}
+
+
+class DBTimeBudgetExceeded(Exception):
+    def __init__(self, budget_ms, spent_ms):
+        self.budget_ms = budget_ms
+        self.spent_ms = spent_ms
+        super().__init__(
+            f"Presupuesto de tiempo de base de datos agotado: {spent_ms:.0f} ms de {budget_ms} ms"
+        )
+
+
+class RequestDBTime:
+    """Tiempo de base de datos acumulado por la petición en curso."""
+
+    def __init__(self, method="", path="", budget_ms=None):
+        self.method = method
+        self.path = path
+        self.view = None
+        self.budget_ms = budget_ms
+        self.queries = 0
+        self.seconds = 0.0
+
+    @property
+    def ms(self):
+        return self.seconds * 1000
+
+
+def begin_request(request):
+    """Abre la medición de la petición; devuelve el token para end_request()."""
+    state = RequestDBTime(request.method, request.path, getattr(settings, "DB_TIME_BUDGET_MS", None))
+    return state, _request_db.set(state)
+
+
+def end_request(token):
+    _request_db.reset(token)
+
+
+def fingerprint(sql):
+    """SQL sin literales ni listas de parámetros: agrupa consultas equivalentes."""
+    sql = _STRING_RE.sub("?", sql)
+    sql = _NUMBER_RE.sub("?", sql.replace("%s", "?"))
+    sql = _LIST_RE.sub("(...)", sql)
+    return _SPACE_RE.sub(" ", sql).strip()
+
+
+def _stack_excerpt():
+    """Últimos frames del proyecto (sin Django ni dependencias) que llevaron a la consulta."""
+    base = str(settings.BASE_DIR)
+    frames = []
+    for frame in traceback.extract_stack():
+        if not frame.filename.startswith(base) or "site-packages" in frame.filename:
+            continue
+        filename = os.path.relpath(frame.filename, base)
+        if filename not in _IGNORED_FRAMES:
+            frames.append(f"{filename}:{frame.lineno} in {frame.name}")
+    return frames[-STACK_FRAMES:]
+
+
+_log = JSONLinesLog(
+    "clinic_backend.slow_queries",
+    "SLOW_QUERY_LOG",
+    max_bytes=getattr(settings, "SLOW_QUERY_LOG_MAX_BYTES", 10 * 1024 * 1024),
+    backups=getattr(settings, "SLOW_QUERY_LOG_BACKUPS", 5),
+)
+
+
+def _log_slow_query(alias, sql, elapsed, state):
+    normalized = fingerprint(sql)
+    _log.write({
+        "ts": timezone.now().isoformat(),
+        "alias": alias,
+        "duration_ms": round(elapsed * 1000, 2),
+        "fingerprint": hashlib.sha1(normalized.encode()).hexdigest()[:12],
+        "sql": normalized[:MAX_SQL_LENGTH],
+        "view": state.view if state else None,
+        "method": state.method if state else None,
+        "path": state.path if state else None,
+        "stack": _stack_excerpt(),
+    })
+
+
+class _SlowQueryWrapper:
+    def __init__(self, alias):
+        self.alias = alias
+
+    def __call__(self, execute, sql, params, many, context):
+        state = _request_db.get()
+        if state is not None and state.budget_ms is not None and state.ms > state.budget_ms:
+            raise DBTimeBudgetExceeded(state.budget_ms, state.ms)
+
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            if state is not None:
+                state.queries += 1
+                state.seconds += elapsed
+            threshold = getattr(settings, "SLOW_QUERY_THRESHOLD_MS", None)
+            if threshold is not None and elapsed * 1000 >= threshold:
+                _log_slow_query(self.alias, sql, elapsed, state)
+
+
+def _install_slow_query_wrapper(sender, connection, **kwargs):
+    if not any(isinstance(w, _SlowQueryWrapper) for w in connection.execute_wrappers):
+        # Al fondo de la lista: connection.execute_wrapper() saca el último.
+        connection.execute_wrappers.insert(0, _SlowQueryWrapper(connection.alias))
+
+
+connection_created.connect(_install_slow_query_wrapper)
+
+# Conexiones abiertas antes de importar este módulo (p. ej. chequeos de manage.py).
+for _conn in connections.all(initialized_only=True):
+    if _conn.connection is not None:
+        _install_slow_query_wrapper(sender=type(_conn), connection=_conn)
@@ -0,0 +1,129 @@
+"""
+Sparse fieldsets para los endpoints de lectura: ?fields=id,date,start_time,status
+
+Los serializers que heredan de SparseFieldsetMixin aceptan `fields=[...]` y
+descartan el resto de sus campos. prune_queryset() usa esos mismos campos para
+decidir .only() y select_related(), de modo que los joins que no se van a
+serializar (p. ej. patient_name__user) nunca se ejecutan.
+
+Cada campo se traduce a rutas ORM a partir de su `source`; los campos que no
+corresponden a una columna (SerializerMethodField, get_FOO_display, ...) se
+declaran en Meta.field_sources.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+
+FIELDS_PARAM = "fields"
+
+
+class SparseFieldsetMixin:
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop("fields", None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+def requested_fields(request, serializer_class):
+    """Lee ?fields= y valida los nombres contra el serializer. None = todos."""
+    raw = request.query_params.get(FIELDS_PARAM)
+    if not raw:
+        return None
+
+    fields = [f.strip() for f in raw.split(",") if f.strip()]
+    available = set(serializer_class().fields)
+    unknown = [f for f in fields if f not in available]
+    if unknown:
+        raise serializers.ValidationError(
+            {FIELDS_PARAM: f"Campos inválidos: {', '.join(unknown)}"}
+        )
+    return fields
+
+
+def _resolve_path(model, path):
+    """
+    Valida `path` contra el modelo. Devuelve (ruta normalizada, ruta para
+    select_related o None) o None si no es una columna del modelo.
+    """
+    parts = path.split("__")
+    names = []
+    current = model
+    for i, part in enumerate(parts):
+        try:
+            field = current._meta.get_field(part)
+        except FieldDoesNotExist:
+            return None
+        names.append(field.name)
+        if i < len(parts) - 1:
+            if not (field.many_to_one or field.one_to_one) or field.related_model is None:
+                return None
+            current = field.related_model
+    select = "__".join(names[:-1]) or None
+    return "__".join(names), select
+
+
+def _source_paths(serializer, name):
+    """Rutas ORM que necesita el campo `name`, o None si no se pueden deducir."""
+    overrides = getattr(getattr(serializer, "Meta", None), "field_sources", {})
+    if name in overrides:
+        return list(overrides[name])
+
+    field = serializer.fields[name]
+    if isinstance(field, serializers.SerializerMethodField) or field.source == "*":
+        return None
+
+    source = field.source.replace(".", "__")
+    if isinstance(field, serializers.BaseSerializer):
+        paths = []
+        for sub in field.fields:
+            sub_paths = _source_paths(field, sub)
+            if sub_paths is None:
+                return None
+            paths.extend(f"{source}__{p}" for p in sub_paths)
+        return paths
+    return [source]
+
+
+def field_paths(model, serializer_class, fields):
+    """
+    (rutas para only(), rutas para select_related()) que necesitan los campos
+    pedidos, o None si algún campo no se puede traducir a columnas.
+    """
+    serializer = serializer_class(fields=fields)
+    only = {model._meta.pk.name}
+    select = set()
+    for name in serializer.fields:
+        paths = _source_paths(serializer, name)
+        if paths is None:
+            # Campo calculado sin field_sources: no es seguro diferir columnas.
+            return None
+        for path in paths:
+            resolved = _resolve_path(model, path)
+            if resolved is None:
+                return None
+            only_path, select_path = resolved
+            only.add(only_path)
+            if select_path:
+                select.add(select_path)
+    return only, select
+
+
+def prune_queryset(queryset, serializer_class, fields=None):
+    """
+    Ajusta select_related()/only() a los campos pedidos. Sin `fields`
+    devuelve el queryset tal cual.
+    """
+    if fields is None:
+        return queryset
+
+    paths = field_paths(queryset.model, serializer_class, fields)
+    if paths is None:
+        return queryset
+    only, select = paths
+
+    queryset = queryset.select_related(None)
+    if select:
+        # select_related() sin argumentos seguiría todas las FKs.
+        queryset = queryset.select_related(*sorted(select))
+    return queryset.only(*sorted(only))
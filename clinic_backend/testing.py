@@ -0,0 +1,103 @@
+"""
+Soporte para la suite de tests (no se importa desde código de producción).
+
+ClinicTestRunner (settings.TEST_RUNNER) activa QUERY_BUDGET_STRICT: cualquier
+petición de los tests que supere el @query_budget de su vista falla con
+QueryBudgetExceeded en vez de dejar sólo un warning en la salida.
+QueryBudgetTestMixin mide además que las consultas no crezcan con los datos.
+make_kinesiologist, make_patient y auth son los fixtures que comparten los
+tests de todas las apps.
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from rest_framework.authtoken.models import Token
+
+from doctors.models import Box, Kinesiologist
+from users.models import Patient
+
+from .query_budget import budget_for, view_name
+
+
+def make_kinesiologist(key):
+    Box.objects.get_or_create(name="1")
+    user = User.objects.create(username=f"{key}@example.com", email=f"{key}@example.com", first_name=key)
+    return Kinesiologist.objects.create(
+        user=user, name=key, rut=f"rut-{key}", specialty="General",
+        phone_number="912345678", box_id="1", image_url="",
+    )
+
+
+def make_patient(key):
+    user = User.objects.create(username=f"{key}@example.com", email=f"{key}@example.com", first_name=key)
+    return Patient.objects.create(user=user, name=key, rut=f"rut-{key}", diagnostic="", phone_number="912345678")
+
+
+def auth(user):
+    token, _ = Token.objects.get_or_create(user=user)
+    return {"HTTP_AUTHORIZATION": f"Token {token.key}"}
+
+
+class ClinicTestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        settings.QUERY_BUDGET_STRICT = True
+
+
+class _CaptureAllQueries:
+    """CaptureQueriesContext sobre todos los alias configurados."""
+
+    def __init__(self):
+        self.contexts = [CaptureQueriesContext(connections[alias]) for alias in connections]
+
+    def __enter__(self):
+        for ctx in self.contexts:
+            ctx.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        for ctx in self.contexts:
+            ctx.__exit__(*exc)
+
+    @property
+    def captured_queries(self):
+        return [q for ctx in self.contexts for q in ctx.captured_queries]
+
+    def __len__(self):
+        return sum(len(ctx) for ctx in self.contexts)
+
+
+class QueryBudgetTestMixin:
+    """
+    Para TestCase: mide una petición con cada tamaño de datos y falla si se
+    pasa del presupuesto de la vista o si las consultas crecen con los datos.
+    """
+
+    def assertQueryBudget(self, method, path, grow, sizes=(1, 10, 40), **request_kwargs):
+        view_func = resolve(path.split("?")[0]).func
+        budget = budget_for(view_func, method)
+        self.assertIsNotNone(budget, f"{view_name(view_func)} no declara query_budget para {method}")
+
+        counts = []
+        for size in sizes:
+            grow(size)
+            with _CaptureAllQueries() as ctx:
+                response = getattr(self.client, method.lower())(path, **request_kwargs)
+                # Una respuesta en streaming consulta mientras se consume.
+                content = b"".join(response.streaming_content) if response.streaming else response.content
+            self.assertLess(response.status_code, 500, content[:500])
+            counts.append(len(ctx))
+            self.assertLessEqual(
+                len(ctx), budget,
+                f"{method} {path}: {len(ctx)} consultas, presupuesto {budget}:\n"
+                + "\n".join(q["sql"] for q in ctx.captured_queries),
+            )
+
+        self.assertEqual(
+            len(set(counts)), 1,
+            f"{method} {path}: las consultas crecen con los datos {dict(zip(sizes, counts))} (N+1)",
+        )
+        return counts[0]
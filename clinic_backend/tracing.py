@@ -0,0 +1,173 @@
+"""
+Trazas por petición exportadas como JSON lines (TRACING_LOG).
+
+Con TRACING_ENABLED, TracingMiddleware abre un span raíz por petición (acepta
+un header W3C `traceparent` entrante y responde el id en X-Trace-Id). Dentro
+de él se crean spans hijos:
+
+  - "auth.token"   autenticación DRF (TracedTokenAuthentication),
+  - "db.query"     cada consulta SQL (execute_wrapper),
+  - "send_mail"    cada envío (clinic_backend.mail),
+  - y los que el código abre con `with span("nombre", atributo=valor):`.
+
+Los spans de una traza se escriben juntos al terminar la petición, uno por
+línea. `manage.py traces` los lista, los muestra como árbol y los convierte
+al formato de Chrome (chrome://tracing, ui.perfetto.dev).
+"""
+import contextvars
+import random
+import re
+import secrets
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils import timezone
+from rest_framework.authentication import TokenAuthentication
+
+from .jsonl_log import JSONLinesLog
+from .slow_queries import fingerprint
+
+MAX_STATEMENT_LENGTH = 500
+
+_TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+_current = contextvars.ContextVar("current_span", default=None)
+
+_log = JSONLinesLog("clinic_backend.tracing", "TRACING_LOG")
+
+
+class Span:
+    def __init__(self, name, trace_id, parent_id=None, attributes=None, trace=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.error = None
+        self.started_at = timezone.now()
+        self._started = time.perf_counter()
+        self.duration = None
+        # Spans terminados de la traza; el raíz los exporta todos juntos.
+        self.trace = trace if trace is not None else []
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._started
+        self.trace.append(self)
+
+    def as_record(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.started_at.isoformat(),
+            "duration_ms": round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+def current_span():
+    return _current.get()
+
+
+@contextmanager
+def span(name, **attributes):
+    """Span hijo del actual. Sin traza activa no hace nada y entrega None."""
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+
+    child = Span(name, parent.trace_id, parent.span_id, attributes, trace=parent.trace)
+    token = _current.set(child)
+    try:
+        yield child
+    except Exception as exc:
+        child.error = f"{type(exc).__name__}: {exc}"
+        raise
+    finally:
+        _current.reset(token)
+        child.finish()
+
+
+def parse_traceparent(value):
+    """(trace_id, parent_id, sampled) de un header traceparent válido, o None."""
+    match = _TRACEPARENT_RE.match((value or "").strip().lower())
+    if not match or match.group(1) == "0" * 32 or match.group(2) == "0" * 16:
+        return None
+    trace_id, parent_id, flags = match.groups()
+    return trace_id, parent_id, bool(int(flags, 16) & 1)
+
+
+def start_trace(name, traceparent=None, **attributes):
+    """
+    Abre el span raíz de una petición. Devuelve (span, token) o (None, None)
+    si la traza no se muestrea.
+    """
+    incoming = parse_traceparent(traceparent)
+    if incoming:
+        trace_id, parent_id, sampled = incoming
+    else:
+        trace_id, parent_id = secrets.token_hex(16), None
+        sampled = random.random() < getattr(settings, "TRACING_SAMPLE_RATE", 1.0)
+    if not sampled:
+        return None, None
+
+    root = Span(name, trace_id, parent_id, attributes)
+    return root, _current.set(root)
+
+
+def end_trace(root, token):
+    _current.reset(token)
+    root.finish()
+    _log.write(*(s.as_record() for s in sorted(root.trace, key=lambda s: s._started)))
+
+
+class TracedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication con un span "auth.token" cuando hay traza activa.
+    Reutiliza el token que un middleware ya resolvió para la misma petición.
+    """
+
+    def authenticate(self, request):
+        resolved = getattr(request._request, "_authenticated_token", None)
+        if resolved is not None and request.META.get("HTTP_AUTHORIZATION", "").split()[-1:] == [resolved[0]]:
+            return resolved[1]
+        with span("auth.token") as current:
+            result = super().authenticate(request)
+            if current is not None:
+                current.set(authenticated=result is not None)
+            return result
+
+
+class _TracingWrapper:
+    def __init__(self, alias):
+        self.alias = alias
+
+    def __call__(self, execute, sql, params, many, context):
+        if _current.get() is None:
+            return execute(sql, params, many, context)
+        with span("db.query", **{"db.alias": self.alias, "db.statement": fingerprint(sql)[:MAX_STATEMENT_LENGTH]}):
+            return execute(sql, params, many, context)
+
+
+def _install_tracing_wrapper(sender, connection, **kwargs):
+    # Sin traza activa el wrapper solo consulta una ContextVar.
+    if not any(isinstance(w, _TracingWrapper) for w in connection.execute_wrappers):
+        # Al fondo de la lista: connection.execute_wrapper() saca el último.
+        connection.execute_wrappers.insert(0, _TracingWrapper(connection.alias))
+
+
+connection_created.connect(_install_tracing_wrapper)
+
+# Conexiones abiertas antes de importar este módulo (p. ej. chequeos de manage.py).
+for _conn in connections.all(initialized_only=True):
+    if _conn.connection is not None:
+        _install_tracing_wrapper(sender=type(_conn), connection=_conn)
@@ -2,10 +2,13 @@
 from django.contrib import admin
 from django.urls import include, path
 
+from .views import MetricsView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('doctors.urls')),
     path('api/', include('users.urls')),
     path('api/', include('auth_user.urls')),
     path('api/', include('scheduling.urls')),
+    path('api/metrics', MetricsView.as_view(), name='metrics'),
 ]
@@ -0,0 +1,42 @@
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .metrics import render_prometheus
+from .query_budget import query_budget
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@query_budget(GET=1)
+class MetricsView(APIView):
+    """
+    GET /api/metrics — métricas en formato de texto de Prometheus.
+    Solo para usuarios staff o con "Authorization: Bearer <METRICS_TOKEN>".
+    """
+
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        if not self._authorized(request):
+            return Response(
+                {"status": False, "message": "No tiene permisos para ver las métricas."},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+        return HttpResponse(render_prometheus(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+    def _authorized(self, request):
+        scheme, _, credentials = request.META.get("HTTP_AUTHORIZATION", "").partition(" ")
+        if scheme == "Bearer":
+            token = getattr(settings, "METRICS_TOKEN", None)
+            return bool(token) and hmac.compare_digest(credentials.strip(), token)
+
+        authenticated = TokenAuthentication().authenticate(request)
+        return authenticated is not None and authenticated[0].is_staff
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:12
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0004_kinesiologist_description'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='kinesiologist',
+            name='buffer_minutes',
+            field=models.PositiveSmallIntegerField(default=0, validators=[django.core.validators.MaxValueValidator(120)]),
+        ),
+        migrations.AddField(
+            model_name='kinesiologist',
+            name='session_minutes',
+            field=models.PositiveSmallIntegerField(default=45, validators=[django.core.validators.MinValueValidator(10), django.core.validators.MaxValueValidator(240)]),
+        ),
+    ]
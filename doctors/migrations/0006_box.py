@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def register_boxes(apps, schema_editor):
+    """Un Box por cada nombre de box que ya usan los kinesiólogos."""
+    Box = apps.get_model("doctors", "Box")
+    Kinesiologist = apps.get_model("doctors", "Kinesiologist")
+    names = Kinesiologist.objects.values_list("box", flat=True).distinct()
+    Box.objects.bulk_create([Box(name=name) for name in names], ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0005_kinesiologist_session_minutes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Box',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=10, unique=True)),
+                ('description', models.CharField(blank=True, max_length=120)),
+            ],
+        ),
+        migrations.RunPython(register_boxes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='kinesiologist',
+            name='box',
+            field=models.ForeignKey(db_column='box', on_delete=django.db.models.deletion.PROTECT, related_name='kinesiologists', to='doctors.box', to_field='name'),
+        ),
+    ]
@@ -1,6 +1,40 @@
-from django.db import models
+from django.core.cache import cache
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import models, transaction
 from django.contrib.auth.models import User
 
+DEFAULT_SESSION_MINUTES = 45
+
+
+def slot_template_key(kinesiologist_id):
+    return f"slot-template:{kinesiologist_id}"
+
+
+def invalidate_slot_template(kinesiologist_id):
+    """
+    Descarta la plantilla de slots precalculada (scheduling/schedule.py). Se
+    borra ahora y otra vez al commit, por si otra petición la reconstruyó con
+    los datos anteriores mientras la transacción seguía abierta.
+    """
+    key = slot_template_key(kinesiologist_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+class Box(models.Model):
+    """
+    Box (sala) de atención. Es un recurso agendable: dos kinesiólogos que
+    comparten box no pueden tener citas que se crucen (ver
+    Appointment._check_schedule). Se identifica por su nombre, que es lo que
+    guardan Kinesiologist.box y Appointment.box.
+    """
+
+    name = models.CharField(max_length=10, unique=True)
+    description = models.CharField(max_length=120, blank=True)
+
+    def __str__(self) -> str:
+        return self.name
+
 
 class Kinesiologist(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -8,9 +42,28 @@ class Kinesiologist(models.Model):
     rut = models.CharField(max_length=20, unique=True)
     specialty = models.CharField(max_length=100)
     phone_number = models.CharField(max_length=10)
-    box = models.CharField(max_length=10)
+    box = models.ForeignKey(
+        Box,
+        to_field="name",
+        db_column="box",
+        on_delete=models.PROTECT,
+        related_name="kinesiologists",
+    )
     description = models.CharField(max_length=250, default="")
     image_url = models.CharField(max_length=100)
+    # Duración de cada sesión y pausa entre sesiones, en minutos.
+    session_minutes = models.PositiveSmallIntegerField(
+        default=DEFAULT_SESSION_MINUTES,
+        validators=[MinValueValidator(10), MaxValueValidator(240)],
+    )
+    buffer_minutes = models.PositiveSmallIntegerField(
+        default=0,
+        validators=[MaxValueValidator(120)],
+    )
 
     def __str__(self) -> str:
         return self.name
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        invalidate_slot_template(self.id)
@@ -2,11 +2,14 @@ from django.contrib.auth.models import User
 from django.utils.crypto import get_random_string
 from rest_framework import serializers
 
-from .models import Kinesiologist
+from clinic_backend.sparse_fields import SparseFieldsetMixin
+from .models import Box, Kinesiologist
 
 
-class KinesiologistSerializer(serializers.ModelSerializer):
+class KinesiologistSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     email = serializers.EmailField(write_only=True)
+    # Nombre de un box ya registrado (los boxes se administran en el admin).
+    box = serializers.CharField(source='box_id', max_length=10)
     generated_password = serializers.SerializerMethodField()
 
     class Meta:
@@ -20,9 +23,12 @@ class KinesiologistSerializer(serializers.ModelSerializer):
             'box',
             'email',
             'description',
+            'session_minutes',
+            'buffer_minutes',
             'generated_password',
         ]
         read_only_fields = ['id', 'generated_password']
+        field_sources = {'email': ['user__email'], 'generated_password': []}
 
     def validate_email(self, value: str) -> str:
         if User.objects.filter(email=value).exists():
@@ -37,6 +43,8 @@ class KinesiologistSerializer(serializers.ModelSerializer):
     def validate_box(self, value: str) -> str:
         if not value.strip():
             raise serializers.ValidationError("El box es obligatorio.")
+        if not Box.objects.filter(name=value).exists():
+            raise serializers.ValidationError(f"El box {value} no existe.")
         return value
     
     def validate_description(self, value: str) -> str:
@@ -62,7 +70,8 @@ class KinesiologistSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         data = super().to_representation(instance)
-        data['email'] = instance.user.email
+        if 'email' in self.fields:
+            data['email'] = instance.user.email
         password = getattr(instance, 'generated_password', None)
         if password is None:
             data.pop('generated_password', None)
@@ -1,3 +1,45 @@
+from django.contrib.auth.models import User
 from django.test import TestCase
 
-# Create your tests here.
+from clinic_backend.testing import QueryBudgetTestMixin, auth, make_kinesiologist
+from .models import Box
+
+
+class DoctorsQueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    def setUp(self):
+        self.kine = make_kinesiologist("kine")
+        self.size = 0
+
+    def grow(self, size):
+        for n in range(self.size, size):
+            make_kinesiologist(f"k{n}")
+        self.size = max(self.size, size)
+
+    def test_list(self):
+        self.assertQueryBudget("GET", "/api/kinesiologists", self.grow)
+        self.assertQueryBudget("GET", "/api/kinesiologists?fields=id,name,specialty", self.grow)
+        # Con token (lista pública) se suma la consulta de autenticación.
+        self.assertQueryBudget("GET", "/api/kinesiologists", self.grow, **auth(self.kine.user))
+
+    def test_create(self):
+        admin = User.objects.create(username="admin@example.com", email="admin@example.com", is_superuser=True)
+        Box.objects.create(name="2")
+
+        def grow(size):
+            self.grow(size)
+            User.objects.filter(email="nuevo@example.com").delete()
+
+        self.assertQueryBudget(
+            "POST", "/api/kinesiologists", grow,
+            data={"name": "Nuevo", "rut": "rut-nuevo", "specialty": "General", "phone_number": "912345678",
+                  "box": "2", "email": "nuevo@example.com", "description": "Kinesiólogo nuevo."},
+            content_type="application/json", **auth(admin),
+        )
+
+    def test_profile(self):
+        self.assertQueryBudget("GET", "/api/kinesiologist/profile/", self.grow, **auth(self.kine.user))
+        self.assertQueryBudget(
+            "PUT", "/api/kinesiologist/profile/", self.grow,
+            data={"phone_number": "987654321", "email": "kine@example.com"},
+            content_type="application/json", **auth(self.kine.user),
+        )
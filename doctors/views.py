@@ -1,18 +1,21 @@
 from django.db import IntegrityError, transaction
 from rest_framework import status
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.decorators import api_view, permission_classes
 from django.shortcuts import get_object_or_404
 
+from clinic_backend.sparse_fields import prune_queryset, requested_fields
+from clinic_backend.query_budget import query_budget
+from clinic_backend.tracing import TracedTokenAuthentication
 from .models import Kinesiologist
 from .serializers import KinesiologistSerializer
 
 
+@query_budget(GET=2, POST=8)
 class KinesiologistListCreateView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [TracedTokenAuthentication]
 
     def get_permissions(self):
         if self.request.method == "GET":
@@ -20,9 +23,14 @@ class KinesiologistListCreateView(APIView):
         return [IsAuthenticated()]
 
     def get(self, request):
+        fields = requested_fields(request, KinesiologistSerializer)
         try:
-            kinesiologists = Kinesiologist.objects.select_related('user').order_by('name')
-            serializer = KinesiologistSerializer(kinesiologists, many=True)
+            kinesiologists = prune_queryset(
+                Kinesiologist.objects.select_related('user').order_by('name'),
+                KinesiologistSerializer,
+                fields,
+            )
+            serializer = KinesiologistSerializer(kinesiologists, many=True, fields=fields)
             return Response(serializer.data, status=status.HTTP_200_OK)
         except Exception:
             return Response(
@@ -66,6 +74,7 @@ class KinesiologistListCreateView(APIView):
         )
 
 
+@query_budget(GET=2, PUT=5)
 @api_view(["GET", "PUT"])
 @permission_classes([IsAuthenticated])
 def kinesiologist_profile(request):
@@ -74,7 +83,12 @@ def kinesiologist_profile(request):
     GET  /api/kinesiologist/profile/
     PUT  /api/kinesiologist/profile/
     """
-    kine = Kinesiologist.objects.filter(user=request.user).first()
+    fields = requested_fields(request, KinesiologistSerializer) if request.method == "GET" else None
+    kine = prune_queryset(
+        Kinesiologist.objects.filter(user=request.user).select_related('user'),
+        KinesiologistSerializer,
+        fields,
+    ).first()
     if not kine:
         return Response(
             {"status": False, "message": "El usuario no corresponde a un kinesiólogo."},
@@ -83,16 +97,23 @@ def kinesiologist_profile(request):
 
     if request.method == "GET":
        
-        data = KinesiologistSerializer(kine).data
-        data.setdefault("email", getattr(request.user, "email", ""))
+        data = KinesiologistSerializer(kine, fields=fields).data
+        if fields is None or "email" in fields:
+            data.setdefault("email", getattr(request.user, "email", ""))
         return Response(data, status=status.HTTP_200_OK)
 
    
     kine.name = request.data.get("name", kine.name)
     kine.phone_number = request.data.get("phone_number", kine.phone_number)
     kine.specialty = request.data.get("specialty", kine.specialty)
-    kine.box = request.data.get("box", kine.box)
     kine.image_url = request.data.get("image_url", kine.image_url)
+
+    validated = {field: request.data[field] for field in ("box", "session_minutes", "buffer_minutes") if field in request.data}
+    if validated:
+        serializer = KinesiologistSerializer(kine, data=validated, partial=True)
+        serializer.is_valid(raise_exception=True)
+        for field, value in serializer.validated_data.items():
+            setattr(kine, field, value)
     kine.save()
 
    
@@ -1,6 +1,18 @@
 from django.contrib import admin
 from doctors.models import Kinesiologist
-from .models import Availability, Appointment
+from .archive import restore_appointments
+from .models import (
+    Availability,
+    Appointment,
+    ArchivedAppointment,
+    CalendarFeed,
+    GroupSlot,
+    ScheduleException,
+    SessionNote,
+    SessionType,
+    SlotHold,
+    WaitlistEntry,
+)
 
 admin.site.register(Kinesiologist)
 
@@ -14,4 +26,66 @@ class AvailabilityAdmin(admin.ModelAdmin):
 @admin.register(Appointment)
 class AppointmentAdmin(admin.ModelAdmin):
     list_display = ("id", "kinesiologist", "patient_name", "date", "start_time", "end_time")
-    list_filter = ("kinesiologist", "date")
\ No newline at end of file
+    list_filter = ("kinesiologist", "date")
+
+
+@admin.register(ArchivedAppointment)
+class ArchivedAppointmentAdmin(admin.ModelAdmin):
+    list_display = ("id", "kinesiologist", "patient_name", "date", "start_time", "status", "archived_at")
+    list_filter = ("status", "kinesiologist")
+    date_hierarchy = "date"
+    actions = ["restore"]
+
+    @admin.action(description="Restaurar citas seleccionadas")
+    def restore(self, request, queryset):
+        restored = restore_appointments(queryset)
+        self.message_user(request, f"{restored} citas restauradas.")
+
+
+@admin.register(SessionNote)
+class SessionNoteAdmin(admin.ModelAdmin):
+    list_display = ("id", "appointment_id", "version", "author", "created_at")
+    raw_id_fields = ("appointment", "author")
+
+    def has_change_permission(self, request, obj=None):
+        # Las notas no se editan: cada cambio es una versión nueva.
+        return False
+
+
+@admin.register(CalendarFeed)
+class CalendarFeedAdmin(admin.ModelAdmin):
+    list_display = ("id", "user", "created_at")
+    search_fields = ("user__username",)
+    readonly_fields = ("secret",)
+
+
+@admin.register(SlotHold)
+class SlotHoldAdmin(admin.ModelAdmin):
+    list_display = ("id", "kinesiologist", "patient", "date", "start_time", "end_time", "expires_at")
+    list_filter = ("date",)
+
+
+@admin.register(WaitlistEntry)
+class WaitlistEntryAdmin(admin.ModelAdmin):
+    list_display = ("id", "patient", "kinesiologist", "date_from", "date_until", "window_start", "window_end", "offered_at")
+    list_filter = ("offered_at",)
+
+
+@admin.register(ScheduleException)
+class ScheduleExceptionAdmin(admin.ModelAdmin):
+    list_display = ("id", "kinesiologist", "kind", "date_from", "date_until", "start_time", "end_time", "reason")
+    list_filter = ("kind",)
+    search_fields = ("reason", "kinesiologist__name")
+
+
+@admin.register(SessionType)
+class SessionTypeAdmin(admin.ModelAdmin):
+    list_display = ("id", "kinesiologist", "name", "capacity")
+    list_filter = ("kinesiologist",)
+
+
+@admin.register(GroupSlot)
+class GroupSlotAdmin(admin.ModelAdmin):
+    list_display = ("id", "session_type", "date", "start_time", "end_time", "booked", "capacity")
+    list_filter = ("date",)
+    readonly_fields = ("booked",)
@@ -0,0 +1,85 @@
+"""
+Archivo de citas antiguas.
+
+archive_appointments() mueve a ArchivedAppointment las citas realizadas o
+canceladas anteriores a una fecha, por lotes: cada lote es una transacción
+corta (insertar en el archivo + borrar de Appointment) y el recorrido avanza
+por id, así que nunca se bloquea la tabla completa. restore_appointments()
+hace el camino inverso conservando los ids.
+
+appointment_history() arma el UNION de ambas tablas para las lecturas de
+historial: devuelve instancias de Appointment, ordenables y paginables.
+"""
+import time
+
+from django.db import transaction
+from django.db.models import Prefetch
+
+from doctors.models import Kinesiologist
+from .models import Appointment, AppointmentReminder, ArchivedAppointment, CalendarFeed
+
+APPOINTMENT_FIELDS = [f.name for f in Appointment._meta.concrete_fields]
+_ATTNAMES = [f.attname for f in Appointment._meta.concrete_fields]
+
+
+def _move(source, target_model, batch_size, pause, on_batch):
+    """Copia y borra por lotes las filas de `source`, avanzando por id."""
+    moved = 0
+    last_id = 0
+    while True:
+        batch = list(source.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:batch_size])
+        if not batch:
+            return moved
+        last_id = batch[-1]
+
+        with transaction.atomic():
+            # Se vuelve a filtrar dentro de la transacción: una cita pudo
+            # cambiar de estado desde que se leyó el lote.
+            rows = list(
+                source.filter(id__in=batch).select_for_update(skip_locked=True).values(*_ATTNAMES)
+            )
+            target_model.objects.bulk_create([target_model(**row) for row in rows])
+            source.model.objects.filter(id__in=[row["id"] for row in rows]).delete()
+            if target_model is ArchivedAppointment:
+                AppointmentReminder.drop(row["id"] for row in rows)
+        CalendarFeed.touch(
+            (row["kinesiologist_id"] for row in rows), (row["patient_name_id"] for row in rows)
+        )
+
+        moved += len(rows)
+        if on_batch:
+            on_batch(moved)
+        if pause:
+            time.sleep(pause)
+
+
+def archivable(cutoff):
+    return Appointment.objects.filter(status__in=ArchivedAppointment.ARCHIVABLE_STATUSES, date__lt=cutoff)
+
+
+def archive_appointments(cutoff, batch_size=1000, pause=0, on_batch=None):
+    """Archiva las citas realizadas/canceladas con fecha anterior a `cutoff`."""
+    return _move(archivable(cutoff), ArchivedAppointment, batch_size, pause, on_batch)
+
+
+def restore_appointments(queryset, batch_size=1000, pause=0, on_batch=None):
+    """Devuelve a Appointment las citas archivadas de `queryset`."""
+    return _move(queryset, Appointment, batch_size, pause, on_batch)
+
+
+def appointment_history(only=None, **filters):
+    """
+    Citas de ambas tablas que cumplen `filters` (UNION ALL), como instancias de
+    Appointment. `only` limita las columnas leídas; id, date y start_time van
+    siempre (el ORDER BY de un UNION solo puede usar columnas seleccionadas).
+    """
+    keep = None if only is None else {"id", "date", "start_time", *only}
+    names = [name for name in APPOINTMENT_FIELDS if keep is None or name in keep]
+    hot = Appointment.objects.filter(**filters).only(*names)
+    cold = ArchivedAppointment.objects.filter(**filters).only(*names)
+    return hot.union(cold, all=True)
+
+
+def kinesiologist_prefetch():
+    """Prefetch de kinesiólogo + usuario en una consulta (un UNION no admite select_related)."""
+    return Prefetch("kinesiologist", queryset=Kinesiologist.objects.select_related("user"))
@@ -0,0 +1,65 @@
+"""
+Exportación de citas a CSV para reportes.
+
+Las filas salen de una sola consulta (UNION de citas activas y archivadas con
+los nombres ya unidos por JOIN) leída con .iterator(chunk_size), y el CSV se
+entrega por bloques: la memoria se mantiene constante sea cual sea el número
+de filas. La usan AppointmentExportView y `manage.py export_appointments`.
+"""
+import csv
+import io
+
+from .models import Appointment, ArchivedAppointment
+
+# (encabezado, ruta del campo)
+CSV_COLUMNS = [
+    ("id", "id"),
+    ("fecha", "date"),
+    ("inicio", "start_time"),
+    ("termino", "end_time"),
+    ("estado", "status"),
+    ("kinesiologo_id", "kinesiologist_id"),
+    ("kinesiologo", "kinesiologist__name"),
+    ("especialidad", "kinesiologist__specialty"),
+    ("paciente_id", "patient_name_id"),
+    ("paciente", "patient_name__name"),
+    ("rut_paciente", "patient_name__rut"),
+]
+
+CHUNK_SIZE = 2000
+BUFFER_BYTES = 64 * 1024
+
+VALID_STATUSES = {value for value, _ in Appointment.STATUS_CHOICES}
+
+
+def export_queryset(kinesiologist_id=None, date_from=None, date_to=None, statuses=None, include_archived=True):
+    """Tuplas de CSV_COLUMNS de las citas filtradas, ordenadas por fecha y hora."""
+    filters = {}
+    if kinesiologist_id:
+        filters["kinesiologist_id"] = kinesiologist_id
+    if date_from:
+        filters["date__gte"] = date_from
+    if date_to:
+        filters["date__lte"] = date_to
+    if statuses:
+        filters["status__in"] = statuses
+
+    paths = [path for _, path in CSV_COLUMNS]
+    qs = Appointment.objects.filter(**filters).values_list(*paths)
+    if include_archived:
+        qs = qs.union(ArchivedAppointment.objects.filter(**filters).values_list(*paths), all=True)
+    return qs.order_by("date", "start_time", "id")
+
+
+def csv_chunks(queryset, chunk_size=CHUNK_SIZE):
+    """Genera el CSV (con encabezado) en bloques de ~BUFFER_BYTES."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([header for header, _ in CSV_COLUMNS])
+    for row in queryset.iterator(chunk_size=chunk_size):
+        writer.writerow(row)
+        if buffer.tell() >= BUFFER_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
@@ -0,0 +1,90 @@
+"""
+Retenciones temporales de horarios (ver SlotHold).
+
+place_hold() crea la retención del paciente (una vigente por paciente) tras
+validar horario, citas y otras retenciones; serializa por kinesiólogo con un
+SELECT ... FOR UPDATE sobre su fila. El paciente que retiene reemplaza su
+retención anterior; una oferta de la lista de espera (replace=False) no la
+toca y se descarta si el paciente ya tiene una vigente. Los slots y la reserva solo leen
+retenciones vigentes (expires_at > ahora), así que una vencida deja de
+contar aunque todavía no se haya borrado.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from doctors.models import Kinesiologist
+from .models import Appointment, SlotHold
+
+
+class SlotUnavailable(Exception):
+    pass
+
+
+def active_holds(now=None):
+    return SlotHold.objects.filter(expires_at__gt=now or timezone.now())
+
+
+def overlapping(queryset, day, start, end):
+    return queryset.filter(date=day, start_time__lt=end, end_time__gt=start)
+
+
+def conflicting_hold(kinesiologist_id, day, start, end, patient_id, box=None):
+    """¿Hay una retención vigente de otro paciente que se cruza con el horario (del kinesiólogo o del box)?"""
+    scope = Q(kinesiologist_id=kinesiologist_id)
+    if box:
+        scope |= Q(kinesiologist__box_id=box)
+    return overlapping(
+        active_holds().filter(scope).exclude(patient_id=patient_id), day, start, end
+    ).exists()
+
+
+def place_hold(kinesiologist, patient, day, start, end, seconds=None, replace=True):
+    now = timezone.now()
+    with transaction.atomic():
+        # Dos pacientes que retienen a la vez el mismo kinesiólogo se ordenan aquí.
+        Kinesiologist.objects.select_for_update().filter(id=kinesiologist.id).values_list("id").first()
+
+        # Limpieza perezosa de las vencidas del día y, con `replace`, de la retención anterior del paciente.
+        stale = Q(kinesiologist=kinesiologist, date=day, expires_at__lte=now)
+        if replace:
+            stale |= Q(patient=patient)
+        SlotHold.objects.filter(stale).delete()
+        if not replace and active_holds(now).filter(patient=patient).exists():
+            raise SlotUnavailable("El paciente ya tiene un horario retenido.")
+
+        candidate = Appointment(
+            kinesiologist=kinesiologist, patient_name=patient, box_id=kinesiologist.box_id,
+            date=day, start_time=start, end_time=end,
+        )
+        try:
+            candidate._check_schedule()
+        except ValidationError as exc:
+            raise SlotUnavailable(exc.messages[0])
+        if conflicting_hold(kinesiologist.id, day, start, end, patient.id, kinesiologist.box_id):
+            raise SlotUnavailable("Otro paciente está reservando este horario. Intenta con otro.")
+
+        return SlotHold.objects.create(
+            kinesiologist=kinesiologist,
+            patient=patient,
+            date=day,
+            start_time=start,
+            end_time=end,
+            expires_at=now + timedelta(seconds=seconds or settings.SLOT_HOLD_SECONDS),
+        )
+
+
+def sweep_expired(batch_size=1000):
+    """Borra por lotes las retenciones vencidas. Devuelve cuántas borró."""
+    total = 0
+    while True:
+        ids = list(
+            SlotHold.objects.filter(expires_at__lte=timezone.now()).values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            return total
+        total += SlotHold.objects.filter(id__in=ids).delete()[0]
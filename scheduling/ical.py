@@ -0,0 +1,138 @@
+"""
+Feeds iCalendar (RFC 5545) de citas por kinesiólogo y por paciente.
+
+CalendarFeedView responde GET /api/calendar/<secret>.ics. La versión del feed
+sale de CalendarFeed.changed_at (marca en cache que se actualiza con cada
+cambio de citas) más el día actual, que define la ventana ICAL_PAST_DAYS /
+ICAL_FUTURE_DAYS; con ella se arman ETag y Last-Modified, así que los clientes
+que sondean reciben 304 sin tocar las citas. El cuerpo generado se guarda en
+cache por ETag.
+"""
+import hashlib
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import Appointment, CalendarFeed
+
+PRODID = "-//Centro de Salud y Bienestar//Agenda de kinesiología//ES"
+
+ICAL_STATUS = {
+    "pending": "TENTATIVE",
+    "confirmed": "CONFIRMED",
+    "completed": "CONFIRMED",
+    "cancelled": "CANCELLED",
+    "no_show": "CANCELLED",
+}
+
+# Campos leídos en una sola consulta (nombres unidos por JOIN).
+EVENT_FIELDS = [
+    "id", "date", "start_time", "end_time", "status",
+    "kinesiologist__name", "box", "patient_name__name",
+]
+
+
+def feed_owner(feed):
+    """("kine" | "patient", id) del perfil del dueño del feed, o None."""
+    user = feed.user
+    if hasattr(user, "kinesiologist"):
+        return "kine", user.kinesiologist.id
+    if hasattr(user, "patient"):
+        return "patient", user.patient.id
+    return None
+
+
+def window(today=None):
+    today = today or timezone.localdate()
+    return (
+        today - timedelta(days=settings.ICAL_PAST_DAYS),
+        today + timedelta(days=settings.ICAL_FUTURE_DAYS),
+    )
+
+
+def feed_version(feed, kind, owner_id):
+    """(etag, last_modified) del feed: cambia con las citas y con el día."""
+    changed = CalendarFeed.changed_at(kind, owner_id)
+    today = timezone.localdate()
+    start, end = window(today)
+    raw = f"{feed.secret}:{kind}:{owner_id}:{changed.isoformat()}:{start}:{end}"
+    etag = hashlib.sha256(raw.encode()).hexdigest()[:32]
+    # La ventana avanza cada día: el feed también "cambia" a medianoche.
+    midnight = timezone.make_aware(datetime.combine(today, time.min))
+    return etag, max(changed, midnight)
+
+
+def _escape(text):
+    return (
+        str(text).replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+    )
+
+
+def _fold(line):
+    """Corta las líneas en 75 octetos como pide RFC 5545 (sin partir caracteres UTF-8)."""
+    encoded = line.encode("utf-8")
+    if len(encoded) <= 75:
+        return line
+    parts = []
+    current = ""
+    limit = 75
+    for char in line:
+        if len((current + char).encode("utf-8")) > limit:
+            parts.append(current)
+            current = char
+            limit = 74  # las continuaciones empiezan con un espacio
+        else:
+            current += char
+    parts.append(current)
+    return "\r\n ".join(parts)
+
+
+def _utc(day, at):
+    return timezone.make_aware(datetime.combine(day, at)).astimezone(dt_timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def render_feed(kind, owner_id, stamp):
+    start, end = window()
+    owner_filter = {"kinesiologist_id": owner_id} if kind == "kine" else {"patient_name_id": owner_id}
+    rows = (
+        Appointment.objects
+        .filter(date__gte=start, date__lte=end, **owner_filter)
+        .order_by("date", "start_time")
+        .values_list(*EVENT_FIELDS)
+    )
+    dtstamp = stamp.astimezone(dt_timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:{PRODID}",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        "X-WR-CALNAME:Kinesiología",
+    ]
+    for id_, day, start_time, end_time, status, kine_name, box, patient_name in rows:
+        summary = f"Sesión con {patient_name}" if kind == "kine" else f"Kinesiología con {kine_name}"
+        lines += [
+            "BEGIN:VEVENT",
+            f"UID:appointment-{id_}@clinic",
+            f"DTSTAMP:{dtstamp}",
+            f"DTSTART:{_utc(day, start_time)}",
+            f"DTEND:{_utc(day, end_time)}",
+            f"SUMMARY:{_escape(summary)}",
+            f"LOCATION:{_escape(f'Box {box}')}",
+            f"STATUS:{ICAL_STATUS.get(status, 'TENTATIVE')}",
+            "END:VEVENT",
+        ]
+    lines.append("END:VCALENDAR")
+    return "\r\n".join(_fold(line) for line in lines) + "\r\n"
+
+
+def cached_feed(etag, kind, owner_id, stamp):
+    key = f"ical:body:{etag}"
+    body = cache.get(key)
+    if body is None:
+        body = render_feed(kind, owner_id, stamp)
+        cache.set(key, body, settings.ICAL_CACHE_SECONDS)
+    return body
@@ -0,0 +1,49 @@
+"""
+Mueve a ArchivedAppointment las citas realizadas/canceladas antiguas.
+
+    python manage.py archive_appointments                      # más antiguas que APPOINTMENT_ARCHIVE_AFTER_DAYS
+    python manage.py archive_appointments --before 2024-01-01 --batch-size 500 --pause 0.2
+    python manage.py archive_appointments --dry-run
+
+Cada lote es una transacción corta; --pause deja respirar a las escrituras
+concurrentes entre lotes. Para devolver citas al uso normal: restore_appointments.
+"""
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from scheduling.archive import archivable, archive_appointments
+
+
+class Command(BaseCommand):
+    help = "Archiva por lotes las citas realizadas o canceladas anteriores a una fecha."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--before", type=date.fromisoformat, default=None,
+                            help="Fecha de corte (YYYY-MM-DD). Por defecto, hoy menos APPOINTMENT_ARCHIVE_AFTER_DAYS.")
+        parser.add_argument("--older-than-days", type=int, default=None)
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--pause", type=float, default=0.0, help="Segundos de espera entre lotes.")
+        parser.add_argument("--dry-run", action="store_true", help="Solo cuenta las citas a archivar.")
+
+    def handle(self, *args, **options):
+        cutoff = options["before"]
+        if cutoff is None:
+            days = options["older_than_days"]
+            if days is None:
+                days = getattr(settings, "APPOINTMENT_ARCHIVE_AFTER_DAYS", 365)
+            cutoff = timezone.localdate() - timedelta(days=days)
+
+        if options["dry_run"]:
+            self.stdout.write(f"{archivable(cutoff).count()} citas anteriores a {cutoff} se archivarían.")
+            return
+
+        total = archive_appointments(
+            cutoff,
+            batch_size=options["batch_size"],
+            pause=options["pause"],
+            on_batch=lambda moved: self.stdout.write(f"  {moved} archivadas...") if options["verbosity"] > 1 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(f"{total} citas anteriores a {cutoff} archivadas."))
@@ -0,0 +1,384 @@
+"""
+Benchmark de carga end-to-end de la API de reservas.
+
+Reproduce una mezcla realista de operaciones (directorio, slots de las
+próximas 2 semanas, reserva, confirmar/cancelar e historial) con varios
+workers concurrentes y reporta throughput, p50/p95/p99 por endpoint y
+consultas SQL por petición (header X-DB-Queries). El resultado se guarda
+como JSON para comparar corridas.
+
+    # En proceso (django.test.Client), correo locmem automático:
+    python manage.py benchmark_booking --seed --requests 2000
+
+    # Contra un servidor local (mismo settings/base de datos):
+    DJANGO_EMAIL_BACKEND=django.core.mail.backends.locmem.EmailBackend python manage.py runserver
+    python manage.py benchmark_booking --base-url http://127.0.0.1:8000
+"""
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from http.client import HTTPConnection
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from doctors.models import Kinesiologist
+from scheduling.models import Appointment
+from users.models import Patient
+
+DEFAULT_MIX = {
+    "directory": 15,
+    "slots": 40,
+    "booking": 15,
+    "status": 10,
+    "history": 20,
+}
+SLOT_WINDOW_DAYS = 14
+ACTOR_SAMPLE = 200
+
+
+class DjangoClientTransport:
+    """Peticiones en proceso con django.test.Client (un cliente por thread)."""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def request(self, method, path, token=None, body=None):
+        from django.test import Client
+
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = Client(raise_request_exception=False)
+
+        headers = {"HTTP_AUTHORIZATION": f"Token {token}"} if token else {}
+        payload = json.dumps(body) if body is not None else None
+        response = client.generic(
+            method, path, payload or "", content_type="application/json", **headers
+        )
+        return response.status_code, response.content, response.headers.get("X-DB-Queries")
+
+    def close(self):
+        connections.close_all()
+
+
+class HTTPTransport:
+    """Peticiones HTTP contra runserver / un servidor ASGI local."""
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip("/")
+        self._local = threading.local()
+
+    def request(self, method, path, token=None, body=None):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = HTTPConnection(self.host, self.port, timeout=30)
+
+        headers = {"Content-Type": "application/json"}
+        if token:
+            headers["Authorization"] = f"Token {token}"
+        payload = json.dumps(body) if body is not None else None
+        try:
+            conn.request(method, self.prefix + path, body=payload, headers=headers)
+            response = conn.getresponse()
+            content = response.read()
+        except OSError:
+            conn.close()
+            self._local.conn = None
+            raise
+        return response.status, content, response.getheader("X-DB-Queries")
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def _sum_queries(header):
+    if not header:
+        return None
+    total = 0
+    for part in header.split(","):
+        _, _, count = part.partition("=")
+        total += int(count)
+    return total
+
+
+class Command(BaseCommand):
+    help = "Benchmark de carga de la API de reservas (throughput, p50/p95/p99, consultas por petición)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", help="Servidor a medir. Sin esto se usa django.test.Client en proceso.")
+        parser.add_argument("--requests", type=int, default=1000, help="Operaciones totales.")
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--mix", default="", help="Pesos, p. ej. directory=10,slots=50,booking=20,status=10,history=10")
+        parser.add_argument("--random-seed", type=int, default=42)
+        parser.add_argument("--output", help="Archivo JSON de resultados (por defecto benchmarks/booking-<fecha>.json).")
+        parser.add_argument("--compare", help="JSON de una corrida anterior para mostrar diferencias.")
+        parser.add_argument("--seed", action="store_true", help="Regenera los datos con seed_clinic antes de medir.")
+        parser.add_argument("--kinesiologists", type=int, default=20)
+        parser.add_argument("--patients", type=int, default=500)
+        parser.add_argument("--appointments", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        mix = self._parse_mix(options["mix"])
+        rng = random.Random(options["random_seed"])
+
+        if options["seed"]:
+            self._seed(options)
+
+        actors = self._load_actors(rng)
+
+        if options["base_url"]:
+            transport = HTTPTransport(options["base_url"])
+            if settings.EMAIL_DELIVERY_BACKEND.endswith("smtp.EmailBackend"):
+                self.stderr.write(
+                    "Aviso: asegúrese de que el servidor use "
+                    "DJANGO_EMAIL_BACKEND=django.core.mail.backends.locmem.EmailBackend"
+                )
+            result = self._run(transport, actors, mix, options, rng)
+        else:
+            transport = DjangoClientTransport()
+            with override_settings(
+                EMAIL_DELIVERY_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+                ALLOWED_HOSTS=["*"],
+            ):
+                result = self._run(transport, actors, mix, options, rng)
+
+        result["config"] = {
+            "base_url": options["base_url"] or "in-process",
+            "requests": options["requests"],
+            "concurrency": options["concurrency"],
+            "mix": mix,
+            "random_seed": options["random_seed"],
+            "dataset": {
+                "kinesiologists": Kinesiologist.objects.count(),
+                "patients": Patient.objects.count(),
+                "appointments": Appointment.objects.count(),
+            },
+        }
+
+        self._report(result)
+        if options["compare"]:
+            self._compare(result, options["compare"])
+        self._save(result, options["output"])
+
+    # --- preparación -------------------------------------------------------
+
+    def _parse_mix(self, raw):
+        if not raw:
+            return dict(DEFAULT_MIX)
+        mix = {}
+        for part in raw.split(","):
+            name, _, weight = part.partition("=")
+            name = name.strip()
+            if name not in DEFAULT_MIX:
+                raise CommandError(f"Operación desconocida en --mix: {name}")
+            mix[name] = int(weight)
+        return mix
+
+    def _seed(self, options):
+        call_command(
+            "seed_clinic",
+            "--flush",
+            kinesiologists=options["kinesiologists"],
+            patients=options["patients"],
+            appointments=options["appointments"],
+            seed=options["random_seed"],
+            stdout=self.stdout,
+        )
+
+    def _load_actors(self, rng):
+        kines = list(Kinesiologist.objects.order_by("id").values_list("id", "user_id"))
+        patients = list(Patient.objects.order_by("id").values_list("id", "user_id"))
+        if not kines or not patients:
+            raise CommandError("Se necesitan kinesiólogos y pacientes (use --seed).")
+
+        kines = rng.sample(kines, min(len(kines), ACTOR_SAMPLE))
+        patients = rng.sample(patients, min(len(patients), ACTOR_SAMPLE))
+        user_ids = [u for _, u in kines] + [u for _, u in patients]
+        existing = dict(Token.objects.filter(user_id__in=user_ids).values_list("user_id", "key"))
+        missing = [Token(user_id=u, key=Token.generate_key()) for u in user_ids if u not in existing]
+        Token.objects.bulk_create(missing)
+        existing.update((t.user_id, t.key) for t in missing)
+
+        kine_ids = [k for k, _ in kines]
+        pending = list(
+            Appointment.objects
+            .filter(kinesiologist_id__in=kine_ids, status="pending", date__gte=timezone.localdate())
+            .values_list("id", "kinesiologist_id")[:5000]
+        )
+        return {
+            "kinesiologists": [(k, existing[u]) for k, u in kines],
+            "kine_tokens": {k: existing[u] for k, u in kines},
+            "patients": [existing[u] for _, u in patients],
+            "pending": pending,
+            "pending_lock": threading.Lock(),
+        }
+
+    # --- ejecución -------------------------------------------------------------
+
+    def _run(self, transport, actors, mix, options, rng):
+        names = list(mix)
+        weights = [mix[n] for n in names]
+        plan = [(rng.choices(names, weights)[0], rng.random()) for _ in range(options["requests"])]
+        samples = defaultdict(list)
+        samples_lock = threading.Lock()
+
+        def record(endpoint, status_code, elapsed, queries):
+            with samples_lock:
+                samples[endpoint].append((elapsed, status_code, queries))
+
+        def call(endpoint, method, path, token=None, body=None):
+            start = time.perf_counter()
+            try:
+                status_code, content, queries = transport.request(method, path, token, body)
+            except OSError:
+                status_code, content, queries = 0, b"", None
+            record(endpoint, status_code, time.perf_counter() - start, _sum_queries(queries))
+            return status_code, content
+
+        def operation(item):
+            op, seed = item
+            op_rng = random.Random(seed)
+            today = timezone.localdate()
+
+            if op == "directory":
+                call("directory", "GET", "/api/kinesiologists")
+
+            elif op == "slots" or op == "booking":
+                kine_id, _ = op_rng.choice(actors["kinesiologists"])
+                target = today + timedelta(days=op_rng.randint(1, SLOT_WINDOW_DAYS))
+                status_code, content = call(
+                    "slots", "GET", f"/api/kinesiologists/{kine_id}/slots/?date={target.isoformat()}"
+                )
+                if op == "booking" and status_code == 200:
+                    slots = json.loads(content or b"[]")
+                    if slots:
+                        slot = op_rng.choice(slots)
+                        status_code, content = call(
+                            "booking", "POST", f"/api/kinesiologists/{kine_id}/appointments/",
+                            token=op_rng.choice(actors["patients"]),
+                            body={"date": slot["date"], "start_time": slot["start_time"], "end_time": slot["end_time"]},
+                        )
+                        if status_code == 201:
+                            appointment_id = json.loads(content)["appointment"]["id"]
+                            with actors["pending_lock"]:
+                                actors["pending"].append((appointment_id, kine_id))
+
+            elif op == "status":
+                with actors["pending_lock"]:
+                    item = actors["pending"].pop() if actors["pending"] else None
+                if item is not None:
+                    appointment_id, kine_id = item
+                    call(
+                        "status", "PATCH", f"/api/appointments/{appointment_id}/status/",
+                        token=actors["kine_tokens"][kine_id],
+                        body={"status": op_rng.choice(["confirmed", "cancelled"])},
+                    )
+
+            elif op == "history":
+                call("history", "GET", "/api/patients/appointments/history/",
+                     token=op_rng.choice(actors["patients"]))
+
+        def worker(chunk):
+            try:
+                for item in chunk:
+                    operation(item)
+            finally:
+                transport.close()
+
+        concurrency = max(1, options["concurrency"])
+        chunks = [plan[i::concurrency] for i in range(concurrency)]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(worker, chunks))
+        wall = time.perf_counter() - started
+
+        return self._summarize(samples, wall)
+
+    def _summarize(self, samples, wall):
+        endpoints = {}
+        total = 0
+        for endpoint, rows in sorted(samples.items()):
+            latencies = sorted(r[0] * 1000 for r in rows)
+            queries = [r[2] for r in rows if r[2] is not None]
+            codes = defaultdict(int)
+            for r in rows:
+                codes[str(r[1])] += 1
+            total += len(rows)
+            endpoints[endpoint] = {
+                "count": len(rows),
+                "throughput_rps": round(len(rows) / wall, 2) if wall else None,
+                "p50_ms": round(_percentile(latencies, 50), 2),
+                "p95_ms": round(_percentile(latencies, 95), 2),
+                "p99_ms": round(_percentile(latencies, 99), 2),
+                "max_ms": round(latencies[-1], 2),
+                "queries_avg": round(sum(queries) / len(queries), 2) if queries else None,
+                "queries_max": max(queries) if queries else None,
+                "status_codes": dict(codes),
+            }
+        return {
+            "timestamp": timezone.now().isoformat(),
+            "wall_seconds": round(wall, 3),
+            "total_requests": total,
+            "throughput_rps": round(total / wall, 2) if wall else None,
+            "endpoints": endpoints,
+        }
+
+    # --- salida ----------------------------------------------------------------
+
+    def _report(self, result):
+        self.stdout.write(
+            f"{result['total_requests']} peticiones en {result['wall_seconds']}s "
+            f"({result['throughput_rps']} req/s)"
+        )
+        self.stdout.write(f"{'endpoint':<12}{'n':>7}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'q/req':>8}  códigos")
+        for name, row in result["endpoints"].items():
+            self.stdout.write(
+                f"{name:<12}{row['count']:>7}{row['throughput_rps']:>9}{row['p50_ms']:>9}"
+                f"{row['p95_ms']:>9}{row['p99_ms']:>9}{str(row['queries_avg']):>8}  {row['status_codes']}"
+            )
+
+    def _compare(self, result, path):
+        previous = json.loads(Path(path).read_text())
+        self.stdout.write(f"Comparación con {path} ({previous.get('timestamp')}):")
+        for name, row in result["endpoints"].items():
+            old = previous.get("endpoints", {}).get(name)
+            if not old:
+                continue
+            deltas = []
+            for key in ("p50_ms", "p95_ms", "p99_ms", "queries_avg"):
+                if old.get(key) and row.get(key) is not None:
+                    deltas.append(f"{key} {(row[key] - old[key]) / old[key] * 100:+.1f}%")
+            self.stdout.write(f"  {name:<12}" + ", ".join(deltas))
+
+    def _save(self, result, output):
+        if output:
+            path = Path(output)
+        else:
+            stamp = timezone.now().strftime("%Y%m%d-%H%M%S")
+            path = Path(settings.BASE_DIR) / "benchmarks" / f"booking-{stamp}.json"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(result, indent=2, ensure_ascii=False))
+        self.stdout.write(f"Resultados guardados en {path}")
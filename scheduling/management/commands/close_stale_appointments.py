@@ -0,0 +1,68 @@
+"""
+Cierra las citas pasadas que siguen pendientes o confirmadas.
+
+    python manage.py close_stale_appointments                  # STALE_APPOINTMENT_TARGETS, STALE_APPOINTMENT_GRACE_DAYS
+    python manage.py close_stale_appointments --to completed   # todas a "realizada"
+    python manage.py close_stale_appointments --dry-run
+
+Pensado para correr periódicamente (cron) en uno o varios nodos. Cada
+ejecución agrega una línea con los totales a STALE_APPOINTMENTS_LOG.
+"""
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from clinic_backend.jsonl_log import JSONLinesLog
+from scheduling.stale import close_stale_appointments, stale
+
+_log = JSONLinesLog("scheduling.stale", "STALE_APPOINTMENTS_LOG")
+
+
+class Command(BaseCommand):
+    help = "Marca como realizadas o no asistidas, por lotes, las citas pasadas sin cerrar."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--before", type=date.fromisoformat, default=None,
+                            help="Fecha de corte (YYYY-MM-DD). Por defecto, hoy menos STALE_APPOINTMENT_GRACE_DAYS.")
+        parser.add_argument("--to", choices=["completed", "no_show"],
+                            help="Estado final para todas (por defecto, STALE_APPOINTMENT_TARGETS).")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--pause", type=float, default=0.0, help="Segundos de espera entre lotes.")
+        parser.add_argument("--dry-run", action="store_true", help="Solo cuenta las citas a cerrar.")
+
+    def handle(self, *args, **options):
+        cutoff = options["before"] or timezone.localdate() - timedelta(days=settings.STALE_APPOINTMENT_GRACE_DAYS)
+        targets = dict(settings.STALE_APPOINTMENT_TARGETS)
+        if options["to"]:
+            targets = {source: options["to"] for source in targets}
+
+        if options["dry_run"]:
+            for source, target in targets.items():
+                self.stdout.write(f"{stale(source, cutoff).count()} citas {source} anteriores a {cutoff} -> {target}")
+            return
+
+        started = timezone.now()
+        try:
+            counts = close_stale_appointments(
+                cutoff,
+                targets,
+                batch_size=options["batch_size"],
+                pause=options["pause"],
+                on_batch=lambda source, done: (
+                    self.stdout.write(f"  {source}: {done}...") if options["verbosity"] > 1 else None
+                ),
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        _log.write({
+            "started": started.isoformat(),
+            "duration_ms": round((timezone.now() - started).total_seconds() * 1000, 1),
+            "cutoff": cutoff.isoformat(),
+            "targets": targets,
+            "counts": counts,
+        })
+        summary = ", ".join(f"{counts[source]} {source} -> {target}" for source, target in targets.items())
+        self.stdout.write(self.style.SUCCESS(f"Citas anteriores a {cutoff}: {summary}."))
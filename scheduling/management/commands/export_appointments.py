@@ -0,0 +1,47 @@
+"""
+Exporta citas a CSV (mismo formato que GET /api/appointments/export/).
+
+    python manage.py export_appointments --from 2024-05-01 --until 2024-05-31 --output mayo.csv
+    python manage.py export_appointments --kinesiologist 3 --status completed cancelled > citas.csv
+"""
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from scheduling.export import CHUNK_SIZE, VALID_STATUSES, csv_chunks, export_queryset
+
+
+class Command(BaseCommand):
+    help = "Exporta citas (activas y archivadas) a CSV con memoria constante."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--kinesiologist", type=int, help="Id del kinesiólogo.")
+        parser.add_argument("--from", dest="date_from", type=date.fromisoformat, help="Desde esta fecha (incluida).")
+        parser.add_argument("--until", type=date.fromisoformat, help="Hasta esta fecha (incluida).")
+        parser.add_argument("--status", nargs="+", default=[], help="Uno o más estados.")
+        parser.add_argument("--no-archived", action="store_true", help="Omite las citas archivadas.")
+        parser.add_argument("--output", help="Archivo de salida (por defecto, la salida estándar).")
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        unknown = set(options["status"]) - VALID_STATUSES
+        if unknown:
+            raise CommandError(f"Estados no válidos: {', '.join(sorted(unknown))}")
+
+        queryset = export_queryset(
+            kinesiologist_id=options["kinesiologist"],
+            date_from=options["date_from"],
+            date_to=options["until"],
+            statuses=options["status"],
+            include_archived=not options["no_archived"],
+        )
+        chunks = csv_chunks(queryset, chunk_size=options["chunk_size"])
+        if not options["output"]:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending="")
+            return
+
+        with open(options["output"], "w", encoding="utf-8", newline="") as output:
+            for chunk in chunks:
+                output.write(chunk)
+        self.stderr.write(self.style.SUCCESS(f"Exportación escrita en {options['output']}"))
@@ -0,0 +1,87 @@
+"""
+Perfiles de peticiones guardados por ProfilingMiddleware.
+
+    python manage.py request_profiles token [--memory]   # valor para el header X-Profile
+    python manage.py request_profiles list [--limit 20]
+    python manage.py request_profiles dump <id> [--sort cumulative] [--limit 40] [--output copia.prof]
+    python manage.py request_profiles clear
+"""
+import io
+import pstats
+import shutil
+
+from django.core.management.base import BaseCommand, CommandError
+
+from clinic_backend.profiling import list_profiles, load_profile, make_token, profile_dir
+
+SORT_KEYS = ["cumulative", "tottime", "calls", "ncalls", "time"]
+
+
+class Command(BaseCommand):
+    help = "Lista, muestra y genera tokens para los perfiles de peticiones."
+
+    def add_arguments(self, parser):
+        actions = parser.add_subparsers(dest="action", required=True)
+
+        token = actions.add_parser("token", help="Token firmado para el header X-Profile.")
+        token.add_argument("--memory", action="store_true", help="Incluye tracemalloc.")
+
+        listing = actions.add_parser("list", help="Perfiles guardados, del más reciente al más antiguo.")
+        listing.add_argument("--limit", type=int, default=20)
+
+        dump = actions.add_parser("dump", help="Estadísticas de un perfil.")
+        dump.add_argument("profile_id")
+        dump.add_argument("--sort", choices=SORT_KEYS, default="cumulative")
+        dump.add_argument("--limit", type=int, default=40)
+        dump.add_argument("--output", help="Copia el .prof (pstats) a esta ruta, p. ej. para snakeviz.")
+
+        actions.add_parser("clear", help="Borra todos los perfiles guardados.")
+
+    def handle(self, *args, **options):
+        getattr(self, f"_{options['action']}")(options)
+
+    def _token(self, options):
+        self.stdout.write(make_token("memory" if options["memory"] else "cpu"))
+
+    def _list(self, options):
+        profiles = list_profiles()[: options["limit"]]
+        if not profiles:
+            self.stdout.write("No hay perfiles guardados.")
+            return
+        for meta in profiles:
+            self.stdout.write(
+                f"{meta['id']}  {meta['duration_ms']:>9.1f} ms  {meta['status']}  "
+                f"{meta['trigger']:<6}  {meta['method']} {meta['path']}"
+            )
+
+    def _dump(self, options):
+        loaded = load_profile(options["profile_id"])
+        if loaded is None:
+            raise CommandError(f"No existe el perfil {options['profile_id']}.")
+        meta, prof_path = loaded
+
+        self.stdout.write(
+            f"{meta['method']} {meta['path']} -> {meta['status']} "
+            f"en {meta['duration_ms']} ms ({meta['trigger']}, {meta['created']})\n"
+        )
+        out = io.StringIO()
+        pstats.Stats(str(prof_path), stream=out).sort_stats(options["sort"]).print_stats(options["limit"])
+        self.stdout.write(out.getvalue())
+
+        memory = meta.get("memory")
+        if memory:
+            self.stdout.write(f"Memoria: pico {memory['peak_kb']} KB")
+            for line in memory["top"]:
+                self.stdout.write(f"  {line['size_kb']:>9.1f} KB  {line['count']:>6}  {line['where']}")
+
+        if options["output"]:
+            shutil.copyfile(prof_path, options["output"])
+            self.stdout.write(self.style.SUCCESS(f"Perfil copiado a {options['output']}"))
+
+    def _clear(self, options):
+        directory = profile_dir()
+        removed = 0
+        for path in list(directory.glob("*.prof")) + list(directory.glob("*.json")):
+            path.unlink()
+            removed += 1
+        self.stdout.write(self.style.SUCCESS(f"{removed} archivos borrados."))
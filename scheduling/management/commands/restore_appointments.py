@@ -0,0 +1,43 @@
+"""
+Devuelve citas archivadas a la tabla Appointment (conservan su id).
+
+    python manage.py restore_appointments --patient 12
+    python manage.py restore_appointments --kinesiologist 3 --since 2023-01-01 --until 2023-06-30
+    python manage.py restore_appointments --ids 101 102 103
+"""
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from scheduling.archive import restore_appointments
+from scheduling.models import ArchivedAppointment
+
+
+class Command(BaseCommand):
+    help = "Restaura citas archivadas por paciente, kinesiólogo, rango de fechas o ids."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--patient", type=int, help="Id del paciente.")
+        parser.add_argument("--kinesiologist", type=int, help="Id del kinesiólogo.")
+        parser.add_argument("--since", type=date.fromisoformat, help="Desde esta fecha (incluida).")
+        parser.add_argument("--until", type=date.fromisoformat, help="Hasta esta fecha (incluida).")
+        parser.add_argument("--ids", type=int, nargs="+")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        filters = {}
+        if options["patient"]:
+            filters["patient_name_id"] = options["patient"]
+        if options["kinesiologist"]:
+            filters["kinesiologist_id"] = options["kinesiologist"]
+        if options["since"]:
+            filters["date__gte"] = options["since"]
+        if options["until"]:
+            filters["date__lte"] = options["until"]
+        if options["ids"]:
+            filters["id__in"] = options["ids"]
+        if not filters:
+            raise CommandError("Indique al menos un filtro (--patient, --kinesiologist, --since, --until o --ids).")
+
+        total = restore_appointments(ArchivedAppointment.objects.filter(**filters), batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"{total} citas restauradas."))
@@ -0,0 +1,346 @@
+"""
+Generador de datos sintéticos para pruebas de rendimiento.
+
+    python manage.py seed_clinic --kinesiologists 50 --patients 20000 --appointments 1000000
+
+Crea kinesiólogos con horario semanal, duración de sesión y pausa propias,
+pacientes e historial de citas sin solapes (mezcla realista de estados) más
+algunas citas futuras con sus recordatorios; ~30% de las realizadas llevan
+nota de sesión. Todo por lotes (bulk_create; las citas con executemany) y una
+contraseña hasheada una sola vez. El resultado es determinista para un mismo
+--seed. --flush borra lo generado anteriormente.
+"""
+import random
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from doctors.models import Box, Kinesiologist, slot_template_key
+from scheduling.models import (
+    Appointment,
+    AppointmentReminder,
+    ArchivedAppointment,
+    Availability,
+    CalendarFeed,
+    SessionNote,
+)
+from scheduling.schedule import candidate_slots
+from users.models import Patient
+
+USERNAME_PREFIX = "seed-"
+PASSWORD = "seed-password"
+
+SPECIALTIES = ["Traumatología", "Neurología", "Respiratoria", "Deportiva", "Geriatría", "Pediatría"]
+FIRST_NAMES = ["Ana", "Benjamín", "Camila", "Diego", "Elena", "Felipe", "Gabriela", "Héctor",
+               "Isidora", "Joaquín", "Javiera", "Matías", "Sofía", "Tomás", "Valentina", "Vicente"]
+LAST_NAMES = ["González", "Muñoz", "Rojas", "Díaz", "Pérez", "Soto", "Contreras", "Silva",
+              "Martínez", "Sepúlveda", "Morales", "Rodríguez", "López", "Fuentes", "Araya"]
+
+# Bloques semanales posibles (inicio, término) y días de atención.
+SCHEDULES = [
+    ([0, 1, 2, 3, 4], [(dt_time(8, 0), dt_time(13, 0)), (dt_time(14, 0), dt_time(18, 0))]),
+    ([0, 1, 2, 3, 4], [(dt_time(9, 0), dt_time(13, 30)), (dt_time(15, 0), dt_time(19, 30))]),
+    ([0, 2, 4], [(dt_time(8, 0), dt_time(17, 0))]),
+    ([1, 3, 5], [(dt_time(9, 0), dt_time(14, 15))]),
+]
+
+# (duración de sesión, pausa) en minutos; cada kinesiólogo toma una.
+SESSIONS = [(45, 0), (45, 10), (30, 5), (60, 0), (40, 5)]
+
+PAST_STATUSES = (["completed", "cancelled", "confirmed", "pending"], [78, 15, 4, 3])
+FUTURE_STATUSES = (["pending", "confirmed", "cancelled"], [50, 45, 5])
+
+
+def _minutes_to_time(minutes):
+    return dt_time(minutes // 60, minutes % 60)
+
+
+class _AppointmentWriter:
+    """
+    Inserta citas por lotes con executemany. Con millones de filas, bulk_create
+    pasa la mayor parte del tiempo compilando el SQL valor por valor; aquí los
+    valores llegan ya adaptados y las columnas no informadas toman su default.
+    """
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.fields = [f for f in Appointment._meta.concrete_fields if not f.primary_key]
+        self.defaults = {
+            f.attname: self.adapt(f.attname, f.get_default()) for f in self.fields
+        }
+        columns = ", ".join(connection.ops.quote_name(f.column) for f in self.fields)
+        placeholders = ", ".join(["%s"] * len(self.fields))
+        self.sql = (
+            f"INSERT INTO {connection.ops.quote_name(Appointment._meta.db_table)} "
+            f"({columns}) VALUES ({placeholders})"
+        )
+        self.rows = []
+
+    def adapt(self, attname, value):
+        field = next(f for f in self.fields if f.attname == attname)
+        return field.get_db_prep_save(value, connection)
+
+    def add(self, values):
+        self.rows.append(tuple(
+            values[f.attname] if f.attname in values else self.defaults[f.attname]
+            for f in self.fields
+        ))
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            with connection.cursor() as cursor:
+                cursor.executemany(self.sql, self.rows)
+            self.rows = []
+
+
+class Command(BaseCommand):
+    help = "Genera kinesiólogos, pacientes, horarios e historial de citas sintéticos."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--kinesiologists", type=int, default=20)
+        parser.add_argument("--patients", type=int, default=1000)
+        parser.add_argument("--appointments", type=int, default=None,
+                            help="Citas históricas totales. Sin esto se usa --years.")
+        parser.add_argument("--years", type=float, default=2.0, help="Años de historial.")
+        parser.add_argument("--occupancy", type=float, default=0.7, help="Fracción de slots ocupados.")
+        parser.add_argument("--future-days", type=int, default=14)
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--anchor-date", type=date.fromisoformat, default=None,
+                            help="Fecha de referencia (YYYY-MM-DD) para historial y citas futuras. Por defecto, hoy.")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--tokens", action="store_true", help="Crea tokens de API para todos los usuarios.")
+        parser.add_argument("--flush", action="store_true", help="Borra antes los datos generados por este comando.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        started = time.perf_counter()
+
+        if options["flush"]:
+            self._flush()
+
+        with transaction.atomic():
+            password = make_password(PASSWORD)
+            kines = self._create_kinesiologists(options["kinesiologists"], password, rng)
+            schedules = self._create_availability(kines, rng)
+            patient_ids = self._create_patients(options["patients"], password, rng)
+            if options["tokens"]:
+                self._create_tokens()
+            total = self._create_appointments(kines, schedules, patient_ids, options, rng)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(kines)} kinesiólogos, {len(patient_ids)} pacientes y {total} citas "
+            f"generados en {time.perf_counter() - started:.1f}s (contraseña: {PASSWORD})."
+        ))
+
+    def _flush(self):
+        seeded = User.objects.filter(username__startswith=USERNAME_PREFIX)
+        for model in (Appointment, ArchivedAppointment):
+            ids = model.objects.filter(
+                Q(kinesiologist__user__in=seeded) | Q(patient_name__user__in=seeded)
+            ).values("id")
+            SessionNote.objects.filter(appointment_id__in=ids).delete()
+            AppointmentReminder.objects.filter(appointment_id__in=ids).delete()
+        Appointment.objects.filter(kinesiologist__user__in=seeded).delete()
+        Appointment.objects.filter(patient_name__user__in=seeded).delete()
+        ArchivedAppointment.objects.filter(kinesiologist__user__in=seeded).delete()
+        ArchivedAppointment.objects.filter(patient_name__user__in=seeded).delete()
+        Availability.objects.filter(kinesiologist__user__in=seeded).delete()
+        Kinesiologist.objects.filter(user__in=seeded).delete()
+        Box.objects.filter(name__startswith="S-", kinesiologists__isnull=True).delete()
+        Patient.objects.filter(user__in=seeded).delete()
+        Token.objects.filter(user__in=seeded).delete()
+        seeded.delete()
+
+    def _create_users(self, kind, count, password, rng):
+        users = []
+        for i in range(count):
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            email = f"{USERNAME_PREFIX}{kind}-{i}@example.com"
+            users.append(User(username=email, email=email, first_name=first, last_name=last, password=password))
+        return User.objects.bulk_create(users, batch_size=self.batch_size)
+
+    def _create_kinesiologists(self, count, password, rng):
+        users = self._create_users("kine", count, password, rng)
+        # Un box propio por kinesiólogo: las citas generadas no chocan por box.
+        Box.objects.bulk_create(
+            [Box(name=f"S-{i}") for i in range(len(users))], batch_size=self.batch_size, ignore_conflicts=True
+        )
+        sessions = [rng.choice(SESSIONS) for _ in users]
+        return Kinesiologist.objects.bulk_create([
+            Kinesiologist(
+                user=user,
+                name=user.get_full_name(),
+                rut=f"S-K-{i}",
+                specialty=rng.choice(SPECIALTIES),
+                phone_number=f"9{rng.randrange(10**8):08d}",
+                box_id=f"S-{i}",
+                description="Kinesiólogo generado para pruebas de carga.",
+                image_url="",
+                session_minutes=sessions[i][0],
+                buffer_minutes=sessions[i][1],
+            )
+            for i, user in enumerate(users)
+        ], batch_size=self.batch_size)
+
+    def _create_availability(self, kines, rng):
+        """
+        Crea el horario semanal y devuelve {kine_id: {día: [(inicio, término)]}}
+        con los slots de cada kinesiólogo según su sesión y su pausa.
+        """
+        rows = []
+        schedules = {}
+        for kine in kines:
+            days, blocks = rng.choice(SCHEDULES)
+            slots = candidate_slots(blocks, kine.session_minutes, kine.buffer_minutes)
+            schedules[kine.id] = {day: slots for day in days}
+            rows.extend(
+                Availability(kinesiologist=kine, day=day, start_time=start, end_time=end)
+                for day in days
+                for start, end in blocks
+            )
+        Availability.objects.bulk_create(rows, batch_size=self.batch_size)
+        # bulk_create no pasa por save(): las plantillas de slots se descartan aquí.
+        cache.delete_many([slot_template_key(kine.id) for kine in kines])
+        return schedules
+
+    def _create_patients(self, count, password, rng):
+        users = self._create_users("patient", count, password, rng)
+        patients = Patient.objects.bulk_create([
+            Patient(
+                user=user,
+                name=user.get_full_name(),
+                rut=f"S-P-{i}",
+                diagnostic=rng.choice(["Lumbago", "Esguince de tobillo", "Tendinitis", "Post operatorio", ""]),
+                phone_number=f"9{rng.randrange(10**8):08d}",
+            )
+            for i, user in enumerate(users)
+        ], batch_size=self.batch_size)
+        return [p.id for p in patients]
+
+    def _create_tokens(self):
+        users = User.objects.filter(username__startswith=USERNAME_PREFIX, auth_token__isnull=True)
+        Token.objects.bulk_create(
+            [Token(user_id=user_id, key=Token.generate_key()) for user_id in users.values_list("id", flat=True)],
+            batch_size=self.batch_size,
+        )
+
+    def _create_appointments(self, kines, schedules, patient_ids, options, rng):
+        """
+        Recorre el calendario hacia atrás (historial) y hacia adelante (futuras)
+        llenando slots del horario semanal; como los slots de un kinesiólogo no
+        se solapan, tampoco lo hacen sus citas.
+        """
+        if not kines or not patient_ids:
+            return 0
+
+        today = options["anchor_date"] or timezone.localdate()
+        occupancy = options["occupancy"]
+        target = options["appointments"]
+        per_kine = None if target is None else -(-target // len(kines))
+        max_days = int(options["years"] * 365) if target is None else None
+        past_statuses, past_weights = PAST_STATUSES
+        future_statuses, future_weights = FUTURE_STATUSES
+
+        writer = _AppointmentWriter(self.batch_size)
+        first_id = (Appointment.objects.order_by("-id").values_list("id", flat=True).first() or 0) + 1
+        times = {}
+        total = 0
+        history = 0
+
+        def adapted_time(minutes):
+            if minutes not in times:
+                times[minutes] = writer.adapt("start_time", _minutes_to_time(minutes))
+            return times[minutes]
+
+        def add(kine, day, slot, statuses, weights):
+            nonlocal total
+            status = rng.choices(statuses, weights)[0]
+            writer.add({
+                "kinesiologist_id": kine.id,
+                "box_id": kine.box_id,
+                "patient_name_id": patient_ids[rng.randrange(len(patient_ids))],
+                "date": day,
+                "start_time": adapted_time(slot[0]),
+                "end_time": adapted_time(slot[1]),
+                "status": status,
+            })
+            total += 1
+
+        for kine in kines:
+            week = schedules[kine.id]
+            created = 0
+            offset = 0
+            while week:
+                offset += 1
+                if max_days is not None and offset > max_days:
+                    break
+                if per_kine is not None and (created >= per_kine or history >= target):
+                    break
+                day = today - timedelta(days=offset)
+                adapted_day = writer.adapt("date", day)
+                for slot in week.get(day.weekday(), ()):
+                    if rng.random() < occupancy:
+                        add(kine, adapted_day, slot, past_statuses, past_weights)
+                        created += 1
+                        history += 1
+                        if per_kine is not None and (created >= per_kine or history >= target):
+                            break
+
+            for offset in range(1, options["future_days"] + 1):
+                day = today + timedelta(days=offset)
+                for slot in week.get(day.weekday(), ()):
+                    if rng.random() < occupancy / 2:
+                        add(kine, writer.adapt("date", day), slot, future_statuses, future_weights)
+
+        writer.flush()
+        self._create_notes(first_id)
+        self._create_reminders(first_id)
+        # Las citas no pasaron por save(): los feeds se marcan a mano.
+        CalendarFeed.touch(kinesiologist_ids=[kine.id for kine in kines], patient_ids=patient_ids)
+        return total
+
+    def _create_reminders(self, first_id):
+        """
+        Recordatorios de las citas abiertas recién creadas que aún no ocurren,
+        con los mismos niveles que AppointmentReminder.schedule.
+        """
+        now = timezone.now()
+        appointments = (
+            Appointment.objects
+            .filter(id__gte=first_id, status__in=Appointment.OPEN_STATUSES, date__gte=timezone.localdate())
+            .values_list("id", "date", "start_time")
+        )
+        reminders = []
+        for appointment_id, day, start in appointments:
+            starts_at = timezone.make_aware(datetime.combine(day, start))
+            reminders.extend(
+                AppointmentReminder(appointment_id=appointment_id, tier=tier, remind_at=starts_at - offset)
+                for tier, offset in settings.REMINDER_TIERS.items()
+                if starts_at - offset > now
+            )
+        AppointmentReminder.objects.bulk_create(reminders, batch_size=self.batch_size)
+
+    def _create_notes(self, first_id):
+        """Nota (versión 1) para ~30% de las citas realizadas recién creadas, con un INSERT ... SELECT."""
+        qn = connection.ops.quote_name
+        note_table = qn(SessionNote._meta.db_table)
+        created_at = SessionNote._meta.get_field("created_at").get_db_prep_save(timezone.now(), connection)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {note_table} ({qn('appointment_id')}, {qn('version')}, {qn('text')}, {qn('created_at')}) "
+                f"SELECT {qn('id')}, 1, %s, %s FROM {qn(Appointment._meta.db_table)} "
+                f"WHERE {qn('id')} >= %s AND {qn('status')} = %s AND {qn('id')} %% 10 < 3",
+                ["Sesión realizada sin novedades.", created_at, first_id, "completed"],
+            )
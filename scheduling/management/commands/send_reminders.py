@@ -0,0 +1,31 @@
+"""
+Worker de recordatorios de citas (REMINDER_TIERS antes de cada una).
+
+    python manage.py send_reminders                  # vacía la cola de vencidos y termina (cron)
+    python manage.py send_reminders --loop --interval 30
+
+Se pueden correr varios a la vez: cada recordatorio lo toma un solo worker.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from scheduling.reminders import send_all_due
+
+
+class Command(BaseCommand):
+    help = "Envía por lotes los recordatorios de citas vencidos."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None, help="Por defecto, REMINDER_BATCH_SIZE.")
+        parser.add_argument("--loop", action="store_true", help="Sigue consultando cada --interval segundos.")
+        parser.add_argument("--interval", type=float, default=30.0)
+
+    def handle(self, *args, **options):
+        while True:
+            sent, dropped = send_all_due(options["batch_size"])
+            if sent or dropped or not options["loop"]:
+                self.stdout.write(f"{sent} recordatorios enviados, {dropped} descartados.")
+            if not options["loop"]:
+                return
+            time.sleep(options["interval"])
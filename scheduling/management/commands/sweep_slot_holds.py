@@ -0,0 +1,19 @@
+"""
+Borra las retenciones de horario vencidas (las consultas ya las ignoran).
+
+    python manage.py sweep_slot_holds
+"""
+from django.core.management.base import BaseCommand
+
+from scheduling.holds import sweep_expired
+
+
+class Command(BaseCommand):
+    help = "Borra por lotes las retenciones de horario vencidas."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        total = sweep_expired(options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"{total} retenciones vencidas borradas."))
@@ -0,0 +1,113 @@
+"""
+Visor local de las trazas de TRACING_LOG (ver clinic_backend/tracing.py).
+
+    python manage.py traces list [--limit 20] [--view AppointmentCreateView]
+    python manage.py traces show <trace_id>
+    python manage.py traces export <trace_id>... --output trazas.json   # chrome://tracing, ui.perfetto.dev
+"""
+import json
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def _read_spans():
+    path = Path(settings.TRACING_LOG)
+    # Incluye los archivos rotados (traces.jsonl.1, .2, ...).
+    files = sorted(path.parent.glob(path.name + ".*"), reverse=True) + [path]
+    traces = defaultdict(list)
+    for file in files:
+        if not file.exists():
+            continue
+        with file.open(encoding="utf-8") as lines:
+            for line in lines:
+                if line.strip():
+                    record = json.loads(line)
+                    traces[record["trace_id"]].append(record)
+    return traces
+
+
+def _root(spans):
+    ids = {s["span_id"] for s in spans}
+    return next((s for s in spans if s["parent_id"] not in ids), spans[0])
+
+
+class Command(BaseCommand):
+    help = "Lista, muestra como árbol y exporta al formato de Chrome las trazas registradas."
+
+    def add_arguments(self, parser):
+        actions = parser.add_subparsers(dest="action", required=True)
+
+        listing = actions.add_parser("list", help="Trazas más recientes.")
+        listing.add_argument("--limit", type=int, default=20)
+        listing.add_argument("--view", help="Filtra por nombre (parcial) de la vista.")
+
+        show = actions.add_parser("show", help="Árbol de spans de una traza.")
+        show.add_argument("trace_id")
+
+        export = actions.add_parser("export", help="Trace Event Format (chrome://tracing, Perfetto).")
+        export.add_argument("trace_ids", nargs="*", help="Sin ids se exportan todas.")
+        export.add_argument("--output", required=True)
+
+    def handle(self, *args, **options):
+        getattr(self, f"_{options['action']}")(options, _read_spans())
+
+    def _list(self, options, traces):
+        roots = sorted((_root(spans) for spans in traces.values()), key=lambda s: s["start"], reverse=True)
+        if options["view"]:
+            roots = [r for r in roots if options["view"] in r["attributes"].get("view", r["name"])]
+        for root in roots[: options["limit"]]:
+            status = root["attributes"].get("http.status_code", "-")
+            self.stdout.write(
+                f"{root['trace_id']}  {root['start'][:19]}  {root['duration_ms']:>9.1f} ms  "
+                f"{status}  {len(traces[root['trace_id']]):>3} spans  {root['name']}"
+            )
+
+    def _show(self, options, traces):
+        spans = traces.get(options["trace_id"])
+        if not spans:
+            raise CommandError(f"No existe la traza {options['trace_id']}.")
+
+        children = defaultdict(list)
+        for s in spans:
+            children[s["parent_id"]].append(s)
+        root = _root(spans)
+        root_start = datetime.fromisoformat(root["start"])
+
+        def write(node, depth):
+            offset = (datetime.fromisoformat(node["start"]) - root_start).total_seconds() * 1000
+            detail = node["attributes"].get("db.statement") or ""
+            error = f"  ERROR {node['error']}" if node["error"] else ""
+            self.stdout.write(
+                f"{offset:>8.1f} ms {node['duration_ms']:>8.1f} ms  {'  ' * depth}{node['name']}"
+                f"{'  ' + detail[:100] if detail else ''}{error}"
+            )
+            for child in sorted(children[node["span_id"]], key=lambda s: s["start"]):
+                write(child, depth + 1)
+
+        write(root, 0)
+
+    def _export(self, options, traces):
+        ids = options["trace_ids"] or list(traces)
+        missing = [trace_id for trace_id in ids if trace_id not in traces]
+        if missing:
+            raise CommandError(f"No existen las trazas: {', '.join(missing)}")
+
+        events = []
+        for pid, trace_id in enumerate(ids, start=1):
+            for s in traces[trace_id]:
+                events.append({
+                    "name": s["name"],
+                    "cat": s["name"].split(".")[0],
+                    "ph": "X",
+                    "ts": datetime.fromisoformat(s["start"]).timestamp() * 1_000_000,
+                    "dur": s["duration_ms"] * 1000,
+                    "pid": pid,
+                    "tid": 1,
+                    "args": {**s["attributes"], "trace_id": trace_id, "error": s["error"]},
+                })
+        Path(options["output"]).write_text(json.dumps({"traceEvents": events}, ensure_ascii=False))
+        self.stdout.write(self.style.SUCCESS(f"{len(ids)} trazas exportadas a {options['output']}"))
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0004_kinesiologist_description'),
+        ('scheduling', '0002_appointment_comment_updated_at_and_more'),
+        ('users', '0002_remove_patient_email'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedAppointment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('status', models.CharField(choices=[('pending', 'Pendiente'), ('confirmed', 'Confirmada'), ('cancelled', 'Cancelada'), ('completed', 'Realizada')], max_length=20)),
+                ('kine_comment', models.TextField(blank=True, null=True)),
+                ('comment_updated_at', models.DateTimeField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('kinesiologist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_appointments', to='doctors.kinesiologist')),
+                ('patient_name', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_appointments', to='users.patient')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['patient_name', '-date', '-start_time'], name='archived_patient_history')],
+            },
+        ),
+    ]
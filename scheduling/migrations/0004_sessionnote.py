@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:50
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def copy_comments_to_notes(apps, schema_editor):
+    """Cada kine_comment existente pasa a ser la versión 1 de la nota de su cita."""
+    SessionNote = apps.get_model("scheduling", "SessionNote")
+    now = django.utils.timezone.now()
+    for model_name in ("Appointment", "ArchivedAppointment"):
+        model = apps.get_model("scheduling", model_name)
+        rows = (
+            model.objects
+            .exclude(kine_comment__isnull=True)
+            .exclude(kine_comment="")
+            .values_list("id", "kine_comment", "comment_updated_at")
+            .iterator(chunk_size=2000)
+        )
+        batch = []
+        for appointment_id, text, updated_at in rows:
+            batch.append(SessionNote(appointment_id=appointment_id, version=1, text=text, created_at=updated_at or now))
+            if len(batch) >= 2000:
+                SessionNote.objects.bulk_create(batch)
+                batch = []
+        SessionNote.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduling', '0003_archivedappointment'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SessionNote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField()),
+                ('text', models.TextField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('appointment', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='notes', to='scheduling.appointment')),
+                ('author', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('appointment', 'version'), name='unique_session_note_version')],
+            },
+        ),
+        migrations.RunPython(copy_comments_to_notes, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='appointment',
+            name='comment_updated_at',
+        ),
+        migrations.RemoveField(
+            model_name='appointment',
+            name='kine_comment',
+        ),
+        migrations.RemoveField(
+            model_name='archivedappointment',
+            name='comment_updated_at',
+        ),
+        migrations.RemoveField(
+            model_name='archivedappointment',
+            name='kine_comment',
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduling', '0005_calendarfeed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='archivedappointment',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0004_kinesiologist_description'),
+        ('scheduling', '0006_appointment_version'),
+        ('users', '0002_remove_patient_email'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='appointment',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pendiente'), ('confirmed', 'Confirmada'), ('cancelled', 'Cancelada'), ('completed', 'Realizada'), ('no_show', 'No asistió')], default='pending', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='archivedappointment',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pendiente'), ('confirmed', 'Confirmada'), ('cancelled', 'Cancelada'), ('completed', 'Realizada'), ('no_show', 'No asistió')], max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['status', 'date'], name='appointment_status_date'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0004_kinesiologist_description'),
+        ('scheduling', '0008_appointmentreminder'),
+        ('users', '0002_remove_patient_email'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlotHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('expires_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('kinesiologist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_holds', to='doctors.kinesiologist')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_holds', to='users.patient')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kinesiologist', 'date', 'expires_at'], name='slothold_lookup'), models.Index(fields=['expires_at'], name='slothold_expiry')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0004_kinesiologist_description'),
+        ('scheduling', '0009_slothold'),
+        ('users', '0002_remove_patient_email'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WaitlistEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_from', models.DateField()),
+                ('date_until', models.DateField()),
+                ('window_start', models.TimeField()),
+                ('window_end', models.TimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('offered_at', models.DateTimeField(blank=True, null=True)),
+                ('kinesiologist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to='doctors.kinesiologist')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to='users.patient')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('offered_at__isnull', True)), fields=['kinesiologist', 'date_until', 'date_from'], name='waitlist_match')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0004_kinesiologist_description'),
+        ('scheduling', '0010_waitlistentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduleException',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('blocked', 'Bloqueo'), ('extra', 'Horas extra')], default='blocked', max_length=10)),
+                ('date_from', models.DateField()),
+                ('date_until', models.DateField()),
+                ('start_time', models.TimeField(blank=True, null=True)),
+                ('end_time', models.TimeField(blank=True, null=True)),
+                ('reason', models.CharField(blank=True, max_length=120)),
+                ('kinesiologist', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='schedule_exceptions', to='doctors.kinesiologist')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kinesiologist', 'date_until', 'date_from'], name='exception_lookup')],
+            },
+        ),
+    ]
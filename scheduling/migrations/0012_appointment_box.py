@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_box(apps, schema_editor):
+    """Las citas existentes ocupan el box actual de su kinesiólogo."""
+    Kinesiologist = apps.get_model("doctors", "Kinesiologist")
+    for name in ("Appointment", "ArchivedAppointment"):
+        apps.get_model("scheduling", name).objects.update(
+            box_id=Subquery(Kinesiologist.objects.filter(id=OuterRef("kinesiologist_id")).values("box")[:1])
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0006_box'),
+        ('scheduling', '0011_scheduleexception'),
+        ('users', '0002_remove_patient_email'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='box',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='appointments', to='doctors.box', to_field='name'),
+        ),
+        migrations.AddField(
+            model_name='archivedappointment',
+            name='box',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='archived_appointments', to='doctors.box', to_field='name'),
+        ),
+        migrations.RunPython(fill_box, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['box', 'date', 'start_time'], name='appointment_box_date'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:17
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0006_box'),
+        ('scheduling', '0012_appointment_box'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SessionType',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=60)),
+                ('capacity', models.PositiveSmallIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(50)])),
+                ('kinesiologist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='session_types', to='doctors.kinesiologist')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='session_type',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='appointments', to='scheduling.sessiontype'),
+        ),
+        migrations.AddField(
+            model_name='archivedappointment',
+            name='session_type',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='archived_appointments', to='scheduling.sessiontype'),
+        ),
+        migrations.CreateModel(
+            name='GroupSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('capacity', models.PositiveSmallIntegerField()),
+                ('booked', models.PositiveSmallIntegerField(default=0)),
+                ('kinesiologist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='group_slots', to='doctors.kinesiologist')),
+                ('session_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='group_slots', to='scheduling.sessiontype')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kinesiologist', 'date', 'start_time'), name='unique_group_slot')],
+            },
+        ),
+    ]
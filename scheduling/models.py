@@ -1,7 +1,19 @@
-from django.db import models
-from doctors.models import Kinesiologist
+import secrets
+from datetime import datetime, time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, F, Max, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from doctors.models import Box, Kinesiologist, invalidate_slot_template
 from users.models import Patient
 from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator, MinValueValidator
+
+from clinic_backend.db_router import use_primary
+from clinic_backend.tracing import span
 
 
 class Availability(models.Model):
@@ -27,6 +39,78 @@ class Availability(models.Model):
     def __str__(self):
         return f"{self.kinesiologist} - {self.get_day_display()} {self.start_time} - {self.end_time}"
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        invalidate_slot_template(self.kinesiologist_id)
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        invalidate_slot_template(self.kinesiologist_id)
+        return result
+
+
+class ScheduleException(models.Model):
+    """
+    Cambio del horario semanal en un rango de fechas: bloqueo (vacaciones,
+    feriado, trámite) o horas extra. Sin kinesiólogo aplica a toda la
+    clínica (feriados). Un bloqueo sin horas cubre el día completo; los
+    bloqueos mandan sobre las horas extra. Las citas ya agendadas no se tocan.
+    Ver scheduling/schedule.py.
+    """
+
+    BLOCKED = "blocked"
+    EXTRA = "extra"
+    KIND_CHOICES = [
+        (BLOCKED, "Bloqueo"),
+        (EXTRA, "Horas extra"),
+    ]
+
+    kinesiologist = models.ForeignKey(
+        Kinesiologist,
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        related_name="schedule_exceptions"
+    )
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default=BLOCKED)
+    date_from = models.DateField()
+    date_until = models.DateField()
+    start_time = models.TimeField(null=True, blank=True)
+    end_time = models.TimeField(null=True, blank=True)
+    reason = models.CharField(max_length=120, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["kinesiologist", "date_until", "date_from"], name="exception_lookup"),
+        ]
+
+    def __str__(self):
+        who = self.kinesiologist or "Clínica"
+        return f"{who} - {self.get_kind_display()} {self.date_from} - {self.date_until}"
+
+
+class SessionType(models.Model):
+    """
+    Tipo de sesión de un kinesiólogo. Con capacity > 1 es grupal (pilates,
+    rehabilitación en grupo): varios pacientes reservan el mismo horario y
+    los cupos se cuentan en GroupSlot.
+    """
+
+    kinesiologist = models.ForeignKey(
+        Kinesiologist,
+        on_delete=models.CASCADE,
+        related_name="session_types"
+    )
+    name = models.CharField(max_length=60)
+    capacity = models.PositiveSmallIntegerField(default=1, validators=[MinValueValidator(1), MaxValueValidator(50)])
+
+    def __str__(self):
+        return f"{self.name} ({self.kinesiologist})"
+
+    @property
+    def is_group(self):
+        return self.capacity > 1
+
 
 class Appointment(models.Model):
 
@@ -35,6 +119,7 @@ class Appointment(models.Model):
         ("confirmed", "Confirmada"),
         ("cancelled", "Cancelada"),
         ("completed", "Realizada"),
+        ("no_show", "No asistió"),
     ]
 
     kinesiologist = models.ForeignKey(
@@ -57,47 +142,479 @@ class Appointment(models.Model):
         choices=STATUS_CHOICES,
         default="pending"
     )
-
-    
-    kine_comment = models.TextField(
+    # Se incrementa con cada cambio de estado (ver scheduling/transitions.py).
+    version = models.PositiveIntegerField(default=1)
+    # Box que ocupa la sesión: el del kinesiólogo al reservar.
+    box = models.ForeignKey(
+        Box,
+        to_field="name",
+        null=True,
         blank=True,
-        null=True
+        on_delete=models.PROTECT,
+        related_name="appointments"
     )
-
-    
-    comment_updated_at = models.DateTimeField(
+    # Sesión grupal a la que pertenece la cita (None: individual).
+    session_type = models.ForeignKey(
+        SessionType,
+        null=True,
         blank=True,
-        null=True
+        on_delete=models.PROTECT,
+        related_name="appointments"
     )
 
+    class Meta:
+        indexes = [
+            # Barridos por estado y fecha: close_stale_appointments, archivo.
+            models.Index(fields=["status", "date"], name="appointment_status_date"),
+            # Ocupación de un box en una fecha (solapes entre kinesiólogos).
+            models.Index(fields=["box", "date", "start_time"], name="appointment_box_date"),
+        ]
+
     def __str__(self):
         return f"{self.patient_name} - {self.date} {self.start_time}"
 
     def clean(self):
-      
-        day_of_week = self.date.weekday()
-
-        availability = Availability.objects.filter(
-            kinesiologist=self.kinesiologist,
-            day=day_of_week,
-            start_time__lte=self.start_time,
-            end_time__gte=self.end_time
-        )
+        with span("appointment.clean"):
+            self._check_schedule()
+
+    def _check_schedule(self):
+        from .schedule import fits, from_minutes, schedule_between, to_minutes
 
-        if not availability.exists():
+        template, plan = schedule_between(self.kinesiologist_id, self.date, self.date)
+        windows = plan[self.date][0] if self.date in plan else []
+        if not fits(windows, self.start_time, self.end_time):
             raise ValidationError("La cita está fuera del horario disponible del kinesiólogo.")
 
-        
-        overlapping = Appointment.objects.filter(
-            kinesiologist=self.kinesiologist,
-            date=self.date,
-            start_time__lt=self.end_time,   
-            end_time__gt=self.start_time    
-        ).exclude(id=self.id)
+        # Duración y pausa del kinesiólogo se exigen a las reservas nuevas: las
+        # citas existentes siguen guardándose aunque él cambie su configuración.
+        start, end = to_minutes(self.start_time), to_minutes(self.end_time)
+        buffer = 0
+        if self._state.adding:
+            if end - start != template["session"]:
+                raise ValidationError(f"La sesión debe durar {template['session']} minutos.")
+            buffer = template["buffer"]
+
+        # Una sola consulta para el kinesiólogo y su box; una cita cancelada
+        # libera su horario.
+        occupied = Q(kinesiologist_id=self.kinesiologist_id)
+        if self.box_id:
+            occupied |= Q(box_id=self.box_id)
+        overlapping = (
+            Appointment.objects.filter(
+                occupied,
+                date=self.date,
+                start_time__lt=from_minutes(end + buffer) if end + buffer < 24 * 60 else time.max,
+                end_time__gt=from_minutes(start - buffer) if start > buffer else time.min,
+            )
+            .exclude(id=self.id)
+            .exclude(status="cancelled")
+        )
+        if self.session_type_id and self.session_type.is_group:
+            # Los compañeros de la misma sesión grupal no chocan: los cupos
+            # se controlan en GroupSlot.
+            overlapping = overlapping.exclude(
+                kinesiologist_id=self.kinesiologist_id,
+                session_type_id=self.session_type_id,
+                start_time=self.start_time,
+                end_time=self.end_time,
+            )
+        clash = (
+            overlapping
+            .values_list("kinesiologist_id", flat=True)
+            .first()
+        )
 
-        if overlapping.exists():
+        if clash == self.kinesiologist_id:
             raise ValidationError("Este horario ya está ocupado.")
+        if clash is not None:
+            raise ValidationError(f"El box {self.box_id} está ocupado en este horario.")
+
+    OPEN_STATUSES = ("pending", "confirmed")
 
     def save(self, *args, **kwargs):
+        if self._state.adding and self.box_id is None:
+            self.box_id = self.kinesiologist.box_id
         self.clean()
+        adding = self._state.adding
+        with span("appointment.insert" if adding else "appointment.update"):
+            super().save(*args, **kwargs)
+        CalendarFeed.touch([self.kinesiologist_id], [self.patient_name_id])
+
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or {"date", "start_time", "status"} & set(update_fields):
+            AppointmentReminder.schedule(self, replace=not adding)
+
+    def starts_at(self):
+        return timezone.make_aware(datetime.combine(self.date, self.start_time))
+
+
+class ArchivedAppointment(models.Model):
+    """
+    Citas realizadas o canceladas antiguas, movidas fuera de Appointment por
+    `manage.py archive_appointments`. Conservan el id original (para poder
+    restaurarlas) y declaran los campos en el mismo orden que Appointment:
+    el historial del paciente lee ambas tablas con un UNION.
+    """
+
+    ARCHIVABLE_STATUSES = ("completed", "cancelled", "no_show")
+
+    id = models.BigIntegerField(primary_key=True)
+    kinesiologist = models.ForeignKey(
+        Kinesiologist,
+        on_delete=models.CASCADE,
+        related_name="archived_appointments"
+    )
+    patient_name = models.ForeignKey(
+        Patient,
+        related_name="archived_appointments",
+        on_delete=models.CASCADE
+    )
+    date = models.DateField()
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    status = models.CharField(max_length=20, choices=Appointment.STATUS_CHOICES)
+    version = models.PositiveIntegerField(default=1)
+    box = models.ForeignKey(
+        Box,
+        to_field="name",
+        null=True,
+        blank=True,
+        on_delete=models.PROTECT,
+        related_name="archived_appointments"
+    )
+    session_type = models.ForeignKey(
+        SessionType,
+        null=True,
+        blank=True,
+        on_delete=models.PROTECT,
+        related_name="archived_appointments"
+    )
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["patient_name", "-date", "-start_time"], name="archived_patient_history"),
+        ]
+
+    def __str__(self):
+        return f"{self.patient_name} - {self.date} {self.start_time} (archivada)"
+
+
+class SessionNoteQuerySet(models.QuerySet):
+    def latest_for(self, appointment_ids):
+        """Última versión de la nota de cada cita, en una sola consulta: {appointment_id: nota}."""
+        latest_version = (
+            SessionNote.objects
+            .filter(appointment_id=OuterRef("appointment_id"))
+            .order_by("-version")
+            .values("version")[:1]
+        )
+        notes = self.filter(appointment_id__in=list(appointment_ids), version=Subquery(latest_version))
+        return {note.appointment_id: note for note in notes}
+
+    def attach_latest(self, appointments):
+        """Deja en cada cita `latest_note` (o None). Recibe una lista ya evaluada."""
+        notes = self.latest_for(a.id for a in appointments) if appointments else {}
+        for appointment in appointments:
+            appointment.latest_note = notes.get(appointment.id)
+        return appointments
+
+
+class SessionNote(models.Model):
+    """
+    Notas clínicas de una sesión. Solo se agregan: cada edición es una nueva
+    versión y las anteriores quedan como historial.
+
+    La FK no crea constraint en la base: al archivar una cita se conserva su id
+    y sus notas siguen apuntando a ella en ArchivedAppointment.
+    """
+
+    appointment = models.ForeignKey(
+        Appointment,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name="notes"
+    )
+    version = models.PositiveIntegerField()
+    text = models.TextField()
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="+"
+    )
+    created_at = models.DateTimeField(default=timezone.now)
+
+    objects = SessionNoteQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["appointment", "version"], name="unique_session_note_version"),
+        ]
+
+    def __str__(self):
+        return f"Nota v{self.version} de la cita {self.appointment_id}"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Las notas de sesión no se modifican: agregue una nueva versión.")
         super().save(*args, **kwargs)
+
+    @classmethod
+    def append(cls, appointment, text, author=None):
+        """Agrega una nueva versión de la nota. Reintenta si otra versión se guardó a la vez."""
+        for attempt in range(3):
+            try:
+                with transaction.atomic():
+                    last = cls.objects.filter(appointment=appointment).aggregate(last=Max("version"))["last"]
+                    return cls.objects.create(
+                        appointment=appointment, version=(last or 0) + 1, text=text, author=author
+                    )
+            except IntegrityError:
+                if attempt == 2:
+                    raise
+
+
+class CalendarFeed(models.Model):
+    """
+    Secreto del feed iCalendar de un usuario (kinesiólogo o paciente): la URL
+    /api/calendar/<secret>.ics se suscribe sin token.
+
+    Cada cambio de citas marca en cache la hora del cambio por kinesiólogo y
+    por paciente (touch); el feed usa esa marca como ETag/Last-Modified y solo
+    se regenera cuando cambia. Con varios procesos, CACHES debe ser compartido.
+    """
+
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="calendar_feed")
+    secret = models.CharField(max_length=64, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Feed de {self.user}"
+
+    @staticmethod
+    def new_secret():
+        return secrets.token_urlsafe(32)
+
+    @classmethod
+    def for_user(cls, user, rotate=False):
+        feed = cls.objects.filter(user=user).first()
+        if feed is None:
+            # Un solo INSERT, sin get_or_create (y su savepoint): las vistas
+            # corren en autocommit. Si otra petición lo creó a la vez, se lee el suyo.
+            try:
+                return cls.objects.create(user=user, secret=cls.new_secret())
+            except IntegrityError:
+                with use_primary():
+                    return cls.objects.get(user=user)
+        if rotate:
+            feed.secret = cls.new_secret()
+            feed.save(update_fields=["secret"])
+        return feed
+
+    @staticmethod
+    def changed_key(kind, owner_id):
+        return f"ical:changed:{kind}:{owner_id}"
+
+    @classmethod
+    def touch(cls, kinesiologist_ids=(), patient_ids=()):
+        """Marca como modificados los feeds de esos kinesiólogos y pacientes."""
+        now = timezone.now()
+        keys = [cls.changed_key("kine", i) for i in set(kinesiologist_ids)]
+        keys += [cls.changed_key("patient", i) for i in set(patient_ids)]
+        if keys:
+            cache.set_many({key: now for key in keys}, timeout=None)
+
+    @classmethod
+    def changed_at(cls, kind, owner_id):
+        """Último cambio conocido; sin marca (cache vacío) se toma el momento actual."""
+        key = cls.changed_key(kind, owner_id)
+        changed = cache.get(key)
+        if changed is None:
+            changed = timezone.now().replace(microsecond=0)
+            cache.add(key, changed, timeout=None)
+            changed = cache.get(key, changed)
+        return changed
+
+
+class AppointmentReminder(models.Model):
+    """
+    Recordatorios pendientes por cita y nivel (REMINDER_TIERS, p. ej. 24h y
+    2h antes). `remind_at` se precalcula al agendar o reagendar y el worker
+    (`manage.py send_reminders`) solo lee las filas vencidas sin enviar, por
+    el índice parcial `reminder_due`.
+
+    Como SessionNote, la FK no crea constraint: al archivar una cita sus
+    recordatorios se borran explícitamente.
+    """
+
+    appointment = models.ForeignKey(
+        Appointment,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name="reminders"
+    )
+    tier = models.CharField(max_length=10)
+    remind_at = models.DateTimeField()
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["appointment", "tier"], name="unique_reminder_tier"),
+        ]
+        indexes = [
+            models.Index(fields=["remind_at"], condition=models.Q(sent_at__isnull=True), name="reminder_due"),
+        ]
+
+    def __str__(self):
+        return f"Recordatorio {self.tier} de la cita {self.appointment_id}"
+
+    @classmethod
+    def schedule(cls, appointment, replace=True):
+        """
+        Crea los recordatorios futuros de una cita abierta. Con `replace`
+        (reagendamiento o cambio de estado) borra antes los anteriores.
+        """
+        if replace:
+            cls.drop([appointment.id])
+        if appointment.status not in Appointment.OPEN_STATUSES:
+            return []
+        now = timezone.now()
+        starts_at = appointment.starts_at()
+        reminders = [
+            cls(appointment_id=appointment.id, tier=tier, remind_at=starts_at - offset)
+            for tier, offset in settings.REMINDER_TIERS.items()
+            if starts_at - offset > now
+        ]
+        return cls.objects.bulk_create(reminders) if reminders else []
+
+    @classmethod
+    def drop(cls, appointment_ids):
+        """Borra los recordatorios (enviados o no) de esas citas."""
+        return cls.objects.filter(appointment_id__in=list(appointment_ids)).delete()[0]
+
+
+class SlotHold(models.Model):
+    """
+    Reserva temporal de un horario mientras el paciente completa la reserva
+    (SLOT_HOLD_SECONDS). Las retenciones vigentes de otros pacientes no se
+    ofrecen en los slots ni se pueden reservar; al reservar, la del propio
+    paciente se consume. Las vencidas se ignoran en las consultas, se borran
+    al crear una nueva retención en ese día y `manage.py sweep_slot_holds`
+    limpia el resto.
+    """
+
+    kinesiologist = models.ForeignKey(Kinesiologist, on_delete=models.CASCADE, related_name="slot_holds")
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name="slot_holds")
+    date = models.DateField()
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["kinesiologist", "date", "expires_at"], name="slothold_lookup"),
+            models.Index(fields=["expires_at"], name="slothold_expiry"),
+        ]
+
+    def __str__(self):
+        return f"Retención {self.date} {self.start_time} ({self.patient})"
+
+
+class WaitlistEntry(models.Model):
+    """
+    Paciente esperando un horario con un kinesiólogo entre dos fechas y dentro
+    de una franja horaria. Cuando se cancela una cita que calza, el primero
+    inscrito recibe una retención (SlotHold) y un correo, y la entrada queda
+    atendida (offered_at). Ver scheduling/waitlist.py.
+    """
+
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name="waitlist_entries")
+    kinesiologist = models.ForeignKey(Kinesiologist, on_delete=models.CASCADE, related_name="waitlist_entries")
+    date_from = models.DateField()
+    date_until = models.DateField()
+    window_start = models.TimeField()
+    window_end = models.TimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    offered_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Búsqueda al cancelar: solo entradas activas, acotadas por kinesiólogo
+            # y fecha; las vencidas (date_until pasada) quedan fuera del rango.
+            models.Index(
+                fields=["kinesiologist", "date_until", "date_from"],
+                name="waitlist_match",
+                condition=models.Q(offered_at__isnull=True),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.patient} espera a {self.kinesiologist} ({self.date_from} - {self.date_until})"
+
+
+class GroupSlot(models.Model):
+    """
+    Contador de cupos de una sesión grupal (kinesiólogo + fecha + hora). Se
+    crea con la primera reserva; reservar suma 1 con un UPDATE condicionado a
+    que queden cupos y cancelar resta 1, así que nunca hace falta contar citas.
+    """
+
+    kinesiologist = models.ForeignKey(Kinesiologist, on_delete=models.CASCADE, related_name="group_slots")
+    session_type = models.ForeignKey(SessionType, on_delete=models.CASCADE, related_name="group_slots")
+    date = models.DateField()
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    capacity = models.PositiveSmallIntegerField()
+    booked = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["kinesiologist", "date", "start_time"], name="unique_group_slot"),
+        ]
+
+    def __str__(self):
+        return f"{self.session_type.name} {self.date} {self.start_time} ({self.booked}/{self.capacity})"
+
+    @property
+    def remaining(self):
+        return self.capacity - self.booked
+
+    @classmethod
+    def claim(cls, session_type, day, start, end):
+        """Toma un cupo; False si la sesión está llena (o el horario es de otra sesión)."""
+        cls.objects.bulk_create(
+            [cls(kinesiologist_id=session_type.kinesiologist_id, session_type=session_type, date=day,
+                 start_time=start, end_time=end, capacity=session_type.capacity)],
+            ignore_conflicts=True,
+        )
+        return bool(
+            cls.objects.filter(
+                kinesiologist_id=session_type.kinesiologist_id,
+                session_type=session_type,
+                date=day,
+                start_time=start,
+                end_time=end,
+                booked__lt=F("capacity"),
+            ).update(booked=F("booked") + 1)
+        )
+
+    @classmethod
+    def release(cls, kinesiologist_id, slots):
+        """
+        Devuelve los cupos de las citas canceladas en un solo UPDATE;
+        `slots`: {(fecha, hora de inicio): cantidad}.
+        """
+        if not slots:
+            return
+        matches = Q()
+        freed = []
+        for (day, start), count in slots.items():
+            matches |= Q(date=day, start_time=start)
+            freed.append(When(date=day, start_time=start, then=Value(count)))
+        released = Case(*freed, default=Value(0))
+        cls.objects.filter(matches, kinesiologist_id=kinesiologist_id).update(
+            booked=Greatest(F("booked") - released, Value(0))
+        )
@@ -0,0 +1,67 @@
+"""
+Correos a pacientes por cambios de estado masivos.
+
+Los mensajes se arman en memoria y se envían todos por una sola conexión SMTP
+(get_connection().send_messages) después del commit, en vez de un send_mail()
+sincrónico por cita.
+"""
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+
+STATUS_SUBJECTS = {
+    "confirmed": "📅 Tu cita ha sido CONFIRMADA ✅",
+    "cancelled": "📅 Tu cita ha sido CANCELADA ❌",
+}
+
+# Columnas que necesita status_messages(), para leerlas junto con el cambio.
+RECIPIENT_FIELDS = [
+    "id",
+    "date",
+    "start_time",
+    "end_time",
+    "patient_name__user__email",
+    "patient_name__user__first_name",
+    "patient_name__user__last_name",
+]
+
+
+def status_messages(rows, new_status, kine_name):
+    """Un EmailMessage por fila de RECIPIENT_FIELDS."""
+    messages = []
+    for _id, day, start, end, email, first_name, last_name in rows:
+        if not email:
+            continue
+        name = f"{first_name} {last_name}".strip() or email
+        extra = (
+            "Puedes agendar otra hora cuando quieras."
+            if new_status == "cancelled"
+            else "Te esperamos."
+        )
+        messages.append(EmailMessage(
+            subject=STATUS_SUBJECTS.get(new_status, f"Estado de tu hora médica: {new_status}"),
+            body=(
+                f"Hola {name},\n\n"
+                f"Tu cita con {kine_name} ha cambiado de estado.\n\n"
+                f"📅 Fecha: {day}\n"
+                f"⏰ Hora: {str(start)[:5]} - {str(end)[:5]}\n\n"
+                f"{extra}\n\n"
+                f"Gracias por usar Centro de Salud y Bienestar."
+            ),
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[email],
+        ))
+    return messages
+
+
+def send_batch(messages):
+    """Envía todos los mensajes por una sola conexión."""
+    if not messages:
+        return 0
+    with get_connection() as connection:
+        return connection.send_messages(messages)
+
+
+def send_batch_on_commit(messages):
+    """Encola el envío para después del commit de la transacción actual."""
+    transaction.on_commit(lambda: send_batch(messages))
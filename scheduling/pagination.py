@@ -0,0 +1,12 @@
+from rest_framework.pagination import PageNumberPagination
+
+
+class AppointmentHistoryPagination(PageNumberPagination):
+    """Paginación opcional del historial: ?page=2&page_size=50."""
+
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+    def requested(self, request):
+        return self.page_query_param in request.query_params or self.page_size_query_param in request.query_params
@@ -0,0 +1,106 @@
+"""
+Envío de recordatorios de citas (ver AppointmentReminder).
+
+send_due_reminders() elige un lote de recordatorios vencidos con una sola
+consulta por el índice parcial `reminder_due` (SKIP LOCKED donde la base lo
+soporta) y los reclama con un UPDATE ... WHERE sent_at IS NULL que les pone
+su propia marca de tiempo: aunque dos workers elijan las mismas filas, cada
+una queda reclamada por uno solo. Después se envían los correos del lote por
+una misma conexión SMTP; si el envío falla, el reclamo se libera para el
+siguiente intento. Un worker que muere tras reclamar no reenvía nada: se
+prefiere un recordatorio perdido a uno duplicado.
+"""
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Appointment, AppointmentReminder
+
+TIER_TEXT = {
+    "24h": "mañana",
+    "2h": "en 2 horas",
+}
+
+
+def reminder_message(reminder):
+    appointment = reminder.appointment
+    user = appointment.patient_name.user
+    name = user.get_full_name() or appointment.patient_name.name or user.email
+    when = TIER_TEXT.get(reminder.tier, f"pronto ({reminder.tier})")
+    return EmailMessage(
+        subject=f"⏰ Recordatorio: tu sesión de kinesiología es {when}",
+        body=(
+            f"Hola {name},\n\n"
+            f"Te recordamos tu sesión con {appointment.kinesiologist.name}.\n\n"
+            f"📅 Fecha: {appointment.date}\n"
+            f"⏰ Hora: {str(appointment.start_time)[:5]} - {str(appointment.end_time)[:5]}\n"
+            f"📍 Box: {appointment.box_id}\n\n"
+            f"Si no puedes asistir, cancela la hora para liberar el cupo.\n\n"
+            f"Centro de Salud y Bienestar"
+        ),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[user.email],
+    )
+
+
+def due_reminders(now):
+    return AppointmentReminder.objects.filter(sent_at__isnull=True, remind_at__lte=now).order_by("remind_at")
+
+
+def send_due_reminders(batch_size=None, connection=None, now=None):
+    """
+    Envía un lote de recordatorios vencidos. Devuelve (enviados, descartados);
+    se descartan los de citas que ya no están abiertas o se reagendaron.
+    """
+    now = now or timezone.now()
+    batch_size = batch_size or settings.REMINDER_BATCH_SIZE
+    with transaction.atomic():
+        candidates = list(
+            due_reminders(now).select_for_update(skip_locked=True).values_list("id", flat=True)[:batch_size]
+        )
+        if not candidates:
+            return 0, 0
+        claimed_at = timezone.now()
+        AppointmentReminder.objects.filter(id__in=candidates, sent_at__isnull=True).update(sent_at=claimed_at)
+
+    reminders = list(
+        AppointmentReminder.objects
+        .filter(id__in=candidates, sent_at=claimed_at)
+        .select_related("appointment__patient_name__user", "appointment__kinesiologist")
+    )
+    valid, stale = [], []
+    for reminder in reminders:
+        appointment = reminder.appointment
+        offset = settings.REMINDER_TIERS.get(reminder.tier)
+        if (
+            offset is not None
+            and appointment.status in Appointment.OPEN_STATUSES
+            and appointment.patient_name.user.email
+            and appointment.starts_at() - offset == reminder.remind_at
+        ):
+            valid.append(reminder)
+        else:
+            stale.append(reminder.id)
+
+    if stale:
+        AppointmentReminder.objects.filter(id__in=stale).delete()
+    if valid:
+        try:
+            (connection or get_connection()).send_messages([reminder_message(r) for r in valid])
+        except Exception:
+            AppointmentReminder.objects.filter(id__in=[r.id for r in valid]).update(sent_at=None)
+            raise
+    return len(valid), len(stale)
+
+
+def send_all_due(batch_size=None, now=None):
+    """Vacía la cola de vencidos reutilizando una conexión SMTP para todos los lotes."""
+    sent = dropped = 0
+    with get_connection() as connection:
+        while True:
+            batch_sent, batch_dropped = send_due_reminders(batch_size, connection, now)
+            if not batch_sent and not batch_dropped:
+                return sent, dropped
+            sent += batch_sent
+            dropped += batch_dropped
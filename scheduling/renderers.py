@@ -0,0 +1,19 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+
+
+class NormalizedJSONRenderer(JSONRenderer):
+    """
+    Renderer JSON seleccionado con ?format=normalized.
+    La vista revisa request.accepted_renderer.format para devolver las citas
+    con IDs de claves foráneas y los bloques relacionados deduplicados.
+    """
+    format = "normalized"
+
+
+APPOINTMENT_LIST_RENDERERS = list(api_settings.DEFAULT_RENDERER_CLASSES) + [NormalizedJSONRenderer]
+
+
+def wants_normalized(request) -> bool:
+    renderer = getattr(request, "accepted_renderer", None)
+    return renderer is not None and renderer.format == NormalizedJSONRenderer.format
@@ -0,0 +1,250 @@
+"""
+Horario efectivo y slots por fecha.
+
+La disponibilidad semanal (Availability) se precompila por kinesiólogo en una
+plantilla que queda en cache (slot_template): las ventanas de cada día de la
+semana y los slots candidatos en minutos, según su duración de sesión y
+pausa. Cambiar la disponibilidad o el kinesiólogo la descarta
+(invalidate_slot_template); Availability.objects.bulk_create no pasa por
+save(), así que quien lo use debe descartarla a mano.
+
+Las excepciones (ScheduleException) del kinesiólogo y de la clínica se leen
+en una consulta por rango. Los días sin excepciones usan los candidatos de la
+plantilla tal cual; en los demás se suman las horas extra, se restan los
+bloqueos y se recalculan. Lo usan los slots y Appointment.clean.
+
+busy_intervals() lee en una consulta lo ocupado del kinesiólogo y de su box
+(otro kinesiólogo que comparte el box también lo ocupa). Para una sesión
+grupal, group_seats() lee los contadores de cupos (GroupSlot) del rango.
+"""
+from collections import defaultdict
+from datetime import time, timedelta
+
+from django.core.cache import cache
+from django.db.models import Q
+
+from doctors.models import Kinesiologist, slot_template_key
+from .holds import active_holds
+from .models import Appointment, GroupSlot, ScheduleException
+
+DAY_START = time.min
+DAY_END = time.max
+
+
+def to_minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def from_minutes(minutes):
+    return time(minutes // 60, minutes % 60)
+
+
+def candidate_slots(windows, session, buffer):
+    """Slots (inicio, término) en minutos dentro de las ventanas, separados por `buffer`."""
+    slots = []
+    for start, end in windows:
+        current, last = to_minutes(start), to_minutes(end)
+        while current + session <= last:
+            slots.append((current, current + session))
+            current += session + buffer
+    return slots
+
+
+def slot_template(kinesiologist_id):
+    """
+    Plantilla semanal del kinesiólogo, leída en una consulta y guardada en
+    cache hasta que se descarte:
+
+        {"session": 45, "buffer": 10, "box": "3",
+         "windows": {día: [(inicio, término), ...]},
+         "slots": {día: [(inicio, término) en minutos, ...]}}
+
+    None si el kinesiólogo no existe.
+    """
+    key = slot_template_key(kinesiologist_id)
+    template = cache.get(key)
+    if template is not None:
+        return template
+
+    rows = list(
+        Kinesiologist.objects
+        .filter(id=kinesiologist_id)
+        .order_by("availability__day", "availability__start_time")
+        .values_list(
+            "session_minutes",
+            "buffer_minutes",
+            "box",
+            "availability__day",
+            "availability__start_time",
+            "availability__end_time",
+        )
+    )
+    if not rows:
+        return None
+
+    session, buffer, box = rows[0][:3]
+    weekly = {}
+    for _session, _buffer, _box, day, start, end in rows:
+        if day is not None:
+            weekly.setdefault(day, []).append((start, end))
+    template = {
+        "session": session,
+        "buffer": buffer,
+        "box": box,
+        "windows": weekly,
+        "slots": {day: candidate_slots(windows, session, buffer) for day, windows in weekly.items()},
+    }
+    cache.set(key, template, None)
+    return template
+
+
+def exceptions_between(kinesiologist_id, date_from, date_until):
+    """Excepciones propias y de la clínica que tocan el rango, en una consulta."""
+    return list(
+        ScheduleException.objects
+        .filter(Q(kinesiologist_id=kinesiologist_id) | Q(kinesiologist__isnull=True))
+        .filter(date_from__lte=date_until, date_until__gte=date_from)
+        .values_list("kind", "date_from", "date_until", "start_time", "end_time")
+    )
+
+
+def _merge(windows):
+    merged = []
+    for start, end in sorted(windows):
+        if merged and start < merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _subtract(windows, start, end):
+    remaining = []
+    for window_start, window_end in windows:
+        if window_start < start:
+            remaining.append((window_start, min(window_end, start)))
+        if end < window_end:
+            remaining.append((max(window_start, end), window_end))
+    return remaining
+
+
+def day_windows(day, weekly, exceptions):
+    """Ventanas abiertas de `day` a partir de la semana y las excepciones ya leídas."""
+    windows = list(weekly.get(day.weekday(), []))
+    active = [row for row in exceptions if row[1] <= day <= row[2]]
+    extra = [(start, end) for kind, _first, _last, start, end in active if kind == ScheduleException.EXTRA]
+    if extra:
+        windows = _merge(windows + extra)
+    for kind, _first, _last, start, end in active:
+        if kind == ScheduleException.BLOCKED:
+            windows = _subtract(windows, start or DAY_START, end or DAY_END)
+    return windows
+
+
+def schedule_between(kinesiologist_id, date_from, date_until):
+    """
+    (plantilla, {fecha: (ventanas, slots candidatos)}) de cada día del rango.
+    Con la plantilla en cache es una sola consulta (excepciones), sin importar
+    cuántos días abarque. Kinesiólogo inexistente: (None, {}).
+    """
+    template = slot_template(kinesiologist_id)
+    if template is None:
+        return None, {}
+
+    exceptions = exceptions_between(kinesiologist_id, date_from, date_until)
+    plan = {}
+    for day in (date_from + timedelta(days=n) for n in range((date_until - date_from).days + 1)):
+        if any(first <= day <= last for _kind, first, last, _start, _end in exceptions):
+            windows = day_windows(day, template["windows"], exceptions)
+            plan[day] = (windows, candidate_slots(windows, template["session"], template["buffer"]))
+        else:
+            weekday = day.weekday()
+            plan[day] = (template["windows"].get(weekday, []), template["slots"].get(weekday, []))
+    return template, plan
+
+
+def windows_between(kinesiologist_id, date_from, date_until):
+    """{fecha: ventanas} de cada día del rango."""
+    _template, plan = schedule_between(kinesiologist_id, date_from, date_until)
+    days = (date_until - date_from).days + 1
+    return {
+        day: plan[day][0] if day in plan else []
+        for day in (date_from + timedelta(days=n) for n in range(days))
+    }
+
+
+def busy_intervals(kinesiologist_id, box, date_from, date_until, exclude_user=None, session_type_id=None):
+    """
+    {fecha: [(inicio, término) en minutos]} ocupados en el rango para el
+    kinesiólogo o su box: citas no canceladas y retenciones vigentes (salvo
+    las de `exclude_user`). Una sola consulta, por los índices de
+    kinesiólogo y de box + fecha. Con `session_type_id` se omiten las citas de
+    esa sesión grupal: sus cupos se leen de GroupSlot (group_seats).
+    """
+    appointments = Q(kinesiologist_id=kinesiologist_id)
+    holds = Q(kinesiologist_id=kinesiologist_id)
+    if box:
+        appointments |= Q(box_id=box)
+        holds |= Q(kinesiologist__box_id=box)
+
+    held = active_holds().filter(holds, date__range=(date_from, date_until))
+    if exclude_user is not None:
+        held = held.exclude(patient__user=exclude_user)
+    booked = Appointment.objects.filter(appointments, date__range=(date_from, date_until)).exclude(status="cancelled")
+    if session_type_id is not None:
+        booked = booked.exclude(session_type_id=session_type_id)
+    rows = (
+        booked
+        .values_list("date", "start_time", "end_time")
+        .union(held.values_list("date", "start_time", "end_time"), all=True)
+    )
+    busy = defaultdict(list)
+    for day, start, end in rows:
+        busy[day].append((to_minutes(start), to_minutes(end)))
+    return busy
+
+
+def free_slots(candidates, busy, buffer):
+    """Candidatos (minutos) que no chocan con `busy` (minutos), respetando la pausa."""
+    return [
+        (start, end)
+        for start, end in candidates
+        if not any(start < busy_end + buffer and end + buffer > busy_start for busy_start, busy_end in busy)
+    ]
+
+
+def group_seats(session_type, date_from, date_until):
+    """{fecha: [(inicio, término, cupos libres) en minutos]} de las sesiones grupales ya abiertas, en una consulta."""
+    seats = defaultdict(list)
+    rows = (
+        GroupSlot.objects
+        .filter(session_type=session_type, date__range=(date_from, date_until), booked__gt=0)
+        .values_list("date", "start_time", "end_time", "capacity", "booked")
+    )
+    for day, start, end, capacity, booked in rows:
+        seats[day].append((to_minutes(start), to_minutes(end), capacity - booked))
+    return seats
+
+
+def with_seats(slots, seats, capacity, buffer):
+    """
+    (inicio, término, cupos libres) de cada slot libre. Un slot que coincide
+    con una sesión grupal abierta ofrece sus cupos restantes; uno que la pisa
+    sin coincidir no se ofrece.
+    """
+    offered = []
+    for start, end in slots:
+        remaining = capacity
+        for seat_start, seat_end, seat_remaining in seats:
+            if (seat_start, seat_end) == (start, end):
+                remaining = seat_remaining
+            elif start < seat_end + buffer and end + buffer > seat_start:
+                remaining = 0
+                break
+        if remaining > 0:
+            offered.append((start, end, remaining))
+    return offered
+
+
+def fits(windows, start, end):
+    return any(window_start <= start and end <= window_end for window_start, window_end in windows)
@@ -1,12 +1,31 @@
+from django.utils import timezone
 from rest_framework import serializers
 
+from clinic_backend.sparse_fields import SparseFieldsetMixin
 from doctors.models import Kinesiologist
 from users.models import Patient
-from .models import Appointment, Availability
+from .models import Appointment, Availability, ScheduleException, SessionType, SlotHold, WaitlistEntry
+
+
+class LatestNoteField(serializers.Field):
+    """
+    Dato de la última nota de sesión de la cita, leído de `latest_note`
+    (SessionNote.objects.attach_latest). Sin nota devuelve `default_value`.
+    """
+
+    def __init__(self, attr="text", default_value=None, **kwargs):
+        self.attr = attr
+        self.default_value = default_value
+        super().__init__(source="*", read_only=True, **kwargs)
+
+    def to_representation(self, appointment):
+        note = getattr(appointment, "latest_note", None)
+        return getattr(note, self.attr) if note else self.default_value
 
 
 class KinesiologistSummarySerializer(serializers.ModelSerializer):
     email = serializers.EmailField(source='user.email', read_only=True)
+    box = serializers.CharField(source='box_id', read_only=True)
 
     class Meta:
         model = Kinesiologist
@@ -23,13 +42,14 @@ class PatientSummarySerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'name', 'rut', 'email', 'diagnostic', 'phone_number']
 
 
-class AvailabilitySerializer(serializers.ModelSerializer):
+class AvailabilitySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     day_display = serializers.CharField(source='get_day_display', read_only=True)
 
     class Meta:
         model = Availability
         fields = ['id', 'day', 'day_display', 'start_time', 'end_time']
         read_only_fields = ['id', 'day_display']
+        field_sources = {'day_display': ['day']}
 
     def validate(self, attrs):
         start = attrs.get('start_time')
@@ -52,9 +72,43 @@ class AvailabilitySerializer(serializers.ModelSerializer):
         return attrs
 
 
-class AppointmentSerializer(serializers.ModelSerializer):
+class ScheduleExceptionSerializer(serializers.ModelSerializer):
+    kind_display = serializers.CharField(source="get_kind_display", read_only=True)
+
+    class Meta:
+        model = ScheduleException
+        fields = [
+            "id",
+            "kinesiologist",
+            "kind",
+            "kind_display",
+            "date_from",
+            "date_until",
+            "start_time",
+            "end_time",
+            "reason",
+        ]
+        read_only_fields = ["id", "kinesiologist", "kind_display"]
+
+    def validate(self, attrs):
+        if attrs["date_from"] > attrs["date_until"]:
+            raise serializers.ValidationError("La fecha de inicio debe ser anterior al término.")
+
+        start = attrs.get("start_time")
+        end = attrs.get("end_time")
+        if (start is None) != (end is None):
+            raise serializers.ValidationError("Indica ambas horas o ninguna (día completo).")
+        if start is not None and start >= end:
+            raise serializers.ValidationError("La hora de inicio debe ser anterior a la hora de término.")
+        if attrs.get("kind") == ScheduleException.EXTRA and start is None:
+            raise serializers.ValidationError("Las horas extra necesitan hora de inicio y término.")
+        return attrs
+
+
+class AppointmentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     patient = PatientSummarySerializer(source="patient_name", read_only=True)
     kinesiologist = KinesiologistSummarySerializer(read_only=True)
+    kine_comment = LatestNoteField()
 
     class Meta:
         model = Appointment
@@ -66,8 +120,11 @@ class AppointmentSerializer(serializers.ModelSerializer):
             "patient",
             "kinesiologist",
             "status",
+            "version",
+            "session_type",
             "kine_comment",
         ]
+        field_sources = {"kine_comment": []}
 
     def validate(self, attrs):
         start = attrs.get("start_time")
@@ -80,11 +137,196 @@ class AppointmentSerializer(serializers.ModelSerializer):
         return attrs
 
 
+class SlotHoldSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SlotHold
+        fields = ["id", "date", "start_time", "end_time", "expires_at"]
+        read_only_fields = ["expires_at"]
+
+    def validate(self, attrs):
+        if attrs["start_time"] >= attrs["end_time"]:
+            raise serializers.ValidationError(
+                "La hora de inicio debe ser anterior a la hora de término."
+            )
+        return attrs
+
+
+class SessionTypeSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SessionType
+        fields = ["id", "kinesiologist", "name", "capacity"]
+        read_only_fields = ["id", "kinesiologist"]
+
+
+class WaitlistEntrySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = WaitlistEntry
+        fields = ["id", "kinesiologist", "date_from", "date_until", "window_start", "window_end", "created_at"]
+        read_only_fields = ["created_at"]
+
+    def validate(self, attrs):
+        if attrs["date_from"] > attrs["date_until"]:
+            raise serializers.ValidationError("La fecha de inicio debe ser anterior al término.")
+        if attrs["date_until"] < timezone.localdate():
+            raise serializers.ValidationError("El rango de fechas ya pasó.")
+        if attrs["window_start"] >= attrs["window_end"]:
+            raise serializers.ValidationError(
+                "La hora de inicio debe ser anterior a la hora de término."
+            )
+        return attrs
+
+
+class NormalizedAppointmentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    patient = serializers.IntegerField(source="patient_name_id", read_only=True)
+    kinesiologist = serializers.IntegerField(source="kinesiologist_id", read_only=True)
+    kine_comment = LatestNoteField()
+
+    class Meta:
+        model = Appointment
+        fields = [
+            "id",
+            "date",
+            "start_time",
+            "end_time",
+            "patient",
+            "kinesiologist",
+            "status",
+            "version",
+            "kine_comment",
+        ]
+        read_only_fields = fields
+        field_sources = {"kine_comment": []}
+
+
+def serialize_normalized_appointments(appointments, kinesiologists=None, fields=None):
+    """
+    Serializa las citas con IDs de kinesiólogo/paciente y agrega los mapas
+    `kinesiologists` y `patients` con cada bloque una sola vez.
+    `kinesiologists` permite pasar instancias ya cargadas para evitar la consulta.
+    Con `fields` se omiten los mapas de las relaciones no pedidas.
+    """
+    appointments = list(appointments)
+    include_kines = fields is None or "kinesiologist" in fields
+    include_patients = fields is None or "patient" in fields
+
+    known_kines = {k.id: k for k in (kinesiologists or [])}
+    used_kine_ids = {a.kinesiologist_id for a in appointments} if include_kines else set()
+    kine_ids = used_kine_ids - set(known_kines)
+    if kine_ids:
+        known_kines.update(
+            (k.id, k)
+            for k in Kinesiologist.objects.filter(id__in=kine_ids).select_related("user")
+        )
+
+    patient_ids = {a.patient_name_id for a in appointments} if include_patients else set()
+    patients = (
+        Patient.objects.filter(id__in=patient_ids).select_related("user")
+        if patient_ids else []
+    )
+
+    return {
+        "appointments": NormalizedAppointmentSerializer(
+            appointments, many=True, fields=fields
+        ).data,
+        "kinesiologists": {
+            str(k.id): KinesiologistSummarySerializer(k).data
+            for k in known_kines.values() if k.id in used_kine_ids
+        },
+        "patients": {
+            str(p.id): PatientSummarySerializer(p).data
+            for p in patients
+        },
+    }
+
+
+class UpcomingAppointmentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    appointment_id = serializers.IntegerField(source="id", read_only=True)
+    patient_id = serializers.IntegerField(source="patient_name_id", read_only=True)
+    patient_name = serializers.SerializerMethodField()
+    date = serializers.DateField(format="%Y-%m-%d", read_only=True)
+    start_time = serializers.TimeField(format="%H:%M", read_only=True)
+    end_time = serializers.TimeField(format="%H:%M", read_only=True)
+    status_label = serializers.CharField(source="get_status_display", read_only=True)
+
+    class Meta:
+        model = Appointment
+        fields = [
+            "appointment_id",
+            "patient_id",
+            "patient_name",
+            "date",
+            "start_time",
+            "end_time",
+            "status",
+            "status_label",
+            "version",
+        ]
+        read_only_fields = fields
+        field_sources = {
+            "patient_name": [
+                "patient_name__name",
+                "patient_name__user__first_name",
+                "patient_name__user__last_name",
+            ],
+            "status_label": ["status"],
+        }
+
+    def get_patient_name(self, obj):
+        patient = obj.patient_name
+        patient_full_name = ""
+        if getattr(patient, "user", None):
+            first = getattr(patient.user, "first_name", "") or ""
+            last = getattr(patient.user, "last_name", "") or ""
+            patient_full_name = (first + " " + last).strip()
+        return patient_full_name if patient_full_name else str(patient)
+
+
+class PatientAppointmentHistorySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    date = serializers.DateField(format="%Y-%m-%d", read_only=True)
+    time = serializers.TimeField(source="start_time", format="%H:%M", read_only=True)
+    treatment = serializers.SerializerMethodField()
+    kinesiologist = serializers.SerializerMethodField()
+    status_label = serializers.CharField(source="get_status_display", read_only=True)
+    kine_comment = LatestNoteField(default_value="")
+    comment_updated_at = LatestNoteField(attr="created_at")
+
+    class Meta:
+        model = Appointment
+        fields = [
+            "id",
+            "date",
+            "time",
+            "treatment",
+            "kinesiologist",
+            "status",
+            "status_label",
+            "kine_comment",
+            "comment_updated_at",
+        ]
+        read_only_fields = fields
+        field_sources = {
+            "treatment": [],
+            "kinesiologist": [
+                "kinesiologist__user__first_name",
+                "kinesiologist__user__last_name",
+                "kinesiologist__user__username",
+            ],
+            "status_label": ["status"],
+            "kine_comment": [],
+            "comment_updated_at": [],
+        }
+
+    def get_treatment(self, obj):
+        return "Sesión de kinesiología"
+
+    def get_kinesiologist(self, obj):
+        user = obj.kinesiologist.user
+        return user.get_full_name() or user.username
 
-    
 
-class TimeSlotSerializer(serializers.Serializer):
+class TimeSlotSerializer(SparseFieldsetMixin, serializers.Serializer):
     date = serializers.DateField()
     start_time = serializers.TimeField()
     end_time = serializers.TimeField()
     datetime = serializers.DateTimeField()
+    remaining = serializers.IntegerField()
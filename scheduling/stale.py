@@ -0,0 +1,58 @@
+"""
+Cierre de citas pasadas que quedaron pendientes o confirmadas.
+
+close_stale_appointments() recorre el índice (status, date) por lotes: cada
+lote es una transacción corta que bloquea sus filas con SKIP LOCKED y las
+cambia con un solo UPDATE condicionado al estado de origen. Varios nodos
+pueden correrlo a la vez sin pisarse: cada uno toma filas distintas, y una
+fila que otro ya movió no vuelve a cumplir el filtro.
+"""
+import time
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import Appointment, AppointmentReminder, CalendarFeed
+from .transitions import can_transition
+
+
+def stale(source, cutoff):
+    return Appointment.objects.filter(status=source, date__lt=cutoff)
+
+
+def close_stale_appointments(cutoff, targets, batch_size=1000, pause=0, on_batch=None):
+    """
+    Mueve las citas anteriores a `cutoff` según `targets` ({origen: destino}).
+    Devuelve {origen: cantidad}.
+    """
+    for source, target in targets.items():
+        if not can_transition(source, target):
+            raise ValueError(f"Transición no permitida: {source} -> {target}")
+
+    counts = {}
+    for source, target in targets.items():
+        counts[source] = 0
+        while True:
+            with transaction.atomic():
+                rows = list(
+                    stale(source, cutoff)
+                    .select_for_update(skip_locked=True)
+                    .order_by()
+                    .values_list("id", "kinesiologist_id", "patient_name_id")[:batch_size]
+                )
+                if not rows:
+                    break
+                updated = (
+                    Appointment.objects
+                    .filter(id__in=[row[0] for row in rows], status=source)
+                    .update(status=target, version=F("version") + 1)
+                )
+                AppointmentReminder.drop(row[0] for row in rows)
+            CalendarFeed.touch((row[1] for row in rows), (row[2] for row in rows))
+
+            counts[source] += updated
+            if on_batch:
+                on_batch(source, counts[source])
+            if pause:
+                time.sleep(pause)
+    return counts
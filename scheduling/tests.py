@@ -1,3 +1,1731 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import tempfile
+import threading
+import time as clock
+from datetime import date, datetime, time, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.conf import settings
+from django.db import OperationalError, connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from clinic_backend import db_router, idempotency, metrics
+from clinic_backend.profiling import list_profiles, make_token
+from clinic_backend.query_budget import QueryBudgetExceeded
+from clinic_backend.testing import QueryBudgetTestMixin, auth, make_kinesiologist, make_patient
+from doctors.models import Box, Kinesiologist, invalidate_slot_template
+from .archive import archive_appointments
+from .holds import SlotUnavailable, place_hold
+from .models import (
+    Appointment,
+    AppointmentReminder,
+    ArchivedAppointment,
+    Availability,
+    CalendarFeed,
+    GroupSlot,
+    ScheduleException,
+    SessionNote,
+    SessionType,
+    SlotHold,
+    WaitlistEntry,
+)
+from .reminders import send_all_due, send_due_reminders
+from .stale import close_stale_appointments
+from .transitions import StaleAppointment, apply_transition
+from .views import CalendarFeedSecretView
+from .waitlist import offer_freed_slots
+
+PAST = date(2024, 6, 3)
+FUTURE = date(2099, 6, 1)
+
+
+class SchedulingQueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    def setUp(self):
+        self.kine = make_kinesiologist("kine")
+        Availability.objects.bulk_create([
+            Availability(kinesiologist=self.kine, day=day, start_time=time(8), end_time=time(20))
+            for day in range(7)
+        ])
+        self.patient = make_patient("patient")
+        self.size = 0
+
+    def grow(self, size):
+        """
+        Lleva los datos a `size` unidades: citas pasadas y futuras del
+        kinesiólogo con pacientes distintos e historial del paciente con
+        kinesiólogos distintos.
+        """
+        appointments = []
+        for n in range(self.size, size):
+            other_patient = make_patient(f"p{n}")
+            other_kine = make_kinesiologist(f"k{n}")
+            appointments += [
+                Appointment(kinesiologist=self.kine, patient_name=other_patient,
+                            date=PAST - timedelta(days=n), start_time=time(9), end_time=time(9, 45),
+                            status="completed"),
+                Appointment(kinesiologist=self.kine, patient_name=other_patient,
+                            date=FUTURE + timedelta(days=n + 1), start_time=time(9), end_time=time(9, 45)),
+                Appointment(kinesiologist=other_kine, patient_name=self.patient,
+                            date=PAST - timedelta(days=n), start_time=time(10), end_time=time(10, 45),
+                            status="completed"),
+            ]
+        Appointment.objects.bulk_create(appointments)
+        SessionNote.objects.bulk_create([
+            SessionNote(appointment=appointment, version=1, text="Sin novedades.")
+            for appointment in appointments if appointment.patient_name_id == self.patient.id
+        ])
+        archive_appointments(PAST - timedelta(days=size // 2))
+        # Cada medición parte sin la plantilla de slots en cache (el peor caso).
+        invalidate_slot_template(self.kine.id)
+        self.size = max(self.size, size)
+
+    def pending_appointment(self):
+        appointment, _ = Appointment.objects.get_or_create(
+            kinesiologist=self.kine, patient_name=self.patient,
+            date=FUTURE, start_time=time(12), end_time=time(12, 45),
+        )
+        Appointment.objects.filter(id=appointment.id).update(status="pending")
+        return appointment
+
+    def grow_pending(self, size):
+        """grow() y deja la cita de prueba otra vez pendiente para repetir la transición."""
+        self.grow(size)
+        self.pending_appointment()
+
+    def test_availability_list(self):
+        path = f"/api/kinesiologists/{self.kine.id}/availability/"
+        self.assertQueryBudget("GET", path, self.grow, **auth(self.kine.user))
+        self.assertQueryBudget("GET", path + "?format=normalized", self.grow, **auth(self.kine.user))
+        self.assertQueryBudget("GET", path + "?fields=id,date,start_time,status", self.grow, **auth(self.kine.user))
+
+    def test_availability_create(self):
+        path = f"/api/kinesiologists/{self.kine.id}/availability/"
+
+        def grow(size):
+            self.grow(size)
+            Availability.objects.filter(kinesiologist=self.kine, start_time=time(21)).delete()
+
+        self.assertQueryBudget(
+            "POST", path, grow, data={"day": 6, "start_time": "21:00", "end_time": "22:00"},
+            content_type="application/json", **auth(self.kine.user),
+        )
+        weekly = {"availability": {"mon": [{"start": "08:00", "end": "13:00"}, {"start": "14:00", "end": "20:00"}],
+                                   "wed": [{"start": "08:00", "end": "20:00"}]}}
+        self.assertQueryBudget("POST", path, self.grow, data=weekly,
+                               content_type="application/json", **auth(self.kine.user))
+
+    def test_slots(self):
+        path = f"/api/kinesiologists/{self.kine.id}/slots/?date={FUTURE + timedelta(days=1)}"
+        self.assertQueryBudget("GET", path, self.grow)
+        self.assertQueryBudget("GET", path, self.grow, **auth(self.patient.user))
+
+    def test_slots_range_with_exceptions(self):
+        def grow(size):
+            self.grow(size)
+            ScheduleException.objects.bulk_create([
+                ScheduleException(kinesiologist=self.kine if n % 2 else None, date_from=FUTURE + timedelta(days=n),
+                                  date_until=FUTURE + timedelta(days=n), start_time=time(12), end_time=time(13))
+                for n in range(self.size, size)
+            ])
+
+        path = f"/api/kinesiologists/{self.kine.id}/slots/?from={FUTURE}&until={FUTURE + timedelta(days=20)}"
+        self.assertQueryBudget("GET", path, grow)
+
+    def test_hold_slot(self):
+        self.assertQueryBudget(
+            "POST", f"/api/kinesiologists/{self.kine.id}/holds/", self.grow,
+            data={"date": FUTURE.isoformat(), "start_time": "16:00", "end_time": "16:45"},
+            content_type="application/json", **auth(self.patient.user),
+        )
+
+    def test_create_appointment(self):
+        def grow(size):
+            self.grow(size)
+            Appointment.objects.filter(kinesiologist=self.kine, date=FUTURE, start_time=time(15)).delete()
+
+        self.assertQueryBudget(
+            "POST", f"/api/kinesiologists/{self.kine.id}/appointments/", grow,
+            data={"date": FUTURE.isoformat(), "start_time": "15:00", "end_time": "15:45"},
+            content_type="application/json", **auth(self.patient.user),
+        )
+
+    def test_upcoming(self):
+        self.assertQueryBudget("GET", "/api/kinesiologist/appointments/upcoming/", self.grow, **auth(self.kine.user))
+
+    def test_history(self):
+        path = "/api/patients/appointments/history/"
+        self.assertQueryBudget("GET", path, self.grow, **auth(self.patient.user))
+        self.assertQueryBudget("GET", path + "?page_size=5&page=2", self.grow, **auth(self.patient.user))
+        self.assertQueryBudget("GET", path + "?fields=id,date,status", self.grow, **auth(self.patient.user))
+
+    def test_status(self):
+        appointment = self.pending_appointment()
+        self.assertQueryBudget(
+            "PATCH", f"/api/appointments/{appointment.id}/status/", self.grow_pending,
+            data={"status": "confirmed"}, content_type="application/json", **auth(self.kine.user),
+        )
+
+    def test_status_update(self):
+        appointment = self.pending_appointment()
+        self.assertQueryBudget(
+            "PATCH", f"/api/api/appointments/{appointment.id}/status/", self.grow_pending,
+            data={"status": "confirmed"}, content_type="application/json", **auth(self.kine.user),
+        )
+
+    def test_comment(self):
+        appointment = self.pending_appointment()
+        self.assertQueryBudget(
+            "PATCH", f"/api/appointments/{appointment.id}/comment/", self.grow_pending,
+            data={"kine_comment": "Buena evolución."}, content_type="application/json", **auth(self.kine.user),
+        )
+
+    def test_export(self):
+        staff = User.objects.create(username="staff@example.com", is_staff=True)
+        self.assertQueryBudget("GET", "/api/appointments/export/", self.grow, **auth(staff))
+
+    def test_calendar_feed(self):
+        feed = CalendarFeed.for_user(self.kine.user)
+        self.assertQueryBudget("GET", f"/api/calendar/{feed.secret}.ics", self.grow)
+
+    def test_calendar_feed_secret(self):
+        def grow_without_feed(size):
+            self.grow(size)
+            CalendarFeed.objects.filter(user=self.kine.user).delete()
+
+        # Primera vez (crea el feed) y siguientes (lo lee o lo rota).
+        for method, expected in (("GET", (3, 2)), ("POST", (3, 3))):
+            created = self.assertQueryBudget(method, "/api/calendar/feed/", grow_without_feed, **auth(self.kine.user))
+            existing = self.assertQueryBudget(method, "/api/calendar/feed/", self.grow, **auth(self.kine.user))
+            self.assertEqual((created, existing), expected)
+
+    def test_exceeded_budget_fails_the_request(self):
+        self.assertTrue(settings.QUERY_BUDGET_STRICT)
+        with mock.patch.dict(CalendarFeedSecretView.query_budget, {"GET": 1}):
+            with self.assertRaises(QueryBudgetExceeded), self.assertLogs("clinic_backend.query_budget", "WARNING"):
+                self.client.get("/api/calendar/feed/", **auth(self.kine.user))
+
+    def test_bulk_status(self):
+        self.assertQueryBudget(
+            "POST", "/api/kinesiologist/appointments/bulk-status/", self.grow,
+            data={"action": "confirm", "from": str(FUTURE), "until": str(FUTURE + timedelta(days=60))},
+            content_type="application/json", **auth(self.kine.user),
+        )
+
+
+class NormalizedFormatTests(TestCase):
+    def setUp(self):
+        self.kine = make_kinesiologist("kine")
+        self.first, self.second = make_patient("first"), make_patient("second")
+        Appointment.objects.bulk_create([
+            Appointment(kinesiologist=self.kine, patient_name=patient, date=FUTURE + timedelta(days=n),
+                        start_time=time(9), end_time=time(9, 45))
+            for n, patient in enumerate((self.first, self.second, self.first))
+        ])
+        self.path = f"/api/kinesiologists/{self.kine.id}/availability/"
+
+    def test_sideloads_each_related_block_once(self):
+        response = self.client.get(self.path + "?format=normalized", **auth(self.kine.user))
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(set(body), {"kinesiologist", "availability", "appointments", "kinesiologists", "patients"})
+        self.assertEqual(body["kinesiologist"], self.kine.id)
+        self.assertEqual(
+            [(row["patient"], row["kinesiologist"]) for row in body["appointments"]],
+            [(self.first.id, self.kine.id), (self.second.id, self.kine.id), (self.first.id, self.kine.id)],
+        )
+        self.assertEqual(list(body["kinesiologists"]), [str(self.kine.id)])
+        self.assertEqual(body["kinesiologists"][str(self.kine.id)]["email"], "kine@example.com")
+        self.assertEqual(sorted(body["patients"]), sorted([str(self.first.id), str(self.second.id)]))
+        self.assertEqual(body["patients"][str(self.second.id)]["name"], "second")
+
+    def test_default_format_nests_related_blocks(self):
+        body = self.client.get(self.path, **auth(self.kine.user)).json()
+        self.assertNotIn("patients", body)
+        self.assertEqual(body["appointments"][0]["patient"]["id"], self.first.id)
+        self.assertEqual(body["kinesiologist"]["id"], self.kine.id)
+
+
+class SparseFieldsTests(TestCase):
+    def setUp(self):
+        self.kine = make_kinesiologist("kine")
+        self.patient = make_patient("patient")
+        Appointment.objects.bulk_create([
+            Appointment(kinesiologist=self.kine, patient_name=self.patient, date=FUTURE + timedelta(days=n),
+                        start_time=time(9), end_time=time(9, 45))
+            for n in range(3)
+        ])
+        self.path = f"/api/kinesiologists/{self.kine.id}/availability/"
+        self.headers = auth(self.kine.user)
+
+    def get(self, query):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.path + query, **self.headers)
+        return response, [q["sql"] for q in ctx.captured_queries]
+
+    def test_fields_trim_rows(self):
+        response, _ = self.get("?fields=id,date,status")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([set(row) for row in response.json()["appointments"]], [{"id", "date", "status"}] * 3)
+
+        normalized, _ = self.get("?format=normalized&fields=id,patient")
+        body = normalized.json()
+        self.assertEqual(set(body["appointments"][0]), {"id", "patient"})
+        self.assertEqual(list(body["patients"]), [str(self.patient.id)])
+        self.assertEqual(body["kinesiologists"], {})
+
+    def test_unknown_field_is_rejected(self):
+        response, _ = self.get("?fields=id,secreto")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("secreto", response.json()["fields"])
+
+    def test_pruned_joins_and_queries(self):
+        _, full = self.get("")
+        _, sparse = self.get("?fields=id,date,status")
+
+        self.assertLess(len(sparse), len(full))  # sin kine_comment no se leen las notas
+        appointments_sql = [sql for sql in sparse if 'FROM "scheduling_appointment"' in sql]
+        self.assertEqual(len(appointments_sql), 1)
+        self.assertNotIn("JOIN", appointments_sql[0])
+        self.assertNotIn('"scheduling_appointment"."end_time"', appointments_sql[0])
+        self.assertTrue(any('INNER JOIN "users_patient"' in sql for sql in full))
+
+
+class SeedClinicTests(TestCase):
+    def seed(self):
+        call_command("seed_clinic", "--flush", kinesiologists=3, patients=12, appointments=150, seed=7,
+                     anchor_date=FUTURE, future_days=7, stdout=io.StringIO())
+        return list(
+            Appointment.objects
+            .order_by("kinesiologist__rut", "date", "start_time")
+            .values_list("kinesiologist__rut", "patient_name__rut", "date", "start_time", "end_time", "status")
+        )
+
+    def test_same_seed_same_data(self):
+        first = self.seed()
+        names = list(Kinesiologist.objects.order_by("rut").values_list("rut", "name", "specialty", "box"))
+        second = self.seed()
+
+        self.assertGreaterEqual(len(first), 150)
+        self.assertEqual(first, second)
+        self.assertEqual(names, list(Kinesiologist.objects.order_by("rut").values_list("rut", "name", "specialty", "box")))
+        self.assertEqual(Kinesiologist.objects.count(), 3)
+
+    def test_appointments_do_not_overlap(self):
+        rows = self.seed()
+        sessions = dict(Kinesiologist.objects.values_list("rut", "session_minutes"))
+        buffers = dict(Kinesiologist.objects.values_list("rut", "buffer_minutes"))
+        self.assertGreater(len(set(sessions.values()) | set(buffers.values())), 1)
+
+        def minutes(value):
+            return value.hour * 60 + value.minute
+
+        for kine, _patient, _day, start, end, _status in rows:
+            self.assertEqual(minutes(end) - minutes(start), sessions[kine], kine)
+        for current, following in zip(rows, rows[1:]):
+            kine, _patient, day, _start, end, _status = current
+            next_kine, _patient, next_day, next_start, _end, _status = following
+            if (kine, day) == (next_kine, next_day):
+                self.assertLessEqual(minutes(end) + buffers[kine], minutes(next_start), f"{kine} {day}")
+        # Cada kinesiólogo tiene su box: tampoco chocan por box.
+        self.assertEqual(Kinesiologist.objects.values("box").distinct().count(), 3)
+
+    def test_open_appointments_get_reminders(self):
+        self.seed()
+        open_ids = set(Appointment.objects.filter(status__in=Appointment.OPEN_STATUSES).values_list("id", flat=True))
+        self.assertTrue(open_ids)
+        reminders = AppointmentReminder.objects.values_list("appointment_id", "tier")
+        self.assertEqual(
+            set(reminders),
+            {(appointment_id, tier) for appointment_id in open_ids for tier in settings.REMINDER_TIERS},
+        )
+
+    def test_flush_removes_boxes(self):
+        self.seed()
+        self.seed()
+        self.assertEqual(Box.objects.filter(name__startswith="S-").count(), 3)
+        call_command("seed_clinic", "--flush", kinesiologists=1, patients=1, appointments=1, stdout=io.StringIO())
+        self.assertEqual(Box.objects.filter(name__startswith="S-").count(), 1)
+
+
+class BenchmarkBookingTests(TransactionTestCase):
+    def test_in_process_run_writes_report(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            output = Path(tmp) / "booking.json"
+            call_command(
+                "benchmark_booking", "--seed", requests=20, concurrency=1, output=str(output),
+                kinesiologists=3, patients=10, appointments=100, stdout=io.StringIO(),
+            )
+            result = json.loads(output.read_text())
+
+        self.assertEqual(result["config"]["requests"], 20)
+        self.assertEqual(result["config"]["dataset"]["kinesiologists"], 3)
+        self.assertIn("slots", result["endpoints"])
+        for name, row in result["endpoints"].items():
+            for key in ("p50_ms", "p95_ms", "p99_ms"):
+                self.assertIsNotNone(row[key], name)
+            self.assertLessEqual(row["p50_ms"], row["p99_ms"])
+            self.assertGreater(row["queries_avg"], 0, name)
+            self.assertGreaterEqual(row["queries_max"], row["queries_avg"])
+            self.assertNotIn("500", row["status_codes"], name)
+
+
+class DBInstrumentationTests(TestCase):
+    def setUp(self):
+        self.kine = make_kinesiologist("kine")
+        Availability.objects.create(kinesiologist=self.kine, day=FUTURE.weekday(), start_time=time(8), end_time=time(12))
+
+    def test_slow_query_log(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            log = Path(tmp) / "slow.jsonl"
+            with override_settings(SLOW_QUERY_THRESHOLD_MS=0, SLOW_QUERY_LOG=str(log)):
+                response = self.client.get(f"/api/kinesiologists/{self.kine.id}/slots/?date={FUTURE}")
+
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("X-DB-Time", response)
+            entries = [json.loads(line) for line in log.read_text().splitlines()]
+
+        self.assertTrue(entries)
+        entry = entries[-1]
+        self.assertEqual(entry["view"], "scheduling.views.KinesiologistAvailableSlotsView")
+        self.assertNotIn(str(self.kine.id), entry["sql"].split("WHERE", 1)[-1])
+        self.assertTrue(any(frame.startswith("scheduling/views.py") for frame in entry["stack"]))
+
+    @override_settings(DB_TIME_BUDGET_MS=0)
+    def test_db_time_budget(self):
+        response = self.client.get("/api/kinesiologist/appointments/upcoming/", **auth(self.kine.user))
+
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(response.json()["status"])
+
+
+REPLICA = "replica_test"
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA], DATABASE_REPLICA_SYNC=True, REPLICA_PIN_SECONDS=5)
+class ReadReplicaTests(TransactionTestCase):
+    """Primario + réplica en dos archivos SQLite, como con DB_READ_REPLICA=1."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # El alias se agrega después de que TransactionTestCase prepara sus
+        # bases: la réplica es un archivo aparte que solo llena la copia.
+        cls.replica_dir = tempfile.TemporaryDirectory()
+        settings.DATABASES[REPLICA] = {
+            **connections.settings["default"],
+            "NAME": str(Path(cls.replica_dir.name) / "replica.sqlite3"),
+        }
+        connections.settings[REPLICA] = settings.DATABASES[REPLICA]
+        cls.databases = {"default", REPLICA}
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        settings.DATABASES.pop(REPLICA, None)
+        connections.settings.pop(REPLICA, None)
+        cls.replica_dir.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        primary = connections["default"]
+        primary.ensure_connection()
+        db_router._install_sync_wrapper(sender=type(primary), connection=primary)
+        db_router.sync_sqlite_replicas()
+        db_router._replica_dirty.clear()
+        self.kine = make_kinesiologist("kine")
+        self.patient = make_patient("patient")
+
+    def tearDown(self):
+        primary = connections["default"]
+        primary.execute_wrappers[:] = [
+            w for w in primary.execute_wrappers if not isinstance(w, db_router._ReplicaSyncWrapper)
+        ]
+        db_router._replica_dirty.clear()
+
+    def replica_count(self, table):
+        with connections[REPLICA].cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {table}")
+            return cursor.fetchone()[0]
+
+    def aliases(self, response):
+        return {pair.split("=")[0] for pair in response["X-DB-Queries"].split(", ")}
+
+    def join_waitlist(self):
+        return self.client.post(
+            "/api/waitlist/", content_type="application/json", **auth(self.patient.user),
+            data={"kinesiologist": self.kine.id, "date_from": str(FUTURE), "date_until": str(FUTURE),
+                  "window_start": "09:00", "window_end": "12:00"},
+        )
+
+    def test_reads_go_to_replica_and_writes_to_primary(self):
+        router = db_router.PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_read(Kinesiologist), REPLICA)
+        self.assertEqual(router.db_for_write(Kinesiologist), "default")
+        with db_router.use_primary():
+            self.assertEqual(router.db_for_read(Kinesiologist), "default")
+
+        read = self.client.get("/api/kinesiologists")
+        self.assertEqual(read.status_code, 200)
+        self.assertEqual(self.aliases(read), {REPLICA})
+        self.assertEqual([row["name"] for row in read.json()], ["kine"])
+
+        write = self.join_waitlist()
+        self.assertEqual(write.status_code, 201)
+        self.assertEqual(self.aliases(write), {"default"})
+
+    def test_reads_pinned_to_primary_after_write(self):
+        with self.settings(REPLICA_PIN_SECONDS=1):
+            self.assertEqual(self.join_waitlist().status_code, 201)
+            pinned = self.client.get("/api/waitlist/", **auth(self.patient.user))
+            self.assertEqual(self.aliases(pinned), {"default"})
+            self.assertEqual(len(pinned.json()), 1)
+
+            # Otro cliente no queda fijado.
+            other = self.client.get("/api/waitlist/", **auth(self.kine.user))
+            self.assertEqual(self.aliases(other), {REPLICA})
+
+            clock.sleep(1.1)
+            expired = self.client.get("/api/waitlist/", **auth(self.patient.user))
+        self.assertEqual(self.aliases(expired), {REPLICA})
+        self.assertEqual(len(expired.json()), 1)
+
+    def test_sync_copies_primary_to_replica(self):
+        self.assertEqual(self.replica_count("doctors_kinesiologist"), 0)
+        db_router.sync_sqlite_replicas()
+        self.assertEqual(self.replica_count("doctors_kinesiologist"), 1)
+
+        # El hook marca la réplica al confirmar la escritura y la copia antes de la siguiente lectura.
+        make_kinesiologist("second")
+        self.assertTrue(db_router._replica_dirty.is_set())
+        self.assertEqual(Kinesiologist.objects.count(), 2)
+        self.assertEqual(self.replica_count("doctors_kinesiologist"), 2)
+        self.assertFalse(db_router._replica_dirty.is_set())
+
+    def test_query_header_counts_per_alias(self):
+        # El primer GET del feed lee de la réplica y crea el secreto en el primario.
+        headers = auth(self.kine.user)
+        with CaptureQueriesContext(connections["default"]) as primary, \
+                CaptureQueriesContext(connections[REPLICA]) as replica:
+            response = self.client.get("/api/calendar/feed/", **headers)
+        self.assertEqual(response.status_code, 200)
+
+        def executed(context):
+            # COMMIT/ROLLBACK se registran en el log pero no pasan por el cursor.
+            return len([q for q in context.captured_queries if q["sql"] not in ("COMMIT", "ROLLBACK")])
+
+        self.assertTrue(executed(primary) and executed(replica))
+        self.assertEqual(response["X-DB-Queries"], f"default={executed(primary)}, {REPLICA}={executed(replica)}")
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        self.kine = make_kinesiologist("kine")
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        settings = override_settings(PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=0, PROFILING_DIR=tmp.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_signed_header(self):
+        response = self.client.get("/api/kinesiologists", HTTP_X_PROFILE=make_token("memory"))
+
+        self.assertEqual(response.status_code, 200)
+        profile = list_profiles()[0]
+        self.assertEqual(response["X-Profile-Id"], profile["id"])
+        self.assertEqual(profile["trigger"], "header")
+        self.assertIn("peak_kb", profile["memory"])
+
+        out = io.StringIO()
+        call_command("request_profiles", "dump", profile["id"], "--limit", "5", stdout=out)
+        self.assertIn("/api/kinesiologists", out.getvalue())
+
+    def test_invalid_header_and_non_staff_flag(self):
+        self.client.get("/api/kinesiologists", HTTP_X_PROFILE="cpu:falso:firma")
+        self.client.get("/api/kinesiologists?profile=1", **auth(self.kine.user))
+
+        self.assertEqual(list_profiles(), [])
+
+    def test_staff_flag(self):
+        self.kine.user.is_staff = True
+        self.kine.user.save()
+
+        headers = auth(self.kine.user)
+        # El token que resuelve el middleware de perfilado no se vuelve a consultar.
+        with self.assertNumQueries(3):
+            response = self.client.get("/api/kinesiologist/appointments/upcoming/?profile=1", **headers)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list_profiles()[0]["trigger"], "staff")
+
+
+@override_settings(
+    EMAIL_BACKEND="clinic_backend.mail.InstrumentedEmailBackend",
+    EMAIL_DELIVERY_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+    METRICS_TOKEN="metrics-secret",
+)
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics.registry.clear()
+        self.kine = make_kinesiologist("kine")
+        Availability.objects.create(kinesiologist=self.kine, day=FUTURE.weekday(), start_time=time(8), end_time=time(12))
+        self.patient = make_patient("patient")
+
+    def scrape(self, **headers):
+        response = self.client.get("/api/metrics", **headers)
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_requests_db_and_mail(self):
+        self.client.get(f"/api/kinesiologists/{self.kine.id}/slots/?date={FUTURE}")
+        self.client.post(
+            f"/api/kinesiologists/{self.kine.id}/appointments/",
+            data={"date": FUTURE.isoformat(), "start_time": "08:00", "end_time": "08:45"},
+            content_type="application/json", **auth(self.patient.user),
+        )
+
+        body = self.scrape(HTTP_AUTHORIZATION="Bearer metrics-secret")
+        slots = 'view="scheduling.views.KinesiologistAvailableSlotsView"'
+        self.assertIn(f'clinic_http_requests_total{{{slots},method="GET",status="200"}} 1', body)
+        self.assertIn(f'clinic_http_request_duration_seconds_count{{{slots},method="GET"}} 1', body)
+        self.assertIn(f'clinic_db_queries_count{{{slots}}} 1', body)
+        self.assertIn('clinic_mail_messages_total{backend="locmem",result="sent"} 1', body)
+        self.assertIn('clinic_mail_send_duration_seconds_bucket{backend="locmem",le="+Inf"} 1', body)
+
+    def test_cache_hits(self):
+        cache.set("clave", 1)
+        cache.get("clave")
+        cache.get("otra")
+
+        body = self.scrape(HTTP_AUTHORIZATION="Bearer metrics-secret")
+        self.assertRegex(body, r'clinic_cache_requests_total\{cache="[^"]*",result="hit"\} 1')
+        self.assertRegex(body, r'clinic_cache_requests_total\{cache="[^"]*",result="miss"\} 1')
+
+    def test_protected(self):
+        self.assertEqual(self.client.get("/api/metrics").status_code, 403)
+        self.assertEqual(self.client.get("/api/metrics", HTTP_AUTHORIZATION="Bearer otra").status_code, 403)
+        self.assertEqual(self.client.get("/api/metrics", **auth(self.kine.user)).status_code, 403)
+
+        self.kine.user.is_staff = True
+        self.kine.user.save()
+        self.scrape(**auth(self.kine.user))
+
+    def test_multiprocess_files_are_merged(self):
+        with tempfile.TemporaryDirectory() as tmp, override_settings(METRICS_MULTIPROCESS_DIR=tmp):
+            other = [["clinic_http_requests_total", ["otra.Vista", "GET", "200"], 5]]
+            Path(tmp, "99999-1.json").write_text(json.dumps(other))
+            metrics.registry.inc("clinic_http_requests_total", ("otra.Vista", "GET", "200"), 2)
+
+            body = self.scrape(HTTP_AUTHORIZATION="Bearer metrics-secret")
+
+        self.assertIn('clinic_http_requests_total{view="otra.Vista",method="GET",status="200"} 7', body)
+
+
+class TracingTests(TestCase):
+    TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+
+    def setUp(self):
+        self.kine = make_kinesiologist("kine")
+        Availability.objects.create(kinesiologist=self.kine, day=FUTURE.weekday(), start_time=time(8), end_time=time(12))
+        self.patient = make_patient("patient")
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.log = Path(tmp.name) / "traces.jsonl"
+        settings = override_settings(
+            TRACING_ENABLED=True,
+            TRACING_LOG=str(self.log),
+            EMAIL_BACKEND="clinic_backend.mail.InstrumentedEmailBackend",
+            EMAIL_DELIVERY_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_booking_spans(self):
+        response = self.client.post(
+            f"/api/kinesiologists/{self.kine.id}/appointments/",
+            data={"date": FUTURE.isoformat(), "start_time": "08:00", "end_time": "08:45"},
+            content_type="application/json",
+            HTTP_TRACEPARENT=f"00-{self.TRACE_ID}-00f067aa0ba902b7-01",
+            **auth(self.patient.user),
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response["X-Trace-Id"], self.TRACE_ID)
+        spans = [json.loads(line) for line in self.log.read_text().splitlines()]
+        self.assertTrue(all(s["trace_id"] == self.TRACE_ID for s in spans))
+        by_name = {s["name"]: s for s in spans}
+
+        root = by_name["POST scheduling.views.AppointmentCreateView"]
+        self.assertEqual(root["parent_id"], "00f067aa0ba902b7")
+        self.assertEqual(root["attributes"]["http.status_code"], 201)
+        for name in ("auth.token", "appointment.clean", "appointment.insert", "appointment.serialize", "send_mail"):
+            self.assertIn(name, by_name)
+        clean_queries = [s for s in spans if s["parent_id"] == by_name["appointment.clean"]["span_id"]]
+        # Semana + excepciones del día + solapes.
+        self.assertEqual([s["name"] for s in clean_queries], ["db.query", "db.query", "db.query"])
+
+        out = io.StringIO()
+        call_command("traces", "show", self.TRACE_ID, stdout=out)
+        self.assertIn("appointment.clean", out.getvalue())
+
+    def test_unsampled_traceparent(self):
+        response = self.client.get("/api/kinesiologists", HTTP_TRACEPARENT=f"00-{self.TRACE_ID}-00f067aa0ba902b7-00")
+
+        self.assertNotIn("X-Trace-Id", response)
+        self.assertFalse(self.log.exists())
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.kine = make_kinesiologist("kine")
+        self.patient = make_patient("patient")
+        self.old_completed, self.old_pending, self.recent = Appointment.objects.bulk_create([
+            Appointment(kinesiologist=self.kine, patient_name=self.patient, date=PAST - timedelta(days=400),
+                        start_time=time(9), end_time=time(9, 45), status="completed"),
+            Appointment(kinesiologist=self.kine, patient_name=self.patient, date=PAST - timedelta(days=300),
+                        start_time=time(9), end_time=time(9, 45), status="pending"),
+            Appointment(kinesiologist=self.kine, patient_name=self.patient, date=PAST,
+                        start_time=time(9), end_time=time(9, 45), status="cancelled"),
+        ])
+
+    def test_archive_and_restore(self):
+        out = io.StringIO()
+        call_command("archive_appointments", "--before", str(PAST - timedelta(days=30)), "--batch-size", "1", stdout=out)
+
+        self.assertIn("1 citas", out.getvalue())
+        self.assertEqual(list(ArchivedAppointment.objects.values_list("id", flat=True)), [self.old_completed.id])
+        self.assertFalse(Appointment.objects.filter(id=self.old_completed.id).exists())
+
+        call_command("restore_appointments", "--patient", str(self.patient.id), stdout=io.StringIO())
+        self.assertTrue(Appointment.objects.filter(id=self.old_completed.id, status="completed").exists())
+        self.assertFalse(ArchivedAppointment.objects.exists())
+
+    def test_history_reads_both_tables(self):
+        archive_appointments(PAST - timedelta(days=30))
+        path = "/api/patients/appointments/history/"
+
+        response = self.client.get(path, **auth(self.patient.user))
+        self.assertEqual(
+            [row["id"] for row in response.json()],
+            [self.recent.id, self.old_pending.id, self.old_completed.id],
+        )
+        self.assertEqual(response.json()[2]["status_label"], "Realizada")
+
+        page = self.client.get(path + "?page_size=2&page=2", **auth(self.patient.user)).json()
+        self.assertEqual(page["count"], 3)
+        self.assertEqual([row["id"] for row in page["results"]], [self.old_completed.id])
+
+
+class SessionNoteTests(TestCase):
+    def setUp(self):
+        self.kine = make_kinesiologist("kine")
+        self.patient = make_patient("patient")
+        Availability.objects.create(kinesiologist=self.kine, day=PAST.weekday(), start_time=time(8), end_time=time(12))
+        self.appointment = Appointment.objects.create(
+            kinesiologist=self.kine, patient_name=self.patient, date=PAST,
+            start_time=time(9), end_time=time(9, 45), status="confirmed",
+        )
+        self.path = f"/api/appointments/{self.appointment.id}/comment/"
+
+    def comment(self, text):
+        return self.client.patch(self.path, data={"kine_comment": text},
+                                 content_type="application/json", **auth(self.kine.user))
+
+    def test_edits_append_versions(self):
+        self.assertEqual(self.comment("Primera evaluación.").json()["note_version"], 1)
+        self.assertEqual(self.comment("Corrige dosis de ejercicios.").json()["note_version"], 2)
+
+        notes = SessionNote.objects.filter(appointment=self.appointment).order_by("version")
+        self.assertEqual([(n.version, n.text) for n in notes],
+                         [(1, "Primera evaluación."), (2, "Corrige dosis de ejercicios.")])
+        self.assertEqual(notes[1].author, self.kine.user)
+        self.appointment.refresh_from_db()
+        self.assertEqual(self.appointment.status, "completed")
+
+        note = notes[0]
+        note.text = "Editada"
+        with self.assertRaises(ValueError):
+            note.save()
+
+    def test_history_shows_latest_note_after_archive(self):
+        self.comment("Primera evaluación.")
+        self.comment("Versión final.")
+        archive_appointments(FUTURE)
+        self.assertTrue(ArchivedAppointment.objects.filter(id=self.appointment.id).exists())
+
+        row = self.client.get("/api/patients/appointments/history/", **auth(self.patient.user)).json()[0]
+        self.assertEqual(row["kine_comment"], "Versión final.")
+        self.assertIsNotNone(row["comment_updated_at"])
+
+        row = self.client.get("/api/patients/appointments/history/?fields=id,status",
+                              **auth(self.patient.user)).json()[0]
+        self.assertNotIn("kine_comment", row)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.kine = make_kinesiologist("kine")
+        self.other_kine = make_kinesiologist("other")
+        self.patient = make_patient("patient")
+        self.staff = User.objects.create(username="staff@example.com", is_staff=True)
+        self.old, self.recent, self.other = Appointment.objects.bulk_create([
+            Appointment(kinesiologist=self.kine, patient_name=self.patient, date=PAST - timedelta(days=400),
+                        start_time=time(9), end_time=time(9, 45), status="completed"),
+            Appointment(kinesiologist=self.kine, patient_name=self.patient, date=PAST,
+                        start_time=time(10), end_time=time(10, 45), status="cancelled"),
+            Appointment(kinesiologist=self.other_kine, patient_name=self.patient, date=PAST,
+                        start_time=time(9), end_time=time(9, 45), status="completed"),
+        ])
+        archive_appointments(PAST - timedelta(days=30))
+
+    def export(self, query="", user=None):
+        response = self.client.get("/api/appointments/export/" + query, **auth(user or self.staff))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return list(csv.DictReader(io.StringIO(b"".join(response.streaming_content).decode())))
+
+    def test_streams_both_tables_with_names(self):
+        rows = self.export()
+        self.assertEqual([int(r["id"]) for r in rows], [self.old.id, self.other.id, self.recent.id])
+        self.assertEqual(rows[0]["kinesiologo"], "kine")
+        self.assertEqual(rows[0]["paciente"], "patient")
+        self.assertEqual(rows[0]["fecha"], str(PAST - timedelta(days=400)))
+
+    def test_filters(self):
+        rows = self.export(f"?kinesiologist={self.kine.id}&from={PAST}&status=cancelled,completed")
+        self.assertEqual([int(r["id"]) for r in rows], [self.recent.id])
+        self.assertEqual([int(r["id"]) for r in self.export("?archived=0&status=completed")], [self.other.id])
+
+    def test_staff_only_and_validation(self):
+        response = self.client.get("/api/appointments/export/", **auth(self.patient.user))
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get("/api/appointments/export/?from=ayer", **auth(self.staff))
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get("/api/appointments/export/?status=perdida", **auth(self.staff))
+        self.assertEqual(response.status_code, 400)
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            output = Path(tmp) / "citas.csv"
+            call_command("export_appointments", "--status", "completed", "--output", str(output),
+                         "--chunk-size", "1", stderr=io.StringIO())
+            rows = list(csv.DictReader(output.open(encoding="utf-8")))
+        self.assertEqual([int(r["id"]) for r in rows], [self.old.id, self.other.id])
+
+
+class CalendarFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.kine = make_kinesiologist("kine")
+        self.patient = make_patient("patient")
+        today = timezone.localdate()
+        Availability.objects.bulk_create([
+            Availability(kinesiologist=self.kine, day=day, start_time=time(8), end_time=time(20)) for day in range(7)
+        ])
+        self.appointment = Appointment.objects.create(
+            kinesiologist=self.kine, patient_name=self.patient, date=today + timedelta(days=2),
+            start_time=time(9), end_time=time(9, 45), status="confirmed",
+        )
+        Appointment.objects.create(
+            kinesiologist=self.kine, patient_name=self.patient, date=today + timedelta(days=400),
+            start_time=time(9), end_time=time(9, 45),
+        )
+
+    def feed_path(self, user):
+        url = self.client.get("/api/calendar/feed/", **auth(user)).json()["url"]
+        return url.split("testserver")[1]
+
+    def test_feeds_and_conditional_get(self):
+        path = self.feed_path(self.kine.user)
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn(f"UID:appointment-{self.appointment.id}@clinic", body)
+        self.assertIn("SUMMARY:Sesión con patient", body)
+        self.assertEqual(body.count("BEGIN:VEVENT"), 1)  # la cita en 400 días queda fuera de la ventana
+
+        with self.assertNumQueries(1):
+            cached = self.client.get(path, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(
+            self.client.get(path, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]).status_code, 304
+        )
+
+        self.appointment.status = "cancelled"
+        self.appointment.save()
+        changed = self.client.get(path, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(changed.status_code, 200)
+        self.assertIn("STATUS:CANCELLED", changed.content.decode())
+
+        patient_body = self.client.get(self.feed_path(self.patient.user)).content.decode()
+        self.assertIn("SUMMARY:Kinesiología con kine", patient_body)
+
+    def test_rotate_and_unknown_secret(self):
+        old = self.feed_path(self.kine.user)
+        self.client.post("/api/calendar/feed/", **auth(self.kine.user))
+        self.assertEqual(self.client.get(old).status_code, 404)
+        self.assertEqual(self.client.get(self.feed_path(self.kine.user)).status_code, 200)
+
+
+class BulkStatusTests(TestCase):
+    path = "/api/kinesiologist/appointments/bulk-status/"
+
+    def setUp(self):
+        self.kine = make_kinesiologist("kine")
+        other_kine = make_kinesiologist("other")
+        self.patients = [make_patient(f"p{n}") for n in range(3)]
+        day = FUTURE
+        self.pending, self.confirmed, self.completed, self.next_day, self.other = Appointment.objects.bulk_create([
+            Appointment(kinesiologist=self.kine, patient_name=self.patients[0], date=day,
+                        start_time=time(9), end_time=time(9, 45)),
+            Appointment(kinesiologist=self.kine, patient_name=self.patients[1], date=day,
+                        start_time=time(10), end_time=time(10, 45), status="confirmed"),
+            Appointment(kinesiologist=self.kine, patient_name=self.patients[2], date=day,
+                        start_time=time(8), end_time=time(8, 45), status="completed"),
+            Appointment(kinesiologist=self.kine, patient_name=self.patients[0], date=day + timedelta(days=1),
+                        start_time=time(9), end_time=time(9, 45)),
+            Appointment(kinesiologist=other_kine, patient_name=self.patients[0], date=day,
+                        start_time=time(9), end_time=time(9, 45)),
+        ])
+
+    def post(self, data, user=None):
+        return self.client.post(self.path, data=data, content_type="application/json",
+                                **auth(user or self.kine.user))
+
+    def test_cancel_my_day(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post({"action": "cancel", "date": str(FUTURE)})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["updated"], [self.pending.id, self.confirmed.id])
+        statuses = dict(Appointment.objects.values_list("id", "status"))
+        self.assertEqual(statuses[self.pending.id], "cancelled")
+        self.assertEqual(statuses[self.confirmed.id], "cancelled")
+        self.assertEqual(statuses[self.completed.id], "completed")
+        self.assertEqual(statuses[self.next_day.id], "pending")
+        self.assertEqual(statuses[self.other.id], "pending")
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ["p0@example.com", "p1@example.com"])
+
+    def test_confirm_range(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post({"action": "confirm", "from": str(FUTURE), "until": str(FUTURE + timedelta(days=1))})
+        self.assertEqual(response.json()["updated"], [self.pending.id, self.next_day.id])
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_validation(self):
+        self.assertEqual(self.post({"action": "cancel", "date": str(FUTURE)}, user=self.patients[0].user).status_code, 403)
+        self.assertEqual(self.post({"action": "borrar", "date": str(FUTURE)}).status_code, 400)
+        self.assertEqual(self.post({"action": "cancel"}).status_code, 400)
+        self.assertEqual(
+            self.post({"action": "cancel", "from": str(FUTURE), "until": str(PAST)}).status_code, 400
+        )
+        self.assertFalse(Appointment.objects.filter(status="cancelled").exists())
+
+
+class StatusTransitionTests(TestCase):
+    def setUp(self):
+        self.kine = make_kinesiologist("kine")
+        self.patient = make_patient("patient")
+        self.appointment = Appointment.objects.bulk_create([Appointment(
+            kinesiologist=self.kine, patient_name=self.patient, date=FUTURE,
+            start_time=time(9), end_time=time(9, 45),
+        )])[0]
+
+    def patch(self, path, data):
+        return self.client.patch(path, data=data, content_type="application/json", **auth(self.kine.user))
+
+    def test_both_views_share_transitions(self):
+        status_path = f"/api/appointments/{self.appointment.id}/status/"
+        update_path = f"/api/api/appointments/{self.appointment.id}/status/"
+
+        response = self.patch(status_path, {"status": "confirmed", "version": 1})
+        self.assertEqual((response.status_code, response.json()["version"]), (200, 2))
+
+        stale = self.patch(update_path, {"status": "completed", "version": 1})
+        self.assertEqual(stale.status_code, 409)
+        self.assertEqual(stale.json()["current"], {"status": "confirmed", "version": 2})
+
+        response = self.patch(update_path, {"status": "rejected", "version": 2})
+        self.assertEqual(response.status_code, 200)
+        self.appointment.refresh_from_db()
+        self.assertEqual((self.appointment.status, self.appointment.version), ("cancelled", 3))
+
+        self.assertEqual(self.patch(status_path, {"status": "confirmed"}).status_code, 400)
+        self.assertEqual(self.patch(update_path, {"status": "borrada"}).status_code, 400)
+
+
+class ConcurrentTransitionTests(TransactionTestCase):
+    def test_parallel_updaters(self):
+        kine = make_kinesiologist("kine")
+        appointment = Appointment.objects.bulk_create([Appointment(
+            kinesiologist=kine, patient_name=make_patient("patient"), date=FUTURE,
+            start_time=time(9), end_time=time(9, 45),
+        )])[0]
+        targets = ["confirmed", "cancelled", "completed", "confirmed", "cancelled", "completed"]
+        barrier = threading.Barrier(len(targets))
+        results = []
+
+        def update(target):
+            try:
+                current = Appointment.objects.get(id=appointment.id)  # todos leen la versión 1
+                barrier.wait()
+                apply_transition(current, target)
+                results.append(target)
+            except StaleAppointment:
+                results.append("conflict")
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=update, args=(target,)) for target in targets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        winners = [r for r in results if r != "conflict"]
+        self.assertEqual(len(results), len(targets))
+        self.assertEqual(len(winners), 1)
+        appointment.refresh_from_db()
+        self.assertEqual((appointment.status, appointment.version), (winners[0], 2))
+
+    def test_parallel_stale_runs(self):
+        kine = make_kinesiologist("kine")
+        patient = make_patient("patient")
+        Appointment.objects.bulk_create([
+            Appointment(kinesiologist=kine, patient_name=patient, date=PAST - timedelta(days=n),
+                        start_time=time(9), end_time=time(9, 45), status="confirmed")
+            for n in range(30)
+        ])
+        counts = []
+
+        def run():
+            try:
+                done = 0
+                while True:
+                    # on_batch se llama tras el commit de cada lote: cuenta aunque un lote posterior falle.
+                    committed = [0]
+                    try:
+                        close_stale_appointments(PAST, {"confirmed": "completed"}, batch_size=3,
+                                                 on_batch=lambda source, total: committed.__setitem__(0, total))
+                        break
+                    except OperationalError:
+                        continue  # SQLite bloquea la tabla entera ante escritores concurrentes
+                    finally:
+                        done += committed[0]
+                counts.append(done)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sum(counts), 29)  # la cita del mismo PAST no es anterior al corte
+        self.assertEqual(Appointment.objects.filter(status="completed", version=2).count(), 29)
+
+    def test_parallel_reminder_workers(self):
+        kine = make_kinesiologist("kine")
+        Availability.objects.create(kinesiologist=kine, day=FUTURE.weekday(), start_time=time(8), end_time=time(20))
+        for hour in range(8, 20):
+            Appointment.objects.create(kinesiologist=kine, patient_name=make_patient(f"p{hour}"), date=FUTURE,
+                                       start_time=time(hour), end_time=time(hour, 45))
+        now = timezone.make_aware(datetime.combine(FUTURE, time(5)))  # vencen los 24h de todas, ningún 2h
+        sent = []
+
+        def work():
+            try:
+                while True:
+                    try:
+                        batch, _ = send_due_reminders(batch_size=2, now=now)
+                    except OperationalError:
+                        continue  # SQLite bloquea la tabla entera ante escritores concurrentes
+                    if not batch and not AppointmentReminder.objects.filter(
+                        sent_at__isnull=True, remind_at__lte=now
+                    ).exists():
+                        return
+                    sent.append(batch)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sum(sent), 12)
+        self.assertEqual(len(mail.outbox), 12)
+        self.assertEqual(len({m.to[0] for m in mail.outbox}), 12)
+
+
+class StaleAppointmentTests(TestCase):
+    def setUp(self):
+        kine = make_kinesiologist("kine")
+        patient = make_patient("patient")
+        today = timezone.localdate()
+
+        def make(day, status):
+            return Appointment(kinesiologist=kine, patient_name=patient, date=day,
+                               start_time=time(9), end_time=time(9, 45), status=status)
+
+        self.old_pending, self.old_confirmed, self.old_cancelled, self.yesterday, self.future = (
+            Appointment.objects.bulk_create([
+                make(today - timedelta(days=10), "pending"),
+                make(today - timedelta(days=9), "confirmed"),
+                make(today - timedelta(days=8), "cancelled"),
+                make(today - timedelta(days=1), "confirmed"),
+                make(today + timedelta(days=1), "pending"),
+            ])
+        )
+
+    def statuses(self):
+        return dict(Appointment.objects.values_list("id", "status"))
+
+    def test_command_uses_targets_and_logs_counts(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            log = Path(tmp) / "stale.jsonl"
+            with override_settings(STALE_APPOINTMENTS_LOG=str(log)):
+                call_command("close_stale_appointments", "--batch-size", "1", stdout=io.StringIO())
+                call_command("close_stale_appointments", stdout=io.StringIO())
+            runs = [json.loads(line) for line in log.read_text().splitlines()]
+
+        statuses = self.statuses()
+        self.assertEqual(statuses[self.old_pending.id], "no_show")
+        self.assertEqual(statuses[self.old_confirmed.id], "completed")
+        self.assertEqual(statuses[self.old_cancelled.id], "cancelled")
+        self.assertEqual(statuses[self.yesterday.id], "confirmed")  # dentro del día de gracia
+        self.assertEqual(statuses[self.future.id], "pending")
+        self.assertEqual([run["counts"] for run in runs],
+                         [{"confirmed": 1, "pending": 1}, {"confirmed": 0, "pending": 0}])
+
+    def test_override_target(self):
+        with override_settings(STALE_APPOINTMENTS_LOG=None):
+            call_command("close_stale_appointments", "--to", "completed", "--before", str(timezone.localdate()),
+                         stdout=io.StringIO())
+        statuses = self.statuses()
+        self.assertEqual(statuses[self.old_pending.id], "completed")
+        self.assertEqual(statuses[self.yesterday.id], "completed")
+        self.assertEqual(statuses[self.future.id], "pending")
+
+
+class ReminderTests(TestCase):
+    def setUp(self):
+        self.kine = make_kinesiologist("kine")
+        self.patient = make_patient("patient")
+        Availability.objects.bulk_create([
+            Availability(kinesiologist=self.kine, day=day, start_time=time(8), end_time=time(20)) for day in range(7)
+        ])
+        self.appointment = Appointment.objects.create(
+            kinesiologist=self.kine, patient_name=self.patient, date=FUTURE,
+            start_time=time(10), end_time=time(10, 45),
+        )
+        self.starts_at = timezone.make_aware(datetime.combine(FUTURE, time(10)))
+
+    def tiers(self):
+        return dict(self.appointment.reminders.values_list("tier", "remind_at"))
+
+    def test_tiers_are_sent_once(self):
+        self.assertEqual(self.tiers(), {"24h": self.starts_at - timedelta(hours=24),
+                                        "2h": self.starts_at - timedelta(hours=2)})
+
+        self.assertEqual(send_all_due(now=self.starts_at - timedelta(hours=25)), (0, 0))
+        self.assertEqual(send_all_due(now=self.starts_at - timedelta(hours=23)), (1, 0))
+        self.assertEqual(send_all_due(now=self.starts_at - timedelta(hours=23)), (0, 0))
+        self.assertEqual(send_all_due(now=self.starts_at - timedelta(hours=1)), (1, 0))
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertIn("mañana", mail.outbox[0].subject)
+        self.assertIn("en 2 horas", mail.outbox[1].subject)
+
+    def test_cancel_and_reschedule(self):
+        self.appointment.date = FUTURE + timedelta(days=1)
+        self.appointment.save()
+        self.assertEqual(self.tiers()["24h"], self.starts_at)
+
+        # Un cambio que no pasa por save() deja recordatorios desfasados: el worker los descarta.
+        Appointment.objects.filter(id=self.appointment.id).update(date=FUTURE + timedelta(days=2))
+        self.assertEqual(send_all_due(now=self.starts_at + timedelta(hours=1)), (0, 1))
+
+        apply_transition(self.appointment, "cancelled")
+        self.assertFalse(self.appointment.reminders.exists())
+        self.assertEqual(send_all_due(now=self.starts_at + timedelta(days=3)), (0, 0))
+        self.assertEqual(mail.outbox, [])
+
+    def test_booking_close_to_start_skips_past_tiers(self):
+        now = timezone.now()
+        soon = timezone.localtime(now + timedelta(hours=5))
+        if soon.date() != timezone.localdate(now) or not time(8) <= soon.time() <= time(19):
+            self.skipTest("El horario de prueba no cubre la hora actual + 5h.")
+        appointment = Appointment.objects.create(
+            kinesiologist=self.kine, patient_name=self.patient, date=soon.date(),
+            start_time=soon.time().replace(second=0, microsecond=0),
+            end_time=(soon + timedelta(minutes=45)).time().replace(second=0, microsecond=0),
+        )
+        self.assertEqual(list(appointment.reminders.values_list("tier", flat=True)), ["2h"])
+
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.kine = make_kinesiologist("kine")
+        self.patient = make_patient("patient")
+        Availability.objects.create(kinesiologist=self.kine, day=FUTURE.weekday(), start_time=time(8), end_time=time(12))
+        self.path = f"/api/kinesiologists/{self.kine.id}/appointments/"
+        self.body = {"date": FUTURE.isoformat(), "start_time": "09:00", "end_time": "09:45"}
+        self.headers = auth(self.patient.user)
+
+    def book(self, body=None, key="reserva-1"):
+        return self.client.post(self.path, data=body or self.body, content_type="application/json",
+                                HTTP_IDEMPOTENCY_KEY=key, **self.headers)
+
+    def test_replay_returns_stored_response(self):
+        first = self.book()
+        self.assertEqual(first.status_code, 201)
+
+        with self.assertNumQueries(1):  # solo la autenticación
+            replay = self.book()
+        self.assertEqual(replay.status_code, 201)
+        self.assertEqual(replay["Idempotent-Replayed"], "true")
+        self.assertEqual(replay.json(), first.json())
+        self.assertEqual(Appointment.objects.count(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+        other = self.book(body={**self.body, "start_time": "10:00", "end_time": "10:45"})
+        self.assertEqual(other.status_code, 422)
+        self.assertEqual(self.book(body={**self.body, "start_time": "10:00", "end_time": "10:45"},
+                                   key="reserva-2").status_code, 201)
+
+    def test_duplicate_waits_for_request_in_flight(self):
+        appointment = Appointment.objects.bulk_create([Appointment(
+            kinesiologist=self.kine, patient_name=self.patient, date=FUTURE,
+            start_time=time(9), end_time=time(9, 45),
+        )])[0]
+        path = f"/api/appointments/{appointment.id}/status/"
+        body = {"status": "confirmed"}
+        request = SimpleNamespace(user=self.kine.user, method="PATCH", path=path, data=body)
+        key = idempotency._cache_key(request, "cambio-1")
+        fingerprint = idempotency._fingerprint(request)
+        cache.add(key, {"state": idempotency.IN_FLIGHT, "fingerprint": fingerprint}, 30)
+        finish = threading.Timer(0.2, cache.set, args=(key, {
+            "state": idempotency.DONE, "fingerprint": fingerprint, "status": 200,
+            "data": {"status": True, "message": "Cita Confirmada", "version": 2},
+        }))
+        finish.start()
+
+        response = self.client.patch(path, data=body, content_type="application/json",
+                                     HTTP_IDEMPOTENCY_KEY="cambio-1", **auth(self.kine.user))
+        finish.join()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Idempotent-Replayed"], "true")
+        appointment.refresh_from_db()
+        self.assertEqual((appointment.status, appointment.version), ("pending", 1))
+
+        with override_settings(IDEMPOTENCY_WAIT_SECONDS=0.1):
+            cache.set(key, {"state": idempotency.IN_FLIGHT, "fingerprint": fingerprint}, 30)
+            response = self.client.patch(path, data=body, content_type="application/json",
+                                         HTTP_IDEMPOTENCY_KEY="cambio-1", **auth(self.kine.user))
+        self.assertEqual(response.status_code, 409)
+
+
+class SlotHoldTests(TestCase):
+    def setUp(self):
+        self.kine = make_kinesiologist("kine")
+        self.patient = make_patient("patient")
+        self.other = make_patient("other")
+        Availability.objects.create(kinesiologist=self.kine, day=FUTURE.weekday(), start_time=time(9), end_time=time(11))
+        self.slot = {"date": FUTURE.isoformat(), "start_time": "09:00", "end_time": "09:45"}
+
+    def hold(self, patient, slot=None):
+        return self.client.post(f"/api/kinesiologists/{self.kine.id}/holds/", data=slot or self.slot,
+                                content_type="application/json", **auth(patient.user))
+
+    def book(self, patient):
+        return self.client.post(f"/api/kinesiologists/{self.kine.id}/appointments/", data=self.slot,
+                                content_type="application/json", **auth(patient.user))
+
+    def slot_starts(self, patient=None):
+        headers = auth(patient.user) if patient else {}
+        response = self.client.get(f"/api/kinesiologists/{self.kine.id}/slots/?date={FUTURE}", **headers)
+        return [slot["start_time"] for slot in response.json()]
+
+    def test_hold_hides_slot_from_others_until_booked(self):
+        response = self.hold(self.patient)
+        self.assertEqual(response.status_code, 201)
+        self.assertIn("expires_at", response.json()["hold"])
+
+        self.assertEqual(self.slot_starts(), ["09:45:00"])
+        self.assertEqual(self.slot_starts(self.other), ["09:45:00"])
+        self.assertEqual(self.slot_starts(self.patient), ["09:00:00", "09:45:00"])
+
+        self.assertEqual(self.hold(self.other).status_code, 409)
+        self.assertEqual(self.book(self.other).status_code, 409)
+        self.assertEqual(self.book(self.patient).status_code, 201)
+        self.assertFalse(SlotHold.objects.exists())
+
+    def test_new_hold_replaces_previous_one(self):
+        self.hold(self.patient)
+        self.hold(self.patient, {**self.slot, "start_time": "09:45", "end_time": "10:30"})
+        self.assertEqual(list(SlotHold.objects.values_list("start_time", flat=True)), [time(9, 45)])
+        self.assertEqual(self.hold(self.other).status_code, 201)
+
+    def test_cannot_hold_taken_or_unavailable_slot(self):
+        Appointment.objects.create(kinesiologist=self.kine, patient_name=self.other,
+                                   date=FUTURE, start_time=time(9), end_time=time(9, 45))
+        self.assertEqual(self.hold(self.patient).status_code, 409)
+        self.assertEqual(self.hold(self.patient, {**self.slot, "start_time": "12:00", "end_time": "12:45"}).status_code, 409)
+
+    def test_expired_holds_are_ignored_and_swept(self):
+        self.hold(self.patient)
+        SlotHold.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(self.slot_starts(self.other), ["09:00:00", "09:45:00"])
+        self.assertEqual(self.book(self.other).status_code, 201)
+
+        out = io.StringIO()
+        call_command("sweep_slot_holds", stdout=out)
+        self.assertIn("1 retenciones", out.getvalue())
+        self.assertFalse(SlotHold.objects.exists())
+
+
+class WaitlistTests(TestCase):
+    def setUp(self):
+        self.kine = make_kinesiologist("kine")
+        self.booked = make_patient("booked")
+        self.first, self.second = make_patient("first"), make_patient("second")
+        Availability.objects.create(kinesiologist=self.kine, day=FUTURE.weekday(), start_time=time(9), end_time=time(18))
+        self.appointment = Appointment.objects.create(kinesiologist=self.kine, patient_name=self.booked,
+                                                      date=FUTURE, start_time=time(10), end_time=time(10, 45))
+
+    def join(self, patient, **overrides):
+        body = {"kinesiologist": self.kine.id, "date_from": str(FUTURE - timedelta(days=7)),
+                "date_until": str(FUTURE + timedelta(days=7)), "window_start": "09:00", "window_end": "12:00",
+                **overrides}
+        return self.client.post("/api/waitlist/", data=body, content_type="application/json", **auth(patient.user))
+
+    def test_cancellation_offers_slot_to_first_in_line(self):
+        self.join(self.first, window_start="14:00", window_end="18:00")  # no calza
+        self.assertEqual(self.join(self.first, date_until=str(FUTURE - timedelta(days=1))).status_code, 201)
+        self.assertEqual(self.join(self.second).status_code, 201)
+        self.assertEqual(self.join(self.first).status_code, 201)
+        mail.outbox.clear()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f"/api/appointments/{self.appointment.id}/status/",
+                                         data={"status": "cancelled"}, content_type="application/json",
+                                         **auth(self.kine.user))
+        self.assertEqual(response.status_code, 200)
+
+        hold = SlotHold.objects.get()
+        self.assertEqual((hold.patient, hold.date, hold.start_time), (self.second, FUTURE, time(10)))
+        self.assertTrue(WaitlistEntry.objects.get(patient=self.second).offered_at)
+        self.assertEqual(WaitlistEntry.objects.filter(offered_at__isnull=True).count(), 3)
+        self.assertIn("second@example.com", [m.to[0] for m in mail.outbox])
+
+        # El horario ya no se ofrece a otros y el paciente en espera lo puede reservar.
+        slots = self.client.get(f"/api/kinesiologists/{self.kine.id}/slots/?date={FUTURE}").json()
+        starts = [slot["start_time"] for slot in slots]
+        self.assertEqual(starts[:2], ["09:00:00", "11:15:00"])
+        booked = self.client.post(f"/api/kinesiologists/{self.kine.id}/appointments/", content_type="application/json",
+                                  data={"date": str(FUTURE), "start_time": "10:00", "end_time": "10:45"},
+                                  **auth(self.second.user))
+        self.assertEqual(booked.status_code, 201)
+
+    def test_bulk_cancel_offers_each_slot_once_per_patient(self):
+        Appointment.objects.create(kinesiologist=self.kine, patient_name=self.booked,
+                                   date=FUTURE, start_time=time(11), end_time=time(11, 45))
+        self.join(self.first)
+        self.join(self.first)
+        self.join(self.second)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/api/kinesiologist/appointments/bulk-status/", data={"action": "cancel", "date": str(FUTURE)},
+                             content_type="application/json", **auth(self.kine.user))
+
+        self.assertEqual(
+            sorted(SlotHold.objects.values_list("patient__name", "start_time")),
+            [("first", time(10)), ("second", time(11))],
+        )
+
+    def test_offer_skips_patient_holding_another_slot(self):
+        other = make_kinesiologist("other")
+        Availability.objects.create(kinesiologist=other, day=FUTURE.weekday(), start_time=time(14), end_time=time(18))
+        self.join(self.second)
+        self.join(self.first)
+        held = self.client.post(f"/api/kinesiologists/{other.id}/holds/", content_type="application/json",
+                                data={"date": str(FUTURE), "start_time": "15:00", "end_time": "15:45"},
+                                **auth(self.second.user))
+        self.assertEqual(held.status_code, 201)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f"/api/appointments/{self.appointment.id}/status/", data={"status": "cancelled"},
+                              content_type="application/json", **auth(self.kine.user))
+
+        # La retención del segundo con el otro kinesiólogo sigue en pie y el horario pasa al siguiente.
+        self.assertEqual(
+            sorted(SlotHold.objects.values_list("patient__name", "kinesiologist__name", "start_time")),
+            [("first", "kine", time(10)), ("second", "other", time(15))],
+        )
+        self.assertIsNone(WaitlistEntry.objects.get(patient=self.second).offered_at)
+
+        with self.assertRaises(SlotUnavailable):
+            place_hold(self.kine, self.second, FUTURE, time(11), time(11, 45), replace=False)
+        self.assertEqual(SlotHold.objects.filter(patient=self.second).count(), 1)
+
+    def test_match_reads_one_indexed_query(self):
+        WaitlistEntry.objects.bulk_create([
+            WaitlistEntry(patient=self.first, kinesiologist=self.kine, date_from=PAST, date_until=PAST + timedelta(days=n),
+                          window_start=time(9), window_end=time(12))
+            for n in range(200)
+        ])
+        self.assertEqual(offer_freed_slots([(self.kine.id, FUTURE, time(10), time(10, 45))]), [])
+
+        with connection.cursor() as cursor:
+            sql, params = WaitlistEntry.objects.filter(
+                kinesiologist=self.kine, offered_at__isnull=True, date_until__gte=FUTURE
+            ).query.sql_with_params()
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            self.assertIn("waitlist_match", " ".join(str(row) for row in cursor.fetchall()))
+
+    def test_validation_and_leave(self):
+        self.assertEqual(self.join(self.first, window_start="12:00", window_end="09:00").status_code, 400)
+        self.assertEqual(self.join(self.first, date_from=str(PAST), date_until=str(PAST)).status_code, 400)
+        entry_id = self.join(self.first).json()["entry"]["id"]
+        self.assertEqual(len(self.client.get("/api/waitlist/", **auth(self.first.user)).json()), 1)
+        self.assertEqual(self.client.delete(f"/api/waitlist/{entry_id}/", **auth(self.second.user)).status_code, 404)
+        self.assertEqual(self.client.delete(f"/api/waitlist/{entry_id}/", **auth(self.first.user)).status_code, 204)
+
+
+class ScheduleExceptionTests(TestCase):
+    def setUp(self):
+        self.kine = make_kinesiologist("kine")
+        self.patient = make_patient("patient")
+        Availability.objects.create(kinesiologist=self.kine, day=FUTURE.weekday(), start_time=time(9), end_time=time(11))
+        self.next_week = FUTURE + timedelta(days=7)
+
+    def slot_starts(self, day):
+        response = self.client.get(f"/api/kinesiologists/{self.kine.id}/slots/?date={day}")
+        return [slot["start_time"] for slot in response.json()]
+
+    def book(self, day, start, end):
+        return self.client.post(f"/api/kinesiologists/{self.kine.id}/appointments/", content_type="application/json",
+                                data={"date": str(day), "start_time": start, "end_time": end},
+                                **auth(self.patient.user))
+
+    def test_holiday_closes_every_kinesiologist(self):
+        ScheduleException.objects.create(date_from=FUTURE, date_until=FUTURE, reason="Feriado")
+
+        self.assertEqual(self.slot_starts(FUTURE), [])
+        self.assertEqual(self.slot_starts(self.next_week), ["09:00:00", "09:45:00"])
+        self.assertEqual(self.book(FUTURE, "09:00", "09:45").status_code, 400)
+
+    def test_partial_block_and_extra_hours(self):
+        ScheduleException.objects.bulk_create([
+            ScheduleException(kinesiologist=self.kine, date_from=FUTURE, date_until=FUTURE,
+                              start_time=time(9), end_time=time(9, 30)),
+            ScheduleException(kinesiologist=self.kine, kind=ScheduleException.EXTRA, date_from=FUTURE,
+                              date_until=FUTURE + timedelta(days=1), start_time=time(10, 30), end_time=time(12)),
+        ])
+
+        self.assertEqual(self.slot_starts(FUTURE), ["09:30:00", "10:15:00", "11:00:00"])
+        self.assertEqual(self.slot_starts(FUTURE + timedelta(days=1)), ["10:30:00", "11:15:00"])
+        self.assertEqual(self.book(FUTURE, "09:00", "09:45").status_code, 400)
+        self.assertEqual(self.book(FUTURE, "11:00", "11:45").status_code, 201)
+
+    def test_range_endpoint_and_vacation(self):
+        response = self.client.post(
+            f"/api/kinesiologists/{self.kine.id}/exceptions/", content_type="application/json",
+            data={"date_from": str(self.next_week), "date_until": str(self.next_week + timedelta(days=6)),
+                  "reason": "Vacaciones"},
+            **auth(self.kine.user),
+        )
+        self.assertEqual(response.status_code, 201)
+
+        with self.assertNumQueries(3):
+            slots = self.client.get(
+                f"/api/kinesiologists/{self.kine.id}/slots/?from={FUTURE}&until={FUTURE + timedelta(days=20)}"
+            ).json()
+        self.assertEqual(sorted({slot["date"] for slot in slots}), [str(FUTURE), str(FUTURE + timedelta(days=14))])
+
+        exception_id = response.json()["exception"]["id"]
+        path = f"/api/kinesiologists/{self.kine.id}/exceptions/{exception_id}/"
+        self.assertEqual(self.client.delete(path, **auth(self.patient.user)).status_code, 403)
+        self.assertEqual(self.client.delete(path, **auth(self.kine.user)).status_code, 204)
+        self.assertEqual(self.slot_starts(self.next_week), ["09:00:00", "09:45:00"])
+
+    def test_validation(self):
+        path = f"/api/kinesiologists/{self.kine.id}/exceptions/"
+        for body in (
+            {"date_from": str(FUTURE), "date_until": str(PAST)},
+            {"date_from": str(FUTURE), "date_until": str(FUTURE), "start_time": "10:00"},
+            {"kind": "extra", "date_from": str(FUTURE), "date_until": str(FUTURE)},
+        ):
+            response = self.client.post(path, data=body, content_type="application/json", **auth(self.kine.user))
+            self.assertEqual(response.status_code, 400, body)
+        self.assertEqual(self.client.post(path, data={"date_from": str(FUTURE), "date_until": str(FUTURE)},
+                                          content_type="application/json", **auth(self.patient.user)).status_code, 403)
+        self.assertEqual(
+            self.client.get(f"/api/kinesiologists/{self.kine.id}/slots/?from={FUTURE}&until={PAST}").status_code, 400
+        )
+
+
+class SlotTemplateTests(TestCase):
+    def setUp(self):
+        self.kine = make_kinesiologist("kine")
+        self.kine.session_minutes, self.kine.buffer_minutes = 60, 15
+        self.kine.save()
+        Availability.objects.create(kinesiologist=self.kine, day=FUTURE.weekday(), start_time=time(9), end_time=time(12))
+        self.path = f"/api/kinesiologists/{self.kine.id}/slots/?date={FUTURE}"
+
+    def slot_times(self):
+        return [(slot["start_time"], slot["end_time"]) for slot in self.client.get(self.path).json()]
+
+    def test_session_length_and_buffer(self):
+        self.assertEqual(self.slot_times(), [("09:00:00", "10:00:00"), ("10:15:00", "11:15:00")])
+
+        # Una cita de 30 minutos anterior al cambio de duración (bulk_create no valida).
+        Appointment.objects.bulk_create([Appointment(kinesiologist=self.kine, patient_name=make_patient("patient"),
+                                                     date=FUTURE, start_time=time(9, 30), end_time=time(10))])
+        self.assertEqual(self.slot_times(), [("10:15:00", "11:15:00")])
+
+    def test_booking_respects_length_and_buffer(self):
+        patient = make_patient("patient")
+
+        def book(start, end):
+            return self.client.post(f"/api/kinesiologists/{self.kine.id}/appointments/", content_type="application/json",
+                                    data={"date": str(FUTURE), "start_time": start, "end_time": end},
+                                    **auth(patient.user))
+
+        self.assertEqual(book("09:00", "10:00").status_code, 201)
+        inside_buffer = book("10:05", "11:05")
+        self.assertEqual(inside_buffer.status_code, 400)
+        self.assertEqual(inside_buffer.json()["message"], "Este horario ya está ocupado.")
+        self.assertEqual(book("10:15", "10:45").json()["message"], "La sesión debe durar 60 minutos.")
+        self.assertEqual(book("10:15", "11:15").status_code, 201)
+
+    def test_template_is_cached_until_schedule_changes(self):
+        self.slot_times()
+        with self.assertNumQueries(2):  # excepciones + citas/retenciones
+            self.slot_times()
+
+        Availability.objects.create(kinesiologist=self.kine, day=FUTURE.weekday(), start_time=time(14), end_time=time(15))
+        self.assertEqual(self.slot_times()[-1], ("14:00:00", "15:00:00"))
+
+        response = self.client.put("/api/kinesiologist/profile/", data={"session_minutes": 30, "buffer_minutes": 0},
+                                   content_type="application/json", **auth(self.kine.user))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.slot_times()), 8)
+
+        response = self.client.put("/api/kinesiologist/profile/", data={"session_minutes": 2},
+                                   content_type="application/json", **auth(self.kine.user))
+        self.assertEqual(response.status_code, 400)
+
+
+class BoxTests(TestCase):
+    def setUp(self):
+        self.first, self.second, self.elsewhere = (make_kinesiologist(key) for key in ("first", "second", "elsewhere"))
+        Box.objects.bulk_create([Box(name=name) for name in ("3", "4", "5")])
+        for kine, box in ((self.first, "3"), (self.second, "3"), (self.elsewhere, "4")):
+            kine.box_id = box
+            kine.save()
+            Availability.objects.create(kinesiologist=kine, day=FUTURE.weekday(), start_time=time(9), end_time=time(11))
+        self.patient = make_patient("patient")
+
+    def book(self, kine, start="09:00", end="09:45"):
+        return self.client.post(f"/api/kinesiologists/{kine.id}/appointments/", content_type="application/json",
+                                data={"date": str(FUTURE), "start_time": start, "end_time": end},
+                                **auth(self.patient.user))
+
+    def slot_starts(self, kine):
+        response = self.client.get(f"/api/kinesiologists/{kine.id}/slots/?date={FUTURE}")
+        return [slot["start_time"] for slot in response.json()]
+
+    def test_shared_box_blocks_other_kinesiologist(self):
+        self.assertEqual(self.book(self.first).status_code, 201)
+        self.assertEqual(Appointment.objects.get().box_id, "3")
+
+        self.assertEqual(self.slot_starts(self.second), ["09:45:00"])
+        self.assertEqual(self.slot_starts(self.elsewhere), ["09:00:00", "09:45:00"])
+
+        response = self.book(self.second)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("box 3", response.json()["message"])
+        self.assertEqual(self.book(self.elsewhere).status_code, 201)
+
+    def test_cancelled_and_held_slots(self):
+        appointment = Appointment.objects.create(kinesiologist=self.first, patient_name=self.patient,
+                                                 date=FUTURE, start_time=time(9), end_time=time(9, 45))
+        Appointment.objects.filter(id=appointment.id).update(status="cancelled")
+        self.assertEqual(self.slot_starts(self.second), ["09:00:00", "09:45:00"])
+
+        other = make_patient("other")
+        held = self.client.post(f"/api/kinesiologists/{self.first.id}/holds/", content_type="application/json",
+                                data={"date": str(FUTURE), "start_time": "09:45", "end_time": "10:30"},
+                                **auth(other.user))
+        self.assertEqual(held.status_code, 201)
+        self.assertEqual(self.slot_starts(self.second), ["09:00:00"])
+        self.assertEqual(self.book(self.second, "09:45", "10:30").status_code, 409)
+
+    def test_hold_blocked_by_shared_box(self):
+        self.assertEqual(self.book(self.first).status_code, 201)
+        other = make_patient("other")
+        response = self.client.post(f"/api/kinesiologists/{self.second.id}/holds/", content_type="application/json",
+                                    data={"date": str(FUTURE), "start_time": "09:00", "end_time": "09:45"},
+                                    **auth(other.user))
+        self.assertEqual(response.status_code, 409)
+        self.assertIn("box 3", response.json()["message"])
+        self.assertFalse(SlotHold.objects.exists())
+
+    def test_box_moves_keep_history(self):
+        self.book(self.first)
+        self.first.box_id = "5"
+        self.first.save()
+        self.assertEqual(Appointment.objects.get().box_id, "3")
+        self.assertEqual(self.slot_starts(self.second), ["09:45:00"])
+        self.assertEqual(list(Box.objects.order_by("name").values_list("name", flat=True)), ["1", "3", "4", "5"])
+
+    def test_unknown_box_is_rejected(self):
+        response = self.client.put("/api/kinesiologist/profile/", data={"box": "33", "phone_number": "900000000"},
+                                   content_type="application/json", **auth(self.first.user))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("box", response.json())
+        self.first.refresh_from_db()
+        self.assertEqual((self.first.box_id, self.first.phone_number), ("3", "912345678"))
+        self.assertFalse(Box.objects.filter(name="33").exists())
+
+        response = self.client.put("/api/kinesiologist/profile/", data={"box": "4"},
+                                   content_type="application/json", **auth(self.first.user))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["box"], "4")
+
+    def test_reminders_and_feed_use_booked_box(self):
+        self.book(self.first)
+        self.first.box_id = "5"
+        self.first.save()
+
+        starts_at = timezone.make_aware(datetime.combine(FUTURE, time(9)))
+        send_all_due(now=starts_at - timedelta(hours=1))
+        self.assertIn("Box: 3", mail.outbox[-1].body)
+
+        cache.clear()
+        url = self.client.get("/api/calendar/feed/", **auth(self.first.user)).json()["url"]
+        with self.settings(ICAL_FUTURE_DAYS=365 * 100):
+            body = self.client.get(url.split("testserver")[1]).content.decode()
+        self.assertIn("LOCATION:Box 3", body)
+
+
+class GroupSessionTests(TestCase):
+    def setUp(self):
+        self.kine = make_kinesiologist("kine")
+        Availability.objects.create(kinesiologist=self.kine, day=FUTURE.weekday(), start_time=time(9), end_time=time(11))
+        self.pilates = SessionType.objects.create(kinesiologist=self.kine, name="Pilates", capacity=3)
+        self.patients = [make_patient(f"p{n}") for n in range(4)]
+
+    def book(self, patient, start="09:00", end="09:45", session_type=None):
+        data = {"date": str(FUTURE), "start_time": start, "end_time": end}
+        if session_type is not None:
+            data["session_type"] = session_type.id
+        return self.client.post(f"/api/kinesiologists/{self.kine.id}/appointments/", content_type="application/json",
+                                data=data, **auth(patient.user))
+
+    def slots(self, session_type=None):
+        query = f"?date={FUTURE}" + (f"&session_type={session_type.id}" if session_type else "")
+        response = self.client.get(f"/api/kinesiologists/{self.kine.id}/slots/{query}")
+        return [(slot["start_time"], slot["remaining"]) for slot in response.json()]
+
+    def seat(self):
+        return GroupSlot.objects.get(session_type=self.pilates, date=FUTURE, start_time=time(9))
+
+    def test_capacity_and_remaining_seats(self):
+        self.assertEqual(self.slots(self.pilates), [("09:00:00", 3), ("09:45:00", 3)])
+        for patient in self.patients[:2]:
+            self.assertEqual(self.book(patient, session_type=self.pilates).status_code, 201)
+
+        self.assertEqual(self.slots(self.pilates), [("09:00:00", 1), ("09:45:00", 3)])
+        self.assertEqual(self.slots(), [("09:45:00", 1)])
+        self.assertEqual(self.book(self.patients[2], session_type=self.pilates).status_code, 201)
+        self.assertEqual(self.slots(self.pilates), [("09:45:00", 3)])
+
+        full = self.book(self.patients[3], session_type=self.pilates)
+        self.assertEqual(full.status_code, 409)
+        self.assertEqual((self.seat().booked, Appointment.objects.count()), (3, 3))
+
+    def test_individual_booking_cannot_overlap_group(self):
+        self.book(self.patients[0], session_type=self.pilates)
+        self.assertEqual(self.book(self.patients[1]).status_code, 400)
+        self.assertEqual(self.book(self.patients[2], "09:45", "10:30", self.pilates).status_code, 201)
+        self.assertEqual(self.slots(self.pilates), [("09:00:00", 2), ("09:45:00", 2)])
+
+        other = SessionType.objects.create(kinesiologist=self.kine, name="Espalda", capacity=4)
+        self.assertEqual(self.slots(other), [])
+        self.assertEqual(self.book(self.patients[3], session_type=other).status_code, 409)
+
+    def test_cancel_releases_seat(self):
+        for patient in self.patients[:3]:
+            self.book(patient, session_type=self.pilates)
+        first, second, third = Appointment.objects.order_by("id")
+
+        response = self.client.patch(f"/api/appointments/{first.id}/status/", data={"status": "cancelled"},
+                                     content_type="application/json", **auth(self.kine.user))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.seat().booked, 2)
+        self.assertEqual(self.book(self.patients[3], session_type=self.pilates).status_code, 201)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/api/kinesiologist/appointments/bulk-status/", content_type="application/json",
+                                        data={"action": "cancel", "date": str(FUTURE)}, **auth(self.kine.user))
+        self.assertEqual(len(response.json()["updated"]), 3)
+        self.assertEqual(self.seat().booked, 0)
+        self.assertEqual(self.slots(), [("09:00:00", 1), ("09:45:00", 1)])
+
+        archive_appointments(FUTURE + timedelta(days=1))
+        self.assertEqual((self.seat().booked, Appointment.objects.count()), (0, 0))
+
+    def test_cancelled_individual_type_offers_waitlist(self):
+        evaluation = SessionType.objects.create(kinesiologist=self.kine, name="Evaluación")
+        first, second = (
+            Appointment.objects.create(kinesiologist=self.kine, patient_name=self.patients[n], date=FUTURE,
+                                       start_time=start, end_time=end, session_type=evaluation)
+            for n, (start, end) in enumerate(((time(9), time(9, 45)), (time(9, 45), time(10, 30))))
+        )
+        for patient in self.patients[2:]:
+            WaitlistEntry.objects.create(patient=patient, kinesiologist=self.kine, date_from=FUTURE, date_until=FUTURE,
+                                         window_start=time(9), window_end=time(11))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f"/api/appointments/{first.id}/status/", data={"status": "cancelled"},
+                              content_type="application/json", **auth(self.kine.user))
+        self.assertEqual(list(SlotHold.objects.values_list("start_time", flat=True)), [time(9)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/api/kinesiologist/appointments/bulk-status/", content_type="application/json",
+                             data={"action": "cancel", "date": str(FUTURE)}, **auth(self.kine.user))
+        self.assertEqual(sorted(SlotHold.objects.values_list("start_time", flat=True)), [time(9), time(9, 45)])
+        self.assertFalse(GroupSlot.objects.exists())
+
+    def test_session_types_endpoint(self):
+        path = f"/api/kinesiologists/{self.kine.id}/session-types/"
+        denied = self.client.post(path, {"name": "Yoga", "capacity": 5}, content_type="application/json",
+                                  **auth(self.patients[0].user))
+        self.assertEqual(denied.status_code, 403)
+
+        response = self.client.post(path, {"name": "Yoga", "capacity": 5}, content_type="application/json",
+                                    **auth(self.kine.user))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.client.post(path, {"name": "Grande", "capacity": 99}, content_type="application/json",
+                                          **auth(self.kine.user)).status_code, 400)
+
+        listed = self.client.get(path, **auth(self.patients[0].user)).json()
+        self.assertEqual([(row["name"], row["capacity"]) for row in listed], [("Pilates", 3), ("Yoga", 5)])
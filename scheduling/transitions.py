@@ -0,0 +1,98 @@
+"""
+Máquina de estados de las citas.
+
+TRANSITIONS[origen] es el conjunto de estados a los que puede pasar una cita
+desde `origen`. Todos los cambios de estado (vistas de estado, comentario de
+sesión, transiciones masivas) validan contra esta tabla.
+
+apply_transition() usa concurrencia optimista: cada cita tiene un `version`
+y el cambio es un UPDATE ... WHERE id = x AND version = n que no bloquea
+filas. Si otra petición cambió la cita antes, no se actualiza nada y se lanza
+StaleAppointment (las vistas responden 409).
+
+Una cancelación ofrece el horario liberado a la lista de espera después del
+commit (ver scheduling/waitlist.py) o, en una sesión grupal, devuelve el cupo.
+"""
+from django.db.models import F
+
+from .models import Appointment, AppointmentReminder, CalendarFeed, GroupSlot
+from .waitlist import offer_on_commit
+
+TRANSITIONS = {
+    "pending": {"confirmed", "cancelled", "completed", "no_show"},
+    "confirmed": {"completed", "cancelled", "pending", "no_show"},
+    "cancelled": set(),
+    "completed": set(),
+    "no_show": set(),
+}
+
+# Nombres antiguos que aceptan las vistas (no son estados guardados).
+STATUS_ALIASES = {
+    "rejected": "cancelled",
+}
+
+# Acciones masivas: acción -> estado destino.
+BULK_ACTIONS = {
+    "confirm": "confirmed",
+    "cancel": "cancelled",
+}
+
+
+class InvalidTransition(Exception):
+    def __init__(self, current, new):
+        self.current = current
+        self.new = new
+        allowed = ", ".join(sorted(TRANSITIONS.get(current, ()))) or "ninguno"
+        super().__init__(f"Una cita en estado {current} no puede pasar a {new}. Permitidos: {allowed}.")
+
+
+class StaleAppointment(Exception):
+    def __init__(self, appointment_id, expected_version):
+        self.appointment_id = appointment_id
+        self.expected_version = expected_version
+        super().__init__("La cita fue modificada por otra persona. Recarga e intenta de nuevo.")
+
+
+def normalize_status(value):
+    return STATUS_ALIASES.get(value, value)
+
+
+def can_transition(current, new):
+    return new in TRANSITIONS.get(current, set())
+
+
+def sources_for(new):
+    """Estados desde los que se puede llegar a `new`."""
+    return sorted(current for current, targets in TRANSITIONS.items() if new in targets)
+
+
+def apply_transition(appointment, new_status, expected_version=None):
+    """
+    Cambia el estado de `appointment` si la transición es válida y nadie la
+    modificó desde `expected_version` (por defecto, la versión leída).
+    Actualiza la instancia con el nuevo estado y versión.
+    """
+    version = appointment.version if expected_version is None else int(expected_version)
+    if version != appointment.version:
+        raise StaleAppointment(appointment.id, version)
+    if not can_transition(appointment.status, new_status):
+        raise InvalidTransition(appointment.status, new_status)
+
+    updated = (
+        Appointment.objects
+        .filter(id=appointment.id, version=version, status=appointment.status)
+        .update(status=new_status, version=F("version") + 1)
+    )
+    if not updated:
+        raise StaleAppointment(appointment.id, version)
+
+    appointment.status = new_status
+    appointment.version = version + 1
+    if new_status not in Appointment.OPEN_STATUSES:
+        AppointmentReminder.drop([appointment.id])
+    if new_status == "cancelled" and appointment.session_type_id and appointment.session_type.is_group:
+        GroupSlot.release(appointment.kinesiologist_id, {(appointment.date, appointment.start_time): 1})
+    elif new_status == "cancelled":
+        offer_on_commit([(appointment.kinesiologist_id, appointment.date, appointment.start_time, appointment.end_time)])
+    CalendarFeed.touch([appointment.kinesiologist_id], [appointment.patient_name_id])
+    return appointment
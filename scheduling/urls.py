@@ -8,6 +8,16 @@ from .views import (
     KinesiologistUpcomingAppointmentsView,
     AppointmentStatusView,
     AppointmentCommentView,
+    AppointmentExportView,
+    CalendarFeedSecretView,
+    CalendarFeedView,
+    KinesiologistBulkStatusView,
+    ScheduleExceptionDetailView,
+    ScheduleExceptionListCreateView,
+    SessionTypeListCreateView,
+    SlotHoldView,
+    WaitlistEntryView,
+    WaitlistView,
 )
 
 app_name = "scheduling"
@@ -28,6 +38,32 @@ urlpatterns = [
     ),
 
    
+    path(
+        'kinesiologists/<int:kinesiologist_id>/exceptions/',
+        ScheduleExceptionListCreateView.as_view(),
+        name='kinesiologist-exceptions',
+    ),
+    path(
+        'kinesiologists/<int:kinesiologist_id>/exceptions/<int:exception_id>/',
+        ScheduleExceptionDetailView.as_view(),
+        name='kinesiologist-exception-detail',
+    ),
+
+    path(
+        'kinesiologists/<int:kinesiologist_id>/session-types/',
+        SessionTypeListCreateView.as_view(),
+        name='kinesiologist-session-types',
+    ),
+
+    path(
+        'kinesiologists/<int:kinesiologist_id>/holds/',
+        SlotHoldView.as_view(),
+        name='kinesiologist-holds',
+    ),
+
+    path("waitlist/", WaitlistView.as_view(), name="waitlist"),
+    path("waitlist/<int:entry_id>/", WaitlistEntryView.as_view(), name="waitlist-entry"),
+
     path(
         'kinesiologists/<int:kinesiologist_id>/slots/',
         KinesiologistAvailableSlotsView.as_view(),
@@ -48,6 +84,12 @@ urlpatterns = [
         name="kinesiologist-upcoming",
     ),
 
+    path(
+        "kinesiologist/appointments/bulk-status/",
+        KinesiologistBulkStatusView.as_view(),
+        name="kinesiologist-bulk-status",
+    ),
+
    
     path(
         "appointments/<int:appointment_id>/status/",
@@ -62,6 +104,24 @@ urlpatterns = [
         name="appointment-comment",
     ),
 
+    path(
+        "appointments/export/",
+        AppointmentExportView.as_view(),
+        name="appointment-export",
+    ),
+
+    path(
+        "calendar/feed/",
+        CalendarFeedSecretView.as_view(),
+        name="calendar-feed-secret",
+    ),
+
+    path(
+        "calendar/<str:secret>.ics",
+        CalendarFeedView.as_view(),
+        name="calendar-feed",
+    ),
+
     path(
     "api/kinesiologists/<int:kinesiologist_id>/appointments/",
     AppointmentCreateView.as_view(),
@@ -1,41 +1,114 @@
 from django.core.exceptions import ValidationError
 from django.db import IntegrityError, transaction
-from django.db.models import Q
+from django.db.models import F, Q, prefetch_related_objects
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from django.core.mail import send_mail
 from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
 
 
 
 from rest_framework import status
-from rest_framework.authentication import TokenAuthentication
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAdminUser, IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.decorators import api_view, permission_classes
 
-from datetime import datetime, timedelta
+from collections import Counter
+from datetime import datetime
 from datetime import date
 
+from clinic_backend.sparse_fields import field_paths, prune_queryset, requested_fields
+from clinic_backend.idempotency import idempotent
+from clinic_backend.query_budget import query_budget
+from clinic_backend.tracing import TracedTokenAuthentication, span
 from users.models import Patient
-from doctors.models import Kinesiologist
-from .models import Appointment, Availability
+from doctors.models import Kinesiologist, invalidate_slot_template
+from .archive import appointment_history, kinesiologist_prefetch
+from .export import VALID_STATUSES, csv_chunks, export_queryset
+from .holds import SlotUnavailable, conflicting_hold, place_hold
+from .ical import cached_feed, feed_owner, feed_version
+from .notifications import RECIPIENT_FIELDS, send_batch_on_commit, status_messages
+from .schedule import busy_intervals, free_slots, from_minutes, group_seats, schedule_between, with_seats
+from .waitlist import offer_on_commit
+from .transitions import (
+    BULK_ACTIONS,
+    STATUS_ALIASES,
+    InvalidTransition,
+    StaleAppointment,
+    apply_transition,
+    normalize_status,
+    sources_for,
+)
+from .models import (
+    Appointment,
+    AppointmentReminder,
+    Availability,
+    CalendarFeed,
+    GroupSlot,
+    ScheduleException,
+    SessionNote,
+    SessionType,
+    SlotHold,
+    WaitlistEntry,
+)
+from .pagination import AppointmentHistoryPagination
 from .serializers import (
     AppointmentSerializer,
     AvailabilitySerializer,
     KinesiologistSummarySerializer,
+    NormalizedAppointmentSerializer,
+    PatientAppointmentHistorySerializer,
+    ScheduleExceptionSerializer,
+    SessionTypeSerializer,
+    SlotHoldSerializer,
     TimeSlotSerializer,
+    UpcomingAppointmentSerializer,
+    WaitlistEntrySerializer,
+    serialize_normalized_appointments,
 )
+from .renderers import APPOINTMENT_LIST_RENDERERS, wants_normalized
+
+SLOT_RANGE_MAX_DAYS = 31
+
 
-SLOT_MINUTES = 45
+def transition_error(appointment, new_status, expected_version=None):
+    """
+    Aplica la transición (ver scheduling/transitions.py). Devuelve None si se
+    aplicó o la Response de error: 400 si no es válida, 409 si la cita cambió.
+    """
+    try:
+        apply_transition(appointment, new_status, expected_version)
+    except (TypeError, ValueError):
+        return Response(
+            {"status": False, "message": "La versión debe ser un número entero."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    except InvalidTransition as exc:
+        return Response({"status": False, "message": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    except StaleAppointment as exc:
+        current = Appointment.objects.filter(id=appointment.id).values("status", "version").first()
+        return Response(
+            {"status": False, "message": str(exc), "current": current},
+            status=status.HTTP_409_CONFLICT
+        )
+    return None
 
 
+@query_budget(GET=6, POST=11)
 class AvailabilityListCreateView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [TracedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    renderer_classes = APPOINTMENT_LIST_RENDERERS
 
     def get(self, request, kinesiologist_id: int):
+        """
+        ?format=normalized devuelve las citas con IDs y mapas deduplicados.
+        ?fields= recorta las filas de citas (y las columnas que se consultan).
+        """
         kinesiologist = get_object_or_404(
             Kinesiologist.objects.select_related("user"),
             pk=kinesiologist_id
@@ -47,18 +120,54 @@ class AvailabilityListCreateView(APIView):
             .order_by("day", "start_time")
         )
 
-        appointments_qs = (
+        if wants_normalized(request):
+            # ?format=normalized: citas con IDs y bloques relacionados deduplicados
+            fields = requested_fields(request, NormalizedAppointmentSerializer)
+            appointments = list(prune_queryset(
+                Appointment.objects
+                .filter(kinesiologist=kinesiologist)
+                .order_by("date", "start_time"),
+                NormalizedAppointmentSerializer,
+                fields,
+            ))
+            if fields is None or "kine_comment" in fields:
+                SessionNote.objects.attach_latest(appointments)
+            normalized = serialize_normalized_appointments(
+                appointments, kinesiologists=[kinesiologist], fields=fields
+            )
+            if fields is None or "kinesiologist" in fields:
+                normalized["kinesiologists"].setdefault(
+                    str(kinesiologist.id),
+                    KinesiologistSummarySerializer(kinesiologist).data,
+                )
+            return Response(
+                {
+                    "kinesiologist": kinesiologist.id,
+                    "availability": AvailabilitySerializer(availability_qs, many=True).data,
+                    **normalized,
+                },
+                status=status.HTTP_200_OK,
+            )
+
+        fields = requested_fields(request, AppointmentSerializer)
+        appointments = list(prune_queryset(
             Appointment.objects
             .filter(kinesiologist=kinesiologist)
             .select_related("patient_name__user", "kinesiologist__user")
-            .order_by("date", "start_time")
-        )
+            .order_by("date", "start_time"),
+            AppointmentSerializer,
+            fields,
+        ))
+        if fields is None or "kine_comment" in fields:
+            SessionNote.objects.attach_latest(appointments)
 
         return Response(
             {
                 "kinesiologist": KinesiologistSummarySerializer(kinesiologist).data,
                 "availability": AvailabilitySerializer(availability_qs, many=True).data,
-                "appointments": AppointmentSerializer(appointments_qs, many=True).data,
+                "appointments": AppointmentSerializer(
+                    appointments, many=True, fields=fields
+                ).data,
             },
             status=status.HTTP_200_OK,
         )
@@ -88,6 +197,7 @@ class AvailabilityListCreateView(APIView):
                 with transaction.atomic():
                    
                     Availability.objects.filter(kinesiologist=kinesiologist).delete()
+                    invalidate_slot_template(kinesiologist.id)
 
                     for day_key, blocks in bulk.items():
                         if day_key not in day_map:
@@ -170,8 +280,111 @@ class AvailabilityListCreateView(APIView):
             status=status.HTTP_201_CREATED,
         )
 
+@query_budget(GET=2, POST=3)
+class ScheduleExceptionListCreateView(APIView):
+    """
+    GET /api/kinesiologists/<kinesiologist_id>/exceptions/ — bloqueos y horas
+    extra vigentes del kinesiólogo, más los feriados de la clínica.
+    POST {kind, date_from, date_until, start_time?, end_time?, reason?} los
+    registra (el kinesiólogo o un superusuario). Los feriados de la clínica
+    se cargan desde el admin.
+    """
+
+    authentication_classes = [TracedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, kinesiologist_id: int):
+        exceptions = (
+            ScheduleException.objects
+            .filter(Q(kinesiologist_id=kinesiologist_id) | Q(kinesiologist__isnull=True))
+            .filter(date_until__gte=timezone.localdate())
+            .order_by("date_from", "start_time")
+        )
+        return Response(ScheduleExceptionSerializer(exceptions, many=True).data, status=status.HTTP_200_OK)
+
+    def post(self, request, kinesiologist_id: int):
+        kinesiologist = get_object_or_404(Kinesiologist, pk=kinesiologist_id)
+        if not (request.user.is_superuser or request.user.id == kinesiologist.user_id):
+            return Response(
+                {"status": False, "message": "No tiene permisos para modificar este horario."},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+
+        serializer = ScheduleExceptionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        exception = serializer.save(kinesiologist=kinesiologist)
+        return Response(
+            {
+                "status": True,
+                "message": "Excepción registrada correctamente.",
+                "exception": ScheduleExceptionSerializer(exception).data,
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+
+@query_budget(DELETE=4)
+class ScheduleExceptionDetailView(APIView):
+    """DELETE /api/kinesiologists/<kinesiologist_id>/exceptions/<exception_id>/"""
+
+    authentication_classes = [TracedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def delete(self, request, kinesiologist_id: int, exception_id: int):
+        exception = get_object_or_404(
+            ScheduleException.objects.select_related("kinesiologist"),
+            pk=exception_id,
+            kinesiologist_id=kinesiologist_id,
+        )
+        if not (request.user.is_superuser or request.user.id == exception.kinesiologist.user_id):
+            return Response(
+                {"status": False, "message": "No tiene permisos para modificar este horario."},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+        exception.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+@query_budget(GET=2, POST=3)
+class SessionTypeListCreateView(APIView):
+    """
+    GET /api/kinesiologists/<kinesiologist_id>/session-types/ — tipos de
+    sesión del kinesiólogo; capacity > 1 es una sesión grupal.
+    POST {name, capacity} registra uno (el kinesiólogo o un superusuario).
+    """
+
+    authentication_classes = [TracedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, kinesiologist_id: int):
+        session_types = SessionType.objects.filter(kinesiologist_id=kinesiologist_id).order_by("name")
+        return Response(SessionTypeSerializer(session_types, many=True).data, status=status.HTTP_200_OK)
+
+    def post(self, request, kinesiologist_id: int):
+        kinesiologist = get_object_or_404(Kinesiologist, pk=kinesiologist_id)
+        if not (request.user.is_superuser or request.user.id == kinesiologist.user_id):
+            return Response(
+                {"status": False, "message": "No tiene permisos para modificar este horario."},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+
+        serializer = SessionTypeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        session_type = serializer.save(kinesiologist=kinesiologist)
+        return Response(
+            {
+                "status": True,
+                "message": "Tipo de sesión registrado correctamente.",
+                "session_type": SessionTypeSerializer(session_type).data,
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+
+@query_budget(POST=15)
+@idempotent("POST")
 class AppointmentCreateView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [TracedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def post(self, request, kinesiologist_id: int):
@@ -190,16 +403,48 @@ class AppointmentCreateView(APIView):
 
         serializer = AppointmentSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
+        day = serializer.validated_data["date"]
+        start = serializer.validated_data["start_time"]
+        end = serializer.validated_data["end_time"]
+        session_type = serializer.validated_data.get("session_type")
+        if session_type is not None and session_type.kinesiologist_id != kinesiologist.id:
+            return Response(
+                {"status": False, "message": "El tipo de sesión no corresponde a este kinesiólogo."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if conflicting_hold(kinesiologist.id, day, start, end, patient.id, kinesiologist.box_id):
+            return Response(
+                {"status": False, "message": "Otro paciente está reservando este horario. Intenta con otro."},
+                status=status.HTTP_409_CONFLICT,
+            )
 
         try:
             with transaction.atomic():
+                # Sesión grupal: el cupo se toma con un UPDATE atómico del contador.
+                if session_type is not None and session_type.is_group and not GroupSlot.claim(
+                    session_type, day, start, end
+                ):
+                    return Response(
+                        {"status": False, "message": "No quedan cupos en esta sesión."},
+                        status=status.HTTP_409_CONFLICT,
+                    )
                 appointment = Appointment.objects.create(
                     kinesiologist=kinesiologist,
                     patient_name=patient,
-                    date=serializer.validated_data["date"],
-                    start_time=serializer.validated_data["start_time"],
-                    end_time=serializer.validated_data["end_time"],
+                    date=day,
+                    start_time=start,
+                    end_time=end,
+                    session_type=session_type,
                 )
+                # La retención del paciente se convierte en la cita.
+                SlotHold.objects.filter(patient=patient).delete()
+        except ValidationError as exc:
+            msg = getattr(exc, "messages", [str(exc)])[0]
+            return Response(
+                {"status": False, "message": msg},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
         except IntegrityError:
             return Response(
                 {"status": False, "message": "No se pudo crear la cita."},
@@ -221,92 +466,221 @@ class AppointmentCreateView(APIView):
             fail_silently=False,
         )
 
+        with span("appointment.serialize"):
+            data = AppointmentSerializer(appointment).data
+
         return Response(
             {
                 "status": True,
                 "message": "Hora médica reservada correctamente.",
-                "appointment": AppointmentSerializer(appointment).data,
+                "appointment": data,
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+
+
+
+@query_budget(POST=12, DELETE=3)
+class SlotHoldView(APIView):
+    """
+    POST /api/kinesiologists/<kinesiologist_id>/holds/ {date, start_time, end_time}
+    retiene el horario por SLOT_HOLD_SECONDS mientras el paciente completa la
+    reserva (reemplaza su retención anterior). DELETE lo libera antes.
+    """
+
+    authentication_classes = [TracedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, kinesiologist_id: int):
+        kinesiologist = get_object_or_404(Kinesiologist, pk=kinesiologist_id)
+        patient = Patient.objects.filter(user=request.user).first()
+        if patient is None:
+            return Response(
+                {"status": False, "message": "El usuario no es un paciente válido."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        serializer = SlotHoldSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            hold = place_hold(
+                kinesiologist,
+                patient,
+                serializer.validated_data["date"],
+                serializer.validated_data["start_time"],
+                serializer.validated_data["end_time"],
+            )
+        except SlotUnavailable as exc:
+            return Response({"status": False, "message": str(exc)}, status=status.HTTP_409_CONFLICT)
+
+        return Response(
+            {"status": True, "message": "Horario retenido.", "hold": SlotHoldSerializer(hold).data},
+            status=status.HTTP_201_CREATED,
+        )
+
+    def delete(self, request, kinesiologist_id: int):
+        SlotHold.objects.filter(kinesiologist_id=kinesiologist_id, patient__user=request.user).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+@query_budget(GET=3, POST=4)
+class WaitlistView(APIView):
+    """
+    GET /api/waitlist/ — entradas activas del paciente.
+    POST /api/waitlist/ {kinesiologist, date_from, date_until, window_start, window_end}
+    lo inscribe; si se cancela una hora que calza, recibe una retención y un
+    correo (ver scheduling/waitlist.py).
+    """
+
+    authentication_classes = [TracedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        entries = WaitlistEntry.objects.filter(
+            patient__user=request.user, offered_at__isnull=True, date_until__gte=timezone.localdate()
+        ).order_by("date_from", "id")
+        return Response(WaitlistEntrySerializer(entries, many=True).data, status=status.HTTP_200_OK)
+
+    def post(self, request):
+        patient = Patient.objects.filter(user=request.user).first()
+        if patient is None:
+            return Response(
+                {"status": False, "message": "El usuario no es un paciente válido."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        serializer = WaitlistEntrySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        entry = serializer.save(patient=patient)
+        return Response(
+            {
+                "status": True,
+                "message": "Quedaste en la lista de espera.",
+                "entry": WaitlistEntrySerializer(entry).data,
             },
             status=status.HTTP_201_CREATED,
         )
 
 
+@query_budget(DELETE=3)
+class WaitlistEntryView(APIView):
+    """DELETE /api/waitlist/<entry_id>/ — sale de la lista de espera."""
+
+    authentication_classes = [TracedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def delete(self, request, entry_id: int):
+        deleted, _ = WaitlistEntry.objects.filter(id=entry_id, patient__user=request.user).delete()
+        if not deleted:
+            return Response(
+                {"status": False, "message": "Entrada no encontrada."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+@query_budget(GET=6)
 class KinesiologistAvailableSlotsView(APIView):
     """
     Devuelve los horarios disponibles de un kinesiólogo para una fecha dada.
     GET /api/kinesiologists/<kinesiologist_id>/slots/?date=YYYY-MM-DD
+    GET /api/kinesiologists/<kinesiologist_id>/slots/?from=YYYY-MM-DD&until=YYYY-MM-DD
+
+    Los slots salen de la plantilla precalculada del kinesiólogo (duración de
+    sesión y pausa) y del horario efectivo de cada día (bloqueos, feriados y
+    horas extra, ver scheduling/schedule.py); el rango (hasta
+    SLOT_RANGE_MAX_DAYS) usa las mismas consultas que un solo día.
+
+    Los horarios retenidos por otros pacientes no se ofrecen. El token es
+    opcional: con él, las retenciones propias siguen apareciendo como libres.
+
+    ?session_type=<id> de una sesión grupal ofrece también los horarios con
+    cupos en sesiones ya abiertas; `remaining` indica los cupos libres (1 en
+    las sesiones individuales).
     """
     permission_classes = [AllowAny]
-    authentication_classes = []
+    authentication_classes = [TracedTokenAuthentication]
 
     def get(self, request, kinesiologist_id):
-        date_str = request.query_params.get("date")
-        if not date_str:
+        params = request.query_params
+        if not (params.get("date") or (params.get("from") and params.get("until"))):
             return Response(
-                {"detail": "Parámetro 'date' es obligatorio (YYYY-MM-DD)."},
+                {"detail": "Parámetro 'date' (o 'from' y 'until') es obligatorio (YYYY-MM-DD)."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
         try:
-            target_date = datetime.strptime(date_str, "%Y-%m-%d").date()
+            date_from = datetime.strptime(params.get("date") or params["from"], "%Y-%m-%d").date()
+            date_until = datetime.strptime(params.get("date") or params["until"], "%Y-%m-%d").date()
         except ValueError:
             return Response(
                 {"detail": "Formato de fecha inválido. Usa YYYY-MM-DD."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
+        if not 0 <= (date_until - date_from).days < SLOT_RANGE_MAX_DAYS:
+            return Response(
+                {"detail": f"El rango debe ir hacia adelante y tener como máximo {SLOT_RANGE_MAX_DAYS} días."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-        day_of_week = target_date.weekday()
+        session_type = None
+        if params.get("session_type"):
+            session_type = SessionType.objects.filter(
+                id=params["session_type"], kinesiologist_id=kinesiologist_id
+            ).first() if params["session_type"].isdigit() else None
+            if session_type is None:
+                return Response(
+                    {"detail": "Tipo de sesión inválido para este kinesiólogo."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
 
-        availability_qs = Availability.objects.filter(
-            kinesiologist_id=kinesiologist_id,
-            day=day_of_week,
-        )
+        fields = requested_fields(request, TimeSlotSerializer)
+        template, plan = schedule_between(kinesiologist_id, date_from, date_until)
 
-        if not availability_qs.exists():
+        if not any(candidates for _windows, candidates in plan.values()):
             return Response([], status=status.HTTP_200_OK)
 
-        existing_appointments = Appointment.objects.filter(
-            kinesiologist_id=kinesiologist_id,
-            date=target_date,
+        # Una sola consulta (citas + retenciones vigentes de otros, del
+        # kinesiólogo y de su box): los candidatos se filtran en memoria.
+        group = session_type if session_type is not None and session_type.is_group else None
+        busy = busy_intervals(
+            kinesiologist_id,
+            template["box"],
+            date_from,
+            date_until,
+            exclude_user=request.user if request.user.is_authenticated else None,
+            session_type_id=group.id if group else None,
         )
+        seats = group_seats(group, date_from, date_until) if group else {}
 
-        slot_length = timedelta(minutes=SLOT_MINUTES)
         slots = []
+        for target_date, (_windows, candidates) in plan.items():
+            free = free_slots(candidates, busy[target_date], template["buffer"])
+            if group:
+                offered = with_seats(free, seats.get(target_date, []), group.capacity, template["buffer"])
+            else:
+                offered = [(start, end, 1) for start, end in free]
+            for start, end, remaining in offered:
+                start_time = from_minutes(start)
+                slots.append(
+                    {
+                        "date": target_date,
+                        "start_time": start_time,
+                        "end_time": from_minutes(end),
+                        "datetime": datetime.combine(target_date, start_time),
+                        "remaining": remaining,
+                    }
+                )
 
-        for avail in availability_qs:
-            current_start = datetime.combine(target_date, avail.start_time)
-            avail_end_dt = datetime.combine(target_date, avail.end_time)
-
-            while current_start + slot_length <= avail_end_dt:
-                current_end = current_start + slot_length
-
-                overlap = existing_appointments.filter(
-                    start_time__lt=current_end.time(),
-                    end_time__gt=current_start.time(),
-                ).exists()
-
-              
-                if not overlap:
-                    slots.append(
-                        {
-                            "date": target_date,
-                            "start_time": current_start.time(),
-                            "end_time": current_end.time(),
-                            "datetime": current_start,
-                        }
-                    )
-
-                current_start += slot_length
-
-        serializer = TimeSlotSerializer(slots, many=True)
+        serializer = TimeSlotSerializer(slots, many=True, fields=fields)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
 
+@query_budget(GET=3)
 class KinesiologistUpcomingAppointmentsView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [TracedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
@@ -317,6 +691,7 @@ class KinesiologistUpcomingAppointmentsView(APIView):
                 status=status.HTTP_403_FORBIDDEN
             )
 
+        fields = requested_fields(request, UpcomingAppointmentSerializer)
         today = timezone.localdate()
         now_time = timezone.localtime().time()
 
@@ -325,39 +700,26 @@ class KinesiologistUpcomingAppointmentsView(APIView):
         ).filter(
             Q(date__gt=today) | Q(date=today, start_time__gte=now_time)
         ).select_related("patient_name__user").order_by("date", "start_time")
+        qs = prune_queryset(qs, UpcomingAppointmentSerializer, fields)
 
-        data = []
-        for a in qs:
-            patient_full_name = ""
-            if hasattr(a.patient_name, "user") and a.patient_name.user:
-                first = getattr(a.patient_name.user, "first_name", "") or ""
-                last = getattr(a.patient_name.user, "last_name", "") or ""
-                patient_full_name = (first + " " + last).strip()
-
-            data.append({
-                "appointment_id": a.id,
-                "patient_id": a.patient_name.id,
-                "patient_name": patient_full_name if patient_full_name else str(a.patient_name),
-                "date": a.date.strftime("%Y-%m-%d"),
-                "start_time": a.start_time.strftime("%H:%M"),
-                "end_time": a.end_time.strftime("%H:%M"),
-                "status": a.status,
-                "status_label": a.get_status_display(),
-            })
+        data = UpcomingAppointmentSerializer(qs, many=True, fields=fields).data
 
         return Response({"status": True, "appointments": data}, status=status.HTTP_200_OK)
 
 
 
+@query_budget(PATCH=5)
+@idempotent("PATCH")
 class AppointmentStatusView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [TracedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def patch(self, request, appointment_id):
         appointment = get_object_or_404(
             Appointment.objects.select_related(
                 "kinesiologist__user",
-                "patient_name__user"
+                "patient_name__user",
+                "session_type",
             ),
             id=appointment_id
         )
@@ -368,15 +730,16 @@ class AppointmentStatusView(APIView):
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        new_status = request.data.get("status")
+        new_status = normalize_status(request.data.get("status"))
         if new_status not in ["confirmed", "cancelled"]:
             return Response(
                 {"status": False, "message": "Estado inválido"},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        appointment.status = new_status
-        appointment.save(update_fields=["status"])
+        error = transition_error(appointment, new_status, request.data.get("version"))
+        if error:
+            return error
 
         patient_user = appointment.patient_name.user
         kine_user = appointment.kinesiologist.user
@@ -401,6 +764,7 @@ class AppointmentStatusView(APIView):
             {
                 "status": True,
                 "message": f"Cita {appointment.get_status_display()}",
+                "version": appointment.version,
             },
             status=status.HTTP_200_OK
         )
@@ -411,8 +775,9 @@ class AppointmentStatusView(APIView):
 
 
 
+@query_budget(PATCH=8)
 class AppointmentCommentView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [TracedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def patch(self, request, appointment_id):
@@ -431,41 +796,53 @@ class AppointmentCommentView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        appointment.kine_comment = str(comment).strip()
-        appointment.status = "completed"
-        appointment.comment_updated_at = timezone.now()
-        appointment.save(update_fields=["kine_comment", "status", "comment_updated_at"])
+        if appointment.status != "completed":
+            error = transition_error(appointment, "completed", request.data.get("version"))
+            if error:
+                return error
+
+        # Cada edición agrega una versión; las anteriores quedan como historial.
+        note = SessionNote.append(appointment, str(comment).strip(), author=request.user)
 
         return Response(
-            {"status": True, "message": "Sesión marcada como realizada y comentario guardado."},
+            {
+                "status": True,
+                "message": "Sesión marcada como realizada y comentario guardado.",
+                "version": appointment.version,
+                "note_version": note.version,
+            },
             status=status.HTTP_200_OK
         )
 
 
+@query_budget(GET=5)
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def patient_appointments_history(request):
-    qs = (
-        Appointment.objects
-        .filter(patient_name__user=request.user)
-        .select_related("kinesiologist__user")
-        .order_by("-date", "-start_time")
-    )
-
-    data = []
-    for a in qs:
-        data.append({
-            "id": a.id,
-            "date": a.date.strftime("%Y-%m-%d"),
-            "time": a.start_time.strftime("%H:%M"),
-            "treatment": "Sesión de kinesiología",
-            "kinesiologist": a.kinesiologist.user.get_full_name() or a.kinesiologist.user.username,
-            "status": a.status,
-            "status_label": a.get_status_display(),
-            "kine_comment": a.kine_comment or "",
-            "comment_updated_at": a.comment_updated_at,
-        })
-
+    """
+    Historial del paciente, incluidas las citas archivadas. Con ?page o
+    ?page_size la respuesta viene paginada (count, next, previous, results).
+    """
+    fields = requested_fields(request, PatientAppointmentHistorySerializer)
+    only = None
+    if fields is not None:
+        paths = field_paths(Appointment, PatientAppointmentHistorySerializer, fields)
+        if paths is not None:
+            only = {path.split("__")[0] for path in paths[0]}
+
+    qs = appointment_history(only=only, patient_name__user=request.user).order_by("-date", "-start_time")
+
+    paginator = AppointmentHistoryPagination()
+    appointments = paginator.paginate_queryset(qs, request) if paginator.requested(request) else list(qs)
+    if fields is None or "kinesiologist" in fields:
+        prefetch_related_objects(appointments, kinesiologist_prefetch())
+    if fields is None or {"kine_comment", "comment_updated_at"} & set(fields):
+        SessionNote.objects.attach_latest(appointments)
+
+    data = PatientAppointmentHistorySerializer(appointments, many=True, fields=fields).data
+
+    if paginator.requested(request):
+        return paginator.get_paginated_response(data)
     return Response(data, status=200)
 
 
@@ -489,12 +866,17 @@ def notify_kinesiologist(appointment):
     )
 
 
+@query_budget(PATCH=7)
+@idempotent("PATCH")
 class AppointmentStatusUpdateView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [TracedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def patch(self, request, appointment_id: int):
-        appointment = get_object_or_404(Appointment, pk=appointment_id)
+        appointment = get_object_or_404(
+            Appointment.objects.select_related("kinesiologist__user", "patient_name__user", "session_type"),
+            pk=appointment_id
+        )
 
  
         try:
@@ -511,17 +893,18 @@ class AppointmentStatusUpdateView(APIView):
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        new_status = request.data.get("status")
-        allowed = ["confirmed", "cancelled", "rejected", "completed", "pending"]
+        new_status = normalize_status(request.data.get("status"))
+        allowed = [value for value, _ in Appointment.STATUS_CHOICES]
 
         if new_status not in allowed:
             return Response(
-                {"status": False, "message": f"Estado inválido. Usa: {allowed}"},
+                {"status": False, "message": f"Estado inválido. Usa: {allowed + list(STATUS_ALIASES)}"},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        appointment.status = new_status
-        appointment.save()
+        error = transition_error(appointment, new_status, request.data.get("version"))
+        if error:
+            return error
 
        
         patient_email = appointment.patient_name.user.email
@@ -532,7 +915,7 @@ class AppointmentStatusUpdateView(APIView):
         if new_status == "confirmed":
             status_txt = "✅ CONFIRMADA"
             extra = "Tu hora médica fue confirmada."
-        elif new_status in ["cancelled", "rejected"]:
+        elif new_status == "cancelled":
             status_txt = "❌ RECHAZADA / CANCELADA"
             extra = "Tu hora médica fue rechazada/cancelada. Puedes agendar otra hora."
         elif new_status == "completed":
@@ -543,8 +926,9 @@ class AppointmentStatusUpdateView(APIView):
             extra = "Se actualizó el estado de tu hora."
 
         comment_line = ""
-        if getattr(appointment, "kine_comment", None):
-            comment_line = f"\n\n📝 Comentario del kinesiólogo:\n{appointment.kine_comment}"
+        note = appointment.notes.order_by("-version").values_list("text", flat=True).first()
+        if note:
+            comment_line = f"\n\n📝 Comentario del kinesiólogo:\n{note}"
 
         send_mail(
             subject=f"Estado de tu hora médica: {status_txt}",
@@ -564,6 +948,207 @@ class AppointmentStatusUpdateView(APIView):
         )
 
         return Response(
-            {"status": True, "message": "Estado actualizado y correo enviado al paciente."},
+            {
+                "status": True,
+                "message": "Estado actualizado y correo enviado al paciente.",
+                "version": appointment.version,
+            },
+            status=status.HTTP_200_OK
+        )
+
+
+@query_budget(GET=2)
+class AppointmentExportView(APIView):
+    """
+    GET /api/appointments/export/ — CSV de citas para reportes (solo staff).
+    Filtros: ?kinesiologist=<id>&from=AAAA-MM-DD&until=AAAA-MM-DD&status=completed,cancelled
+    y ?archived=0 para omitir las citas archivadas. La respuesta se envía en
+    streaming.
+    """
+
+    authentication_classes = [TracedTokenAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        params = request.query_params
+        try:
+            kinesiologist_id = int(params["kinesiologist"]) if params.get("kinesiologist") else None
+            date_from = date.fromisoformat(params["from"]) if params.get("from") else None
+            date_to = date.fromisoformat(params["until"]) if params.get("until") else None
+        except ValueError:
+            return Response(
+                {"status": False, "message": "Filtros inválidos: kinesiologist es un id y from/until fechas AAAA-MM-DD."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        statuses = [s for s in params.get("status", "").split(",") if s]
+        unknown = set(statuses) - VALID_STATUSES
+        if unknown:
+            return Response(
+                {"status": False, "message": f"Estados no válidos: {', '.join(sorted(unknown))}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        queryset = export_queryset(
+            kinesiologist_id=kinesiologist_id,
+            date_from=date_from,
+            date_to=date_to,
+            statuses=statuses,
+            include_archived=params.get("archived") != "0",
+        )
+        response = StreamingHttpResponse(csv_chunks(queryset), content_type="text/csv; charset=utf-8")
+        response["Content-Disposition"] = f'attachment; filename="citas-{timezone.localdate()}.csv"'
+        return response
+
+
+@query_budget(GET=3, POST=3)
+class CalendarFeedSecretView(APIView):
+    """
+    GET /api/calendar/feed/ — URL del feed iCalendar del usuario (la crea si
+    no existe). POST la reemplaza por una nueva e invalida la anterior.
+    Crear el feed cuesta una consulta más que leerlo (el INSERT).
+    """
+
+    authentication_classes = [TracedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return self._response(request, CalendarFeed.for_user(request.user))
+
+    def post(self, request):
+        return self._response(request, CalendarFeed.for_user(request.user, rotate=True))
+
+    def _response(self, request, feed):
+        return Response(
+            {"status": True, "url": request.build_absolute_uri(f"/api/calendar/{feed.secret}.ics")},
+            status=status.HTTP_200_OK
+        )
+
+
+@query_budget(GET=2)
+class CalendarFeedView(APIView):
+    """
+    GET /api/calendar/<secret>.ics — citas del kinesiólogo o paciente dueño
+    del secreto, con ETag/Last-Modified (ver scheduling/ical.py).
+    """
+
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request, secret):
+        feed = (
+            CalendarFeed.objects
+            .select_related("user__kinesiologist", "user__patient")
+            .filter(secret=secret)
+            .first()
+        )
+        owner = feed_owner(feed) if feed else None
+        if owner is None:
+            return Response(
+                {"status": False, "message": "Calendario no encontrado."},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        etag, last_modified = feed_version(feed, *owner)
+        headers = {
+            "ETag": quote_etag(etag),
+            "Last-Modified": http_date(last_modified.timestamp()),
+            "Cache-Control": "private, no-cache",
+        }
+        not_modified = get_conditional_response(
+            request, etag=quote_etag(etag), last_modified=int(last_modified.timestamp())
+        )
+        if not_modified is not None:
+            for name, value in headers.items():
+                not_modified[name] = value
+            return not_modified
+
+        response = HttpResponse(cached_feed(etag, *owner, last_modified), content_type="text/calendar; charset=utf-8")
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+
+@query_budget(POST=8)
+@idempotent("POST")
+class KinesiologistBulkStatusView(APIView):
+    """
+    POST /api/kinesiologist/appointments/bulk-status/ — cambia el estado de
+    todas las citas del kinesiólogo en una fecha o rango:
+
+        {"action": "confirm", "from": "2024-06-03", "until": "2024-06-07"}
+        {"action": "cancel", "date": "2024-06-03"}          # "cancelar mi día"
+
+    Solo se tocan las citas cuyo estado admite la transición (ver
+    scheduling/transitions.py), con un único UPDATE dentro de una transacción;
+    los correos a los pacientes se envían juntos después del commit.
+    """
+
+    authentication_classes = [TracedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        kine = Kinesiologist.objects.filter(user=request.user).first()
+        if kine is None:
+            return Response(
+                {"status": False, "message": "Solo el kinesiólogo puede modificar el estado."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        new_status = BULK_ACTIONS.get(request.data.get("action"))
+        if new_status is None:
+            return Response(
+                {"status": False, "message": f"Acción inválida. Usa: {sorted(BULK_ACTIONS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            date_from = date.fromisoformat(request.data.get("date") or request.data["from"])
+            date_to = date.fromisoformat(request.data.get("date") or request.data["until"])
+        except (KeyError, TypeError, ValueError):
+            return Response(
+                {"status": False, "message": "Indica \"date\" o \"from\" y \"until\" (AAAA-MM-DD)."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if date_from > date_to:
+            return Response(
+                {"status": False, "message": "La fecha de inicio debe ser anterior al término."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        with transaction.atomic():
+            rows = list(
+                Appointment.objects
+                .filter(
+                    kinesiologist=kine,
+                    date__range=(date_from, date_to),
+                    status__in=sources_for(new_status),
+                )
+                .select_for_update(of=("self",))
+                .order_by("date", "start_time")
+                .values_list(*RECIPIENT_FIELDS, "session_type__capacity", "patient_name_id")
+            )
+            ids = [row[0] for row in rows]
+            if ids:
+                Appointment.objects.filter(id__in=ids).update(status=new_status, version=F("version") + 1)
+                if new_status not in Appointment.OPEN_STATUSES:
+                    AppointmentReminder.drop(ids)
+                if new_status == "cancelled":
+                    # Solo las sesiones grupales (capacity > 1) tomaron cupo en GroupSlot.
+                    group = [(row[-2] or 1) > 1 for row in rows]
+                    GroupSlot.release(kine.id, Counter((row[1], row[2]) for row, is_group in zip(rows, group) if is_group))
+                    offer_on_commit(
+                        (kine.id, row[1], row[2], row[3]) for row, is_group in zip(rows, group) if not is_group
+                    )
+                kine_name = request.user.get_full_name() or kine.name
+                send_batch_on_commit(status_messages([row[:-2] for row in rows], new_status, kine_name))
+
+        CalendarFeed.touch([kine.id], [row[-1] for row in rows])
+        return Response(
+            {
+                "status": True,
+                "message": f"{len(ids)} citas quedaron {dict(Appointment.STATUS_CHOICES)[new_status].lower()}s.",
+                "updated": ids,
+            },
             status=status.HTTP_200_OK
         )
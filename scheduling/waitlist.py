@@ -0,0 +1,127 @@
+"""
+Lista de espera.
+
+Cuando una cita futura se cancela (vistas de estado vía apply_transition o la
+cancelación masiva), offer_freed_slots() busca para cada horario liberado la
+entrada activa más antigua que calza: mismo kinesiólogo, fecha dentro del
+rango y horario dentro de la franja. La búsqueda usa el índice parcial
+waitlist_match (solo entradas activas y vigentes del kinesiólogo) con una
+consulta por kinesiólogo, aunque la cancelación libere muchos horarios. El
+paciente recibe una retención por WAITLIST_HOLD_SECONDS y un correo; la
+entrada queda atendida. A un paciente que ya está reteniendo otro horario no
+se le ofrece nada (la oferta reemplazaría esa retención): su entrada sigue
+esperando.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from clinic_backend.tracing import span
+from .holds import SlotUnavailable, active_holds, place_hold
+from .models import WaitlistEntry
+from .notifications import send_batch
+
+
+def candidates(kinesiologist_id, intervals):
+    """
+    Entradas activas que pueden calzar con alguno de los `intervals` de un
+    kinesiólogo, por orden de inscripción, en una consulta (índice
+    waitlist_match). Con un solo horario es exactamente la condición de calce.
+    Se omiten los pacientes con una retención vigente.
+    """
+    return (
+        WaitlistEntry.objects
+        .filter(
+            kinesiologist_id=kinesiologist_id,
+            offered_at__isnull=True,
+            date_until__gte=min(day for day, _start, _end in intervals),
+            date_from__lte=max(day for day, _start, _end in intervals),
+            window_start__lte=max(start for _day, start, _end in intervals),
+            window_end__gte=min(end for _day, _start, end in intervals),
+        )
+        .exclude(Exists(active_holds().filter(patient_id=OuterRef("patient_id"))))
+        .select_related("patient__user", "kinesiologist")
+        .order_by("created_at", "id")
+    )
+
+
+def matches(entry, day, start, end):
+    return entry.date_from <= day <= entry.date_until and entry.window_start <= start and end <= entry.window_end
+
+
+def offer_message(entry, hold):
+    user = entry.patient.user
+    name = user.get_full_name() or user.email
+    return EmailMessage(
+        subject="📅 Se liberó una hora en tu lista de espera",
+        body=(
+            f"Hola {name},\n\n"
+            f"Se liberó una hora con {entry.kinesiologist.name} y la reservamos para ti.\n\n"
+            f"📅 Fecha: {hold.date}\n"
+            f"⏰ Hora: {str(hold.start_time)[:5]} - {str(hold.end_time)[:5]}\n\n"
+            f"Confírmala antes de {timezone.localtime(hold.expires_at):%d-%m-%Y %H:%M}; "
+            f"después quedará disponible para otros pacientes.\n\n"
+            f"Gracias por usar Centro de Salud y Bienestar."
+        ),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[user.email],
+    )
+
+
+def offer_freed_slots(intervals):
+    """
+    Ofrece cada horario liberado (kinesiologist_id, date, start_time, end_time)
+    al primer paciente en espera que calza; cada entrada recibe a lo más una
+    oferta. Devuelve las retenciones creadas.
+    """
+    today = timezone.localdate()
+    by_kinesiologist = defaultdict(list)
+    for kinesiologist_id, day, start, end in intervals:
+        if day >= today:
+            by_kinesiologist[kinesiologist_id].append((day, start, end))
+
+    holds, messages = [], []
+    with span("waitlist.match"):
+        for kinesiologist_id, freed in by_kinesiologist.items():
+            waiting = list(candidates(kinesiologist_id, freed))
+            for day, start, end in sorted(freed):
+                entry = next((e for e in waiting if matches(e, day, start, end)), None)
+                if entry is None:
+                    continue
+                hold = _offer(entry, day, start, end)
+                if hold is None:
+                    continue
+                # Una retención por paciente: no se le ofrece otro horario en esta pasada.
+                waiting = [e for e in waiting if e.patient_id != entry.patient_id]
+                holds.append(hold)
+                if entry.patient.user.email:
+                    messages.append(offer_message(entry, hold))
+    send_batch(messages)
+    return holds
+
+
+def _offer(entry, day, start, end):
+    """Retiene el horario para la entrada y la marca atendida; None si ya no se puede."""
+    with transaction.atomic():
+        # Otro proceso pudo atender la misma entrada.
+        if not WaitlistEntry.objects.filter(id=entry.id, offered_at__isnull=True).update(offered_at=timezone.now()):
+            return None
+        try:
+            return place_hold(
+                entry.kinesiologist, entry.patient, day, start, end, settings.WAITLIST_HOLD_SECONDS, replace=False
+            )
+        except SlotUnavailable:
+            # El horario se volvió a ocupar o el paciente empezó a retener otro: la entrada sigue esperando.
+            transaction.set_rollback(True)
+            return None
+
+
+def offer_on_commit(intervals):
+    """offer_freed_slots() después del commit de la cancelación."""
+    intervals = list(intervals)
+    if intervals:
+        transaction.on_commit(lambda: offer_freed_slots(intervals))
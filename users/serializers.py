@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from clinic_backend.sparse_fields import SparseFieldsetMixin
 from .models import Patient
 
 class PatientRegisterSerializer(serializers.ModelSerializer):
@@ -35,7 +36,7 @@ class PatientRegisterSerializer(serializers.ModelSerializer):
 
         return patient
     
-class PatientProfileSerializer(serializers.ModelSerializer):
+class PatientProfileSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     email = serializers.EmailField(source="user.email", read_only=True)
 
     class Meta:
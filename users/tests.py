@@ -1,3 +1,42 @@
+from django.contrib.auth.models import User
 from django.test import TestCase
 
-# Create your tests here.
+from clinic_backend.testing import QueryBudgetTestMixin, auth, make_patient
+
+
+class UsersQueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    def setUp(self):
+        self.patient = make_patient("patient")
+        self.size = 0
+
+    def grow(self, size):
+        for n in range(self.size, size):
+            make_patient(f"p{n}")
+        self.size = max(self.size, size)
+
+    def test_register(self):
+        def grow(size):
+            self.grow(size)
+            User.objects.filter(email="nuevo@example.com").delete()
+
+        self.assertQueryBudget(
+            "POST", "/api/register", grow,
+            data={"name": "Nuevo", "rut": "rut-nuevo", "email": "nuevo@example.com",
+                  "password": "clave-segura-123", "phone_number": "912345678"},
+            content_type="application/json",
+        )
+
+    def test_profile(self):
+        self.assertQueryBudget("GET", "/api/patient/profile/", self.grow, **auth(self.patient.user))
+        self.assertQueryBudget("GET", "/api/patient/profile/?fields=name,rut", self.grow, **auth(self.patient.user))
+        self.assertQueryBudget(
+            "PUT", "/api/patient/profile/", self.grow,
+            data={"phone_number": "987654321"}, content_type="application/json", **auth(self.patient.user),
+        )
+
+    def test_update_profile(self):
+        self.assertQueryBudget(
+            "PUT", "/api/api/patient/profile/", self.grow,
+            data={"name": "Paciente", "email": "patient@example.com"},
+            content_type="application/json", **auth(self.patient.user),
+        )
@@ -14,11 +14,14 @@ from .serializers import PatientProfileSerializer
 from rest_framework import status
 from rest_framework import serializers
 from .models import Patient
+from clinic_backend.sparse_fields import prune_queryset, requested_fields
+from clinic_backend.query_budget import query_budget
 
 
 
 from rest_framework.response import Response
 
+@query_budget(POST=10)
 class PatientRegisterView(APIView):
     permission_classes = [AllowAny]
     def post(self, request):
@@ -39,6 +42,7 @@ class PatientRegisterView(APIView):
             "errors":serializer.errors}, 
             status=status.HTTP_400_BAD_REQUEST)
     
+@query_budget(PUT=4)
 @api_view(["PUT"])
 @permission_classes([IsAuthenticated])
 def update_patient_profile(request):
@@ -59,15 +63,22 @@ def update_patient_profile(request):
     })
 
 
+@query_budget(GET=2, PUT=4)
 @api_view(["GET", "PUT"])
 @permission_classes([IsAuthenticated])
 def patient_profile(request):
-    patient = Patient.objects.get(user=request.user)
-
     if request.method == "GET":
-        serializer = PatientProfileSerializer(patient)
+        fields = requested_fields(request, PatientProfileSerializer)
+        patient = prune_queryset(
+            Patient.objects.filter(user=request.user).select_related("user"),
+            PatientProfileSerializer,
+            fields,
+        ).get()
+        serializer = PatientProfileSerializer(patient, fields=fields)
         return Response(serializer.data)
 
+    patient = Patient.objects.get(user=request.user)
+
     if request.method == "PUT":
         serializer = PatientProfileSerializer(
             patient,